@@ -1,4 +1,27 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def prepare_server():
+    """
+    Called by sectors_api/wsgi.py and asgi.py, so only processes that serve
+    requests pay for it; manage.py commands (migrate, run_report_jobs, ...)
+    load fonts and covers on first use. With gunicorn --preload this runs once
+    in the master and the workers share the result copy-on-write.
+    """
+    # Load the fonts, sector config and cover variants before serving requests
+    if getattr(settings, 'PDF_PREPARE_ASSETS_ON_STARTUP', True):
+        from api.cover import prepare_cover_variants
+        from api.fonts import preload_fonts
+        from api.sectors import sector_config
+        preload_fonts()
+        sector_config.current_version()
+        prepare_cover_variants()
+
+    # Warm the page and ticker caches in the background, then on a schedule
+    if getattr(settings, 'PDF_WARMUP_ON_STARTUP', True):
+        from api.warmup import warmup_scheduler
+        warmup_scheduler.start()
 
 
 class ApiConfig(AppConfig):
@@ -0,0 +1,239 @@
+"""
+Native async variants of the PDF and token endpoints for ASGI servers.
+
+Authentication, parameter parsing and report cache lookups run on the event
+loop. Only cache misses are rendered, on a bounded thread pool of
+``PDF_ASYNC_RENDER_THREADS`` threads, so a single uvicorn worker can hold many
+slow clients without tying up a thread for each. Under WSGI these views still
+work; each request just runs its own event loop. The pool is built from
+settings on first use, and ``PDF_RENDER_TIMEOUT_SECONDS`` is measured from
+when a render starts, as in render_backend.py.
+
+DRF's throttles and authentication classes do not apply to these plain
+Django views. They check credentials with the same token verifier as the
+synchronous endpoints and run the same shared throttles, keyed the same way,
+through throttling.check_throttles().
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .authentication import AuthenticationError, authenticated_client, token_verifier
+from .render_backend import RenderBackendBusy, RenderTimeout
+from .disk_cache import DiskReport
+from .report_cache import SpooledReport, lookup_report, report_key, render_uncached_report, stream_chunk_bytes
+from .throttling import check_throttles
+from .timing import collect_timings, finish_timings, stage
+from .views import issue_token, report_params, sendfile_response
+
+
+class RenderPool:
+    """Threads rendering cache misses, and the slots bounding renders accepted at once"""
+
+    def __init__(self, threads, max_queue):
+        self.threads = threads
+        # Renders accepted at once; further cache misses get 503 straight away
+        self.max_pending = threads + max_queue
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='async-render')
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Return the process-wide async render pool configured in settings.py"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool(
+                    threads=getattr(settings, 'PDF_ASYNC_RENDER_THREADS', 4),
+                    max_queue=getattr(settings, 'PDF_RENDER_MAX_QUEUE', 16),
+                )
+    return _pool
+
+
+def _reset_after_fork():
+    # Each forked worker builds its own pool on first use
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def render_report_async(title_text, email_text, sector, ticker, profile=None):
+    """Async counterpart of render_report(): (report, cache status)"""
+    with stage('cache'):
+        report = lookup_report(report_key(title_text, email_text, sector, ticker, profile))
+    if report is not None:
+        return report, 'HIT'
+
+    pool = get_render_pool()
+    # Never blocks: a full queue is reported as busy instead of waiting
+    if not pool.slots.acquire(blocking=False):
+        raise RenderBackendBusy('Render queue is full')
+
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+    # Run in this task's context, so stage timings reach the response
+    context = contextvars.copy_context()
+
+    def render():
+        try:
+            loop.call_soon_threadsafe(started.set)
+        except RuntimeError:
+            # The request's event loop has already closed
+            pass
+        return context.run(render_uncached_report, title_text, email_text, sector, ticker, profile=profile)
+
+    try:
+        future = pool.executor.submit(render)
+    except BaseException:
+        pool.slots.release()
+        raise
+    # The slot stays taken until the render really ends, even after a timeout
+    future.add_done_callback(lambda f: pool.slots.release())
+
+    timeout = getattr(settings, 'PDF_RENDER_TIMEOUT_SECONDS', 30)
+    try:
+        await asyncio.wait_for(started.wait(), timeout)
+    except asyncio.TimeoutError:
+        if future.cancel():
+            raise RenderBackendBusy(f'Render did not start within {timeout}s') from None
+        # It started just now
+    try:
+        report = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise RenderTimeout(f'Rendering took longer than {timeout}s') from None
+    return report, 'MISS'
+
+
+async def file_chunks(pdf_file, chunk_size):
+    """Read a spooled PDF in chunks off the event loop"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, pdf_file.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        pdf_file.close()
+
+
+def error_response(detail, status_code):
+    return JsonResponse({'detail': detail}, status=status_code)
+
+
+async def throttled_response(request, user=None):
+    """A 429 response like DRF's if `request` is over its rate, else None"""
+    # The throttle store's SQLite connections are per thread and block
+    throttled = await sync_to_async(check_throttles)(request, user)
+    if throttled is None:
+        return None
+    response = error_response(str(throttled.detail), 429)
+    if throttled.wait:
+        response['Retry-After'] = '%d' % throttled.wait
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def token_view(request):
+    """Async variant of SupertypeTokenView"""
+    response = await throttled_response(request)
+    if response is not None:
+        return response
+
+    if request.content_type == 'application/json':
+        try:
+            params = json.loads(request.body or b'{}')
+        except ValueError:
+            return error_response('Malformed JSON body', 400)
+        if not isinstance(params, dict):
+            params = {}
+    else:
+        params = request.POST
+
+    data, status_code = issue_token(params.get('email'), params.get('password'))
+    return JsonResponse(data, status=status_code)
+
+
+@require_GET
+async def sector_ticker_pdf_view(request):
+    """Async variant of SectorTickerPDFAPIView"""
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        response = await pdf_response(request)
+    return finish_timings(response, timings, started)
+
+
+async def pdf_response(request):
+    try:
+        with stage('auth'):
+            email = token_verifier.verify(request.headers.get('Authorization', ''))
+    except AuthenticationError as e:
+        return error_response(str(e), 401)
+
+    with stage('throttle'):
+        response = await throttled_response(request, authenticated_client(request, email))
+    if response is not None:
+        return response
+
+    try:
+        title_text, email_text, sector, ticker, profile = report_params(request.GET)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    try:
+        report, cache_status = await render_report_async(title_text, email_text, sector, ticker, profile)
+    except RenderBackendBusy:
+        response = error_response('Server is busy, please retry shortly', 503)
+        response['Retry-After'] = str(getattr(settings, 'PDF_RENDER_RETRY_AFTER_SECONDS', 5))
+        return response
+    except RenderTimeout as e:
+        return error_response(str(e), 504)
+    except Exception as e:
+        return error_response(f'PDF generation failed: {str(e)}', 500)
+
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    spooled = isinstance(report, SpooledReport)
+    on_disk = isinstance(report, DiskReport)
+    filename = f"{title_text}.pdf"
+    if report.etag in if_none_match or '*' in if_none_match:
+        if spooled:
+            report.open().close()
+        response = HttpResponseNotModified()
+    elif spooled or on_disk:
+        response = sendfile_response(report, filename)
+        if response is None:
+            # On disk: stream it without blocking the loop on reads
+            response = StreamingHttpResponse(
+                file_chunks(report.open(), stream_chunk_bytes()), content_type='application/pdf'
+            )
+            response['Content-Length'] = str(report.size)
+    else:
+        response = HttpResponse(report.data, content_type='application/pdf')
+    if response.status_code == 200 and 'Content-Disposition' not in response:
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['ETag'] = report.etag
+    response['Cache-Control'] = 'private, no-cache'
+    response['X-Cache'] = cache_status
+    return response
@@ -0,0 +1,177 @@
+"""
+Authentication for the PDF endpoints.
+
+Clients send either a JWT from ``/api/token/`` as ``Authorization: Bearer
+<token>`` or the shared ``PASSWORD`` directly (with or without ``Bearer``).
+TokenVerifier reads its configuration once and keeps a bounded cache of JWTs
+it has already verified, so repeat requests with the same token skip
+``jwt.decode`` until the token's ``exp``. Secrets are compared in constant time.
+
+SupertypeAuthentication plugs the verifier into DRF; the async views call
+``token_verifier.verify()`` and authenticated_client() directly.
+
+MetricsTokenPermission guards ``/api/metrics/`` with its own bearer token,
+``PDF_METRICS_TOKEN``, so scrapers do not need the API password.
+"""
+
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+from rest_framework.throttling import BaseThrottle
+
+# Bound on cached tokens, so a flood of distinct valid tokens cannot grow it forever
+MAX_VERIFIED_TOKENS = 1024
+
+
+class AuthenticationError(Exception):
+    """Raised by TokenVerifier with the detail to return to the client"""
+
+
+class AuthenticatedClient:
+    """The request.user of an authenticated PDF API client"""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, identity, email=None):
+        # Throttles key authenticated users by pk
+        self.pk = self.id = identity
+        self.email = email
+
+    def __str__(self):
+        return self.email or self.pk
+
+
+class TokenVerifier:
+    """Checks Authorization headers against the JWT secret and shared password"""
+
+    def __init__(self, jwt_secret, jwt_algorithm, password, max_tokens=MAX_VERIFIED_TOKENS):
+        self.jwt_secret = jwt_secret
+        self.jwt_algorithm = jwt_algorithm
+        self._password = password.encode('utf-8')
+        self.max_tokens = max_tokens
+        # token -> (email, exp), least recently used first
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def verify(self, auth_header):
+        """
+        Return the email of a valid JWT, or None for the shared password.
+        Raise AuthenticationError if the header does not authenticate.
+        """
+        if auth_header.startswith('Bearer '):
+            token = auth_header[len('Bearer '):]
+        else:
+            # No Bearer token, check for direct password
+            return self._check_password(auth_header)
+
+        with self._lock:
+            entry = self._verified.get(token)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._hits += 1
+                    self._verified.move_to_end(token)
+                    return entry[0]
+                del self._verified[token]
+            self._misses += 1
+
+        # A JWT always has three dot-separated parts; skip decoding anything else
+        if self.jwt_secret and token.count('.') == 2:
+            try:
+                payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
+            except jwt.ExpiredSignatureError:
+                raise AuthenticationError('Token has expired')
+            except jwt.InvalidTokenError:
+                # If JWT fails, try direct password comparison
+                return self._check_password(token)
+            self._remember(token, payload)
+            return payload.get('email')
+        return self._check_password(token)
+
+    def check_password(self, password):
+        """Constant-time comparison with the shared password"""
+        return hmac.compare_digest(password.encode('utf-8'), self._password)
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+
+    def stats(self):
+        return {
+            'cached_tokens': len(self._verified),
+            'hits': self._hits,
+            'misses': self._misses,
+        }
+
+    def _check_password(self, token):
+        if not self.check_password(token):
+            raise AuthenticationError('Invalid credentials')
+        return None
+
+    def _remember(self, token, payload):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            # Without an expiry there is no safe time to stop trusting it
+            return
+        with self._lock:
+            self._verified[token] = (payload.get('email'), exp)
+            self._verified.move_to_end(token)
+            while len(self._verified) > self.max_tokens:
+                self._verified.popitem(last=False)
+
+
+token_verifier = TokenVerifier(
+    jwt_secret=getattr(settings, 'JWT_SECRET', None) or os.environ.get('JWT_SECRET'),
+    jwt_algorithm=getattr(settings, 'JWT_ALGORITHM', 'HS256'),
+    password=os.environ.get('PASSWORD', 'default_password'),
+)
+
+
+def authenticated_client(request, email):
+    """The AuthenticatedClient for a request token_verifier.verify() returned `email` for"""
+    if email:
+        return AuthenticatedClient(f"jwt:{email}", email)
+    # Password clients share one identity, so throttle them per address
+    return AuthenticatedClient(f"password:{BaseThrottle().get_ident(request)}")
+
+
+class SupertypeAuthentication(BaseAuthentication):
+    """DRF authentication class for JWT or shared-password clients"""
+
+    def authenticate(self, request):
+        try:
+            email = token_verifier.verify(request.headers.get('Authorization', ''))
+        except AuthenticationError as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        return authenticated_client(request, email), None
+
+    def authenticate_header(self, request):
+        # Makes DRF answer failed authentication with 401 rather than 403
+        return 'Bearer'
+
+
+class MetricsTokenPermission(BasePermission):
+    """Allows requests carrying ``Authorization: Bearer <PDF_METRICS_TOKEN>``; none if it is unset"""
+
+    message = 'Metrics require the PDF_METRICS_TOKEN bearer token'
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'PDF_METRICS_TOKEN', None)
+        if not token:
+            return False
+        expected = f'Bearer {token}'.encode('utf-8')
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), expected)
+
+
+def auth_stats():
+    return token_verifier.stats()
@@ -0,0 +1,100 @@
+"""
+Batch report generation streamed back as a ZIP archive.
+
+Reports are rendered concurrently and each PDF is written into the archive as
+soon as it finishes, so the response starts flowing before the whole batch is
+done. At most one render per worker is in flight, and the next one is only
+submitted once a finished PDF has been handed to the client, so memory stays
+bounded by the pool size and a slow client slows rendering down. A
+``manifest.json`` entry at the end of the archive lists every requested report
+with its file name or error message.
+"""
+
+import json
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class _ZipSink:
+    """Write-only file object collecting the bytes zipfile produces"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def report_filename(index, title):
+    """File name for report `index` inside the archive"""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', title).strip('._') or 'report'
+    return f"{index + 1:03d}-{slug[:80]}.pdf"
+
+
+def stream_report_zip(specs, render, max_workers=4):
+    """
+    Render every spec with `render(spec) -> bytes` and yield a ZIP archive.
+
+    `specs` is a list of dicts, or of (error message) strings for items that
+    already failed validation. Errors raised by `render` are recorded in the
+    manifest instead of aborting the batch.
+    """
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED)
+    manifest = [None] * len(specs)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        pending = []
+        for index, spec in enumerate(specs):
+            if isinstance(spec, str):
+                manifest[index] = {'index': index, 'status': 'error', 'error': spec}
+            else:
+                pending.append(index)
+        pending.reverse()
+
+        futures = {}
+        while pending or futures:
+            while pending and len(futures) < max_workers:
+                index = pending.pop()
+                futures[executor.submit(render, specs[index])] = index
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Dropping the future frees its PDF once it is in the archive
+                index = futures.pop(future)
+                spec = specs[index]
+                entry = {'index': index, **spec}
+                try:
+                    data = future.result()
+                except Exception as e:
+                    entry.update(status='error', error=str(e))
+                else:
+                    filename = report_filename(index, spec['title'])
+                    archive.writestr(filename, data)
+                    entry.update(status='ok', file=filename, bytes=len(data))
+                    del data
+                manifest[index] = entry
+                yield sink.drain()
+
+        archive.writestr('manifest.json', json.dumps({'reports': manifest}, indent=2))
+        archive.close()
+        yield sink.drain()
+    finally:
+        # Stops queued renders if the client disconnects mid-stream
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,78 @@
+"""
+Files that workers share through a cache directory: parsed fonts, themed
+covers, disk-cached reports and job artefacts.
+
+Files are written to a temporary file in their final directory and renamed
+into place, so readers never see a partial file. Private directories are
+created with mode 0700, and private files are only read back if they are
+owned by the current user and not writable by anyone else.
+"""
+
+import os
+import stat
+import tempfile
+
+
+def is_private(st):
+    """True if the file `st` describes is owned by this user and writable by nobody else"""
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def private_dir(path):
+    """Create directory `path` with mode 0700 if needed; PermissionError if another user could write to it"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not is_private(os.stat(path)):
+        raise PermissionError(f"{path} is writable by other users")
+    return path
+
+
+def open_private(path):
+    """Open `path` for reading; PermissionError if another user could have planted or edited it"""
+    f = open(path, 'rb')
+    if not is_private(os.fstat(f.fileno())):
+        f.close()
+        raise PermissionError(f"{path} is writable by other users")
+    return f
+
+
+def read_private(path):
+    """Contents of `path`, or None if it is missing, unreadable or not private"""
+    try:
+        with open_private(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_atomic(path, write, private=True, prefix=None):
+    """
+    Create or replace `path` with what `write(file)` writes. The directory is
+    created if needed, private unless `private=False`. Raises OSError, after
+    removing the temporary file.
+    """
+    directory = os.path.dirname(path)
+    if private:
+        private_dir(directory)
+    else:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_cache_file(path, data):
+    """Write `data` to the private cache file `path`; False if it could not be written"""
+    try:
+        write_atomic(path, lambda f: f.write(data))
+    except OSError:
+        # A read-only or full cache directory only costs us the warm start
+        return False
+    return True
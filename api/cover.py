@@ -0,0 +1,340 @@
+"""
+Cover image cache for the report cover page.
+
+``cover.png`` is decoded once per process and turned into a small set of
+pre-encoded JPEG variants (low, medium, high, max). Each variant is wrapped in a ready
+to embed ReportLab image XObject, so drawing the cover only adds a reference
+to already-compressed bytes instead of re-decoding and re-compressing the PNG
+for every PDF.
+
+Reports for a configured sector get a themed cover tinted with the sector's
+``color_scheme`` (see ThemedCovers). Themed covers are built the same way,
+once per colour and variant, so they cost a request no more than the plain
+one, and their JPEGs are kept in ``PDF_COVER_CACHE_DIR`` so restarted workers
+skip the recolouring.
+
+``PDF_COVER_VARIANT``, ``PDF_THEMED_COVERS`` and ``PDF_COVER_CACHE_DIR`` are
+read from settings.py.
+"""
+
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageChops, ImageOps
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.pdfbase.pdfutils import readJPEGInfo
+
+from .cache_files import read_private, write_cache_file
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COVER_PATH = os.path.join(BASE_DIR, "asset", "cover.png")
+
+# Cover pages are always drawn full-bleed on an A4 page (595pt wide)
+PAGE_WIDTH_POINTS = 595
+
+# dpi=None keeps the source resolution; subsampling=0 keeps full chroma resolution
+# Named by quality only, so they do not clash with the output profiles' names
+COVER_VARIANTS = {
+    'low': {'dpi': 72, 'quality': 60},
+    'medium': {'dpi': 96, 'quality': 75},
+    'high': {'dpi': None, 'quality': 90},
+    'max': {'dpi': None, 'quality': 95, 'subsampling': 0},
+}
+
+# Flat background drawn when the cover image cannot be used
+FALLBACK_COVER_COLOR = '#1A365D'
+
+# Bound on cached themed covers; colours only come from sectors_config.json
+MAX_THEMED_COVERS = 256
+
+# Bump when the recolouring changes, so cached themed covers are rebuilt
+THEME_FORMAT = 1
+
+# Themed covers may lower the variant's JPEG quality by this much, in steps
+# of 5, to stay no larger than the plain cover
+MAX_THEME_QUALITY_DROP = 15
+
+HEX_COLOR = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+
+def default_cover_variant():
+    """The variant of the standard profile, PDF_COVER_VARIANT"""
+    return getattr(settings, 'PDF_COVER_VARIANT', 'high')
+
+
+def themed_covers_enabled():
+    return getattr(settings, 'PDF_THEMED_COVERS', True)
+
+
+def cover_cache_dir():
+    return getattr(settings, 'PDF_COVER_CACHE_DIR', None) or os.path.join(
+        os.path.dirname(BASE_DIR), '.cache', 'covers'
+    )
+
+
+class CoverImage:
+    """Decoded cover image with pre-encoded, ready-to-embed variants"""
+
+    def __init__(self, path=COVER_PATH, variants=COVER_VARIANTS):
+        self.path = path
+        self.variants = variants
+        self._lock = threading.Lock()
+        self._xobjects = None
+        self._sizes = {}
+        self.prepare_seconds = None
+
+    def prepare(self):
+        """Decode the source image and build every variant, once"""
+        if self._xobjects is not None:
+            return self._xobjects
+
+        with self._lock:
+            if self._xobjects is not None:
+                return self._xobjects
+
+            start = time.perf_counter()
+            with Image.open(self.path) as source:
+                # drawImage without a mask ignores the alpha channel as well
+                image = source.convert('RGB')
+
+            xobjects = {}
+            for variant, options in self.variants.items():
+                data = self._encode(image, **options)
+                xobjects[variant] = self._make_xobject(data)
+                self._sizes[variant] = len(data)
+
+            self.prepare_seconds = time.perf_counter() - start
+            self._xobjects = xobjects
+            return xobjects
+
+    def get(self, variant=None):
+        """Return the prepared image XObject for `variant` (default: PDF_COVER_VARIANT)"""
+        variant = variant or default_cover_variant()
+        xobjects = self.prepare()
+        if variant not in xobjects:
+            raise ValueError(f"Unknown cover variant '{variant}'")
+        return xobjects[variant]
+
+    def draw(self, pdf, x, y, width, height, variant=None):
+        """Draw the cover on canvas `pdf`, embedding the image once per document"""
+        draw_xobject(pdf, self.get(variant), x, y, width, height)
+
+    def stats(self):
+        """Return the encoded size of each variant and the preparation time"""
+        return {
+            'prepared': self._xobjects is not None,
+            'variant_bytes': dict(self._sizes),
+            'prepare_seconds': self.prepare_seconds,
+        }
+
+    def source(self):
+        """Decode and return the cover as an RGB image"""
+        with Image.open(self.path) as source:
+            return source.convert('RGB')
+
+    @staticmethod
+    def _encode(image, dpi, quality, subsampling=None):
+        if dpi is not None:
+            width = min(image.width, round(PAGE_WIDTH_POINTS / 72 * dpi))
+            if width != image.width:
+                height = round(width * image.height / image.width)
+                image = image.resize((width, height), Image.LANCZOS)
+
+        buffer = BytesIO()
+        options = {} if subsampling is None else {'subsampling': subsampling}
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, **options)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _make_xobject(data):
+        # What PDFImageXObject.loadImageFromJPEG sets up, but embedding the
+        # JPEG as binary: ReportLab's default ASCII85 wrapping adds 25%
+        width, height, components = readJPEGInfo(BytesIO(data))[:3]
+        xobject = PDFImageXObject(hashlib.md5(data).hexdigest())
+        xobject.width, xobject.height = width, height
+        xobject.bitsPerComponent = 8
+        xobject.colorSpace = {1: 'DeviceGray', 3: 'DeviceRGB'}.get(components, 'DeviceCMYK')
+        if components == 4:
+            xobject._dotrans = 1
+        xobject.streamContent = data
+        xobject._filters = ('DCTDecode',)
+        xobject.mask = None
+        return xobject
+
+
+def draw_xobject(pdf, prepared, x, y, width, height):
+    """Draw a prepared image XObject on canvas `pdf`, embedding it once per document"""
+    name = prepared.name
+    doc = pdf._doc
+    reg_name = doc.getXObjectName(name)
+
+    # Mirrors Canvas.drawImage, minus loading and encoding the image
+    if not doc.idToObject.get(reg_name):
+        image = copy.copy(prepared)
+        pdf._setXObjects(image)
+        doc.Reference(image, reg_name)
+        doc.addForm(name, image)
+
+    pdf._currentPageHasImages = 1
+    pdf.saveState()
+    pdf.translate(x, y)
+    pdf.scale(width, height)
+    pdf._code.append(f"/{reg_name} Do")
+    pdf.restoreState()
+    pdf._formsinuse.append(name)
+
+
+class ThemedCovers:
+    """
+    The cover recoloured with a sector colour: the background is mapped from
+    black through the colour to white by luminance, while the logo keeps its
+    own colours. Each (colour, variant) is encoded once and then reused.
+    """
+
+    def __init__(self, cover, cache_dir=None):
+        self.cover = cover
+        self._cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._xobjects = {}
+        self._sizes = {}
+        self._base = None
+        self._disk_hits = 0
+        self._disk_misses = 0
+        self.generate_seconds = 0.0
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir or cover_cache_dir()
+
+    def get(self, color, variant=None):
+        """Return the image XObject for `color` (#RRGGBB) and `variant`"""
+        variant = variant or default_cover_variant()
+        key = (color.upper(), variant)
+        prepared = self._xobjects.get(key)
+        if prepared is None:
+            self.prepare([color], variant)
+            prepared = self._xobjects[key]
+        return prepared
+
+    def prepare(self, colors, variant=None):
+        """Build the themed covers for `colors` that are not built yet"""
+        variant = variant or default_cover_variant()
+        if variant not in self.cover.variants:
+            raise ValueError(f"Unknown cover variant '{variant}'")
+        with self._lock:
+            missing = {color.upper() for color in colors} - {color for color, v in self._xobjects if v == variant}
+            if not missing:
+                return
+            if len(self._xobjects) + len(missing) > MAX_THEMED_COVERS:
+                self._xobjects.clear()
+                self._sizes.clear()
+
+            start = time.perf_counter()
+            for color in sorted(missing):
+                cache_file = self._cache_file(color, variant)
+                data = read_private(cache_file)
+                if data is None:
+                    self._disk_misses += 1
+                    data = self._generate(color, variant)
+                    write_cache_file(cache_file, data)
+                else:
+                    self._disk_hits += 1
+                self._xobjects[(color, variant)] = self.cover._make_xobject(data)
+                self._sizes[(color, variant)] = len(data)
+            self.generate_seconds += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'themed_covers': len(self._xobjects),
+            'themed_bytes': sum(self._sizes.values()),
+            'themed_disk_cache_hits': self._disk_hits,
+            'themed_disk_cache_misses': self._disk_misses,
+            'themed_generate_seconds': self.generate_seconds,
+        }
+
+    def _generate(self, color, variant):
+        """JPEG bytes of the cover themed with `color`, no larger than the plain variant"""
+        gray, logo, logo_mask, logo_box = self._get_base()
+        image = ImageOps.colorize(gray, black='#000000', mid=color, white='#FFFFFF', midpoint=90)
+        image.paste(logo, logo_box, logo_mask)
+
+        options = dict(self.cover.variants[variant])
+        plain_size = self.cover.stats()['variant_bytes'].get(variant)
+        data = self.cover._encode(image, **options)
+        lowest = options['quality'] - MAX_THEME_QUALITY_DROP
+        # Saturated colours take more bytes to encode than the mostly grey cover
+        while plain_size and len(data) > plain_size and options['quality'] > lowest:
+            options['quality'] -= 5
+            data = self.cover._encode(image, **options)
+        return data
+
+    def _cache_file(self, color, variant):
+        stat = os.stat(self.cover.path)
+        options = '-'.join(f"{k}{v}" for k, v in sorted(self.cover.variants[variant].items()))
+        key = f"{color[1:].lower()}-{variant}-{options}-{stat.st_size}-{stat.st_mtime_ns}-v{THEME_FORMAT}"
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    def _get_base(self):
+        # Luminance plus the logo cut out with its mask, kept instead of the
+        # full decoded RGB cover
+        if self._base is None:
+            source = self.cover.source()
+            hue, saturation, value = source.convert('HSV').split()
+            # The logo is the only bright, saturated part of the cover
+            mask = ImageChops.multiply(
+                saturation.point(lambda level: 255 if level > 120 else 0),
+                value.point(lambda level: 255 if level > 110 else 0),
+            )
+            box = mask.getbbox() or (0, 0, 1, 1)
+            self._base = (ImageOps.grayscale(source), source.crop(box), mask.crop(box), box)
+        return self._base
+
+
+cover_image = CoverImage()
+themed_covers = ThemedCovers(cover_image)
+
+
+def theme_color(color):
+    """`color` if it is a #RRGGBB colour a cover can be themed with, else None"""
+    return color if isinstance(color, str) and HEX_COLOR.match(color) else None
+
+
+def sector_colors():
+    """Valid colour_scheme values of the configured sectors"""
+    from .sectors import sector_config
+
+    colors = (theme_color(info.color_scheme) for info in sector_config.sectors().values())
+    return sorted({color for color in colors if color})
+
+
+def prepare_cover_variants(variant=None):
+    """
+    Decode the cover and build all variants, plus the themed covers of every
+    configured sector in `variant` (default: the default profile's), e.g. at
+    worker startup. Other variants are themed on first use.
+    """
+    cover_image.prepare()
+    if themed_covers_enabled():
+        if variant is None:
+            from .profiles import get_profile
+            variant = get_profile().cover_variant
+        themed_covers.prepare(sector_colors(), variant)
+
+
+def draw_cover_image(pdf, x, y, width, height, variant=None, color=None):
+    """Draw the prepared cover image onto `pdf`, themed with `color` if given"""
+    if themed_covers_enabled() and theme_color(color):
+        draw_xobject(pdf, themed_covers.get(color, variant), x, y, width, height)
+    else:
+        cover_image.draw(pdf, x, y, width, height, variant)
+
+
+def cover_stats():
+    """Return cover image cache statistics"""
+    return {**cover_image.stats(), **themed_covers.stats()}
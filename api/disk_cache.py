@@ -0,0 +1,267 @@
+"""
+Report cache on disk, shared by every worker and every host that mounts
+``PDF_DISK_CACHE_DIR``.
+
+Reports are stored under a hash of their rendering inputs: the request
+parameters, the output profile and the digest of ``sectors_config.json``.
+Ticker data is not part of the key; like the in-process cache, entries expire
+after ``PDF_DISK_CACHE_TTL_SECONDS``.
+
+A PDF is written to a temporary file in its final directory and renamed into
+place, so readers never see a partial file and concurrent renders of the same
+report simply replace each other. A file's mtime is when it was rendered
+(for the TTL) and its atime is bumped on hits, which drives least-recently-used
+eviction once the directory holds more than ``PDF_DISK_CACHE_MAX_BYTES``.
+Sweeps run every SWEEP_EVERY writes per process, one process at a time.
+
+Hits are served by path, so views can leave sending the bytes to the front
+proxy (see ``PDF_SENDFILE_HEADER``).
+
+The shared ``disk_cache`` reads ``PDF_DISK_CACHE_DIR``,
+``PDF_DISK_CACHE_MAX_BYTES`` and ``PDF_DISK_CACHE_TTL_SECONDS`` when used, and
+is disabled while the directory is unset.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+
+from .cache_files import write_atomic
+from .sectors import sector_config
+
+# Bump when the rendered output for the same inputs changes (also part of report ETags)
+DISK_CACHE_FORMAT = 2
+
+# A process sweeps after this many writes, or after writing this fraction of the budget
+SWEEP_EVERY = 100
+SWEEP_FRACTION = 0.05
+# Sweeps evict down to this fraction of the budget, so they do not run on every write
+SWEEP_TARGET = 0.9
+# Hits refresh a file's atime at most this often
+ATIME_RESOLUTION_SECONDS = 60
+# Temporary files older than this were left by a crashed writer
+STALE_TEMP_SECONDS = 3600
+
+
+class DiskReport:
+    """A finished PDF in the disk cache, served by path"""
+
+    __slots__ = ('path', 'relative_path', 'size', 'etag')
+
+    def __init__(self, path, relative_path, size, etag):
+        self.path = path
+        self.relative_path = relative_path
+        self.size = size
+        self.etag = etag
+
+    def open(self):
+        """Return a new file object reading the PDF; the caller closes it"""
+        return open(self.path, 'rb')
+
+    @property
+    def data(self):
+        with self.open() as f:
+            return f.read()
+
+
+class DiskReportCache:
+    """Content-addressed PDF files with a TTL and a total size budget"""
+
+    def __init__(self, directory=None, max_bytes=None, ttl_seconds=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes_since_sweep = 0
+        self._bytes_since_sweep = 0
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._write_errors = 0
+        self._evictions = 0
+        self._sweeps = 0
+        self._bytes = None
+        self._files = None
+
+    @property
+    def directory(self):
+        """The directory given to the constructor, else PDF_DISK_CACHE_DIR"""
+        return self._directory or getattr(settings, 'PDF_DISK_CACHE_DIR', None)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    @property
+    def max_bytes(self):
+        """The byte budget given to the constructor, else PDF_DISK_CACHE_MAX_BYTES"""
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'PDF_DISK_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+
+    @property
+    def ttl_seconds(self):
+        """The TTL given to the constructor, else PDF_DISK_CACHE_TTL_SECONDS"""
+        if self._ttl_seconds is not None:
+            return self._ttl_seconds
+        return getattr(settings, 'PDF_DISK_CACHE_TTL_SECONDS', getattr(settings, 'PDF_CACHE_TTL_SECONDS', 300))
+
+    def digest(self, key):
+        """Hex digest naming the file for a report cache key"""
+        inputs = json.dumps([DISK_CACHE_FORMAT, sector_config.current_digest(), *key])
+        return hashlib.sha256(inputs.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the DiskReport for `key`, or None if missing or expired"""
+        relative_path = self._relative_path(self.digest(key))
+        path = os.path.join(self.directory, relative_path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._count_miss()
+            return None
+
+        now = time.time()
+        if now - st.st_mtime > self.ttl_seconds:
+            # Left for the sweep: unlinking here could delete a fresh replacement
+            self._count_miss()
+            return None
+
+        if now - st.st_atime > ATIME_RESOLUTION_SECONDS:
+            try:
+                os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+            except OSError:
+                pass
+        with self._lock:
+            self._hits += 1
+        return self._report(path, relative_path, st)
+
+    def put(self, key, source):
+        """Copy the PDF in binary file `source` into the cache and return its DiskReport"""
+        relative_path = self._relative_path(self.digest(key))
+        path = os.path.join(self.directory, relative_path)
+        try:
+            # Not private: the front proxy reads these files too
+            write_atomic(path, lambda f: shutil.copyfileobj(source, f), private=False, prefix='.')
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._write_errors += 1
+            raise
+
+        with self._lock:
+            self._writes += 1
+            self._writes_since_sweep += 1
+            self._bytes_since_sweep += st.st_size
+            sweep = (self._writes_since_sweep >= SWEEP_EVERY
+                     or self._bytes_since_sweep >= self.max_bytes * SWEEP_FRACTION)
+            if sweep:
+                self._writes_since_sweep = self._bytes_since_sweep = 0
+        if sweep:
+            self.sweep()
+        return self._report(path, relative_path, st)
+
+    def sweep(self, now=None):
+        """
+        Delete expired reports, then the least recently used ones until the
+        cache fits its budget. Returns the number of files deleted, or None if
+        another process is already sweeping.
+        """
+        now = time.time() if now is None else now
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.sweep.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+            deleted = 0
+            entries = []
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if entry.name.endswith('.tmp'):
+                        expired = now - st.st_mtime > STALE_TEMP_SECONDS
+                    else:
+                        expired = now - st.st_mtime > self.ttl_seconds
+                    if expired:
+                        deleted += self._remove(entry.path)
+                    elif not entry.name.endswith('.tmp'):
+                        entries.append((st.st_atime, st.st_size, entry.path))
+
+            files = len(entries)
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                target = self.max_bytes * SWEEP_TARGET
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    if self._remove(path):
+                        deleted += 1
+                        files -= 1
+                        total -= size
+
+            with self._lock:
+                self._sweeps += 1
+                self._evictions += deleted
+                self._files = files
+                self._bytes = total
+            return deleted
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self):
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'writes': self._writes,
+            'write_errors': self._write_errors,
+            'evictions': self._evictions,
+            'sweeps': self._sweeps,
+            # As of the last sweep by this process
+            'files': self._files,
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def _count_miss(self):
+        with self._lock:
+            self._misses += 1
+
+    @staticmethod
+    def _relative_path(digest):
+        # 256 subdirectories keep directory listings short
+        return os.path.join(digest[:2], f"{digest}.pdf")
+
+    @staticmethod
+    def _report(path, relative_path, st):
+        # Every process sees the same mtime and size, so they agree on the ETag
+        return DiskReport(path, relative_path, st.st_size, f'"{os.path.basename(path)[:24]}-{st.st_mtime_ns:x}"')
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+
+# Only used while PDF_DISK_CACHE_DIR is set
+disk_cache = DiskReportCache()
+
+
+def disk_cache_stats():
+    return disk_cache.stats() if disk_cache.enabled else {}
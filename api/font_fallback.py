@@ -0,0 +1,216 @@
+"""
+Font fallback for characters the Inter faces do not have (CJK, Hangul, ...).
+
+Text drawn with draw_runs() is first split into runs by font with
+text_runs(): characters the requested face covers stay in it, the rest go to
+the first font in ``PDF_FALLBACK_FONTS`` (settings.py, read on first use)
+that covers them. Entries are paths
+to TrueType files, whose subsets are embedded like Inter's, or names of
+ReportLab's built-in CID fonts, which need no font file but are not embedded
+(viewers substitute their own CJK fonts).
+
+Coverage is read once from each TrueType font's cmap (CID fonts use the
+Unicode blocks in CID_FONT_COVERAGE) and compiled into regular expressions:
+one per face matching the characters it lacks, and one per face whose
+alternatives match runs of each font in priority order, so splitting a
+string is a single C-level scan. ASCII text never reaches them, text the
+face covers only takes the first, and fallback fonts are loaded and
+registered the first time a run needs them.
+"""
+
+import os
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+from .fonts import FontRegistrationError, registry
+from .text_metrics import advance_table
+
+DEFAULT_FALLBACK_FONTS = 'STSong-Light,HeiseiKakuGo-W5,HYGothic-Medium'
+
+_CJK_PUNCTUATION = (0x3000, 0x303F)
+_FULLWIDTH_FORMS = (0xFF00, 0xFFEF)
+_CJK_IDEOGRAPHS = ((0x3400, 0x4DBF), (0x4E00, 0x9FFF))
+_HANGUL = ((0x1100, 0x11FF), (0x3130, 0x318F), (0xAC00, 0xD7A3))
+
+# Unicode blocks served by ReportLab's built-in CID fonts
+CID_FONT_COVERAGE = {
+    # Simplified and traditional Chinese
+    'STSong-Light': (_CJK_PUNCTUATION, _FULLWIDTH_FORMS, *_CJK_IDEOGRAPHS),
+    'MSung-Light': (_CJK_PUNCTUATION, _FULLWIDTH_FORMS, *_CJK_IDEOGRAPHS),
+    # Japanese: kana and kanji
+    'HeiseiMin-W3': ((0x3000, 0x30FF), _FULLWIDTH_FORMS, *_CJK_IDEOGRAPHS),
+    'HeiseiKakuGo-W5': ((0x3000, 0x30FF), _FULLWIDTH_FORMS, *_CJK_IDEOGRAPHS),
+    # Korean
+    'HYSMyeongJo-Medium': (_CJK_PUNCTUATION, *_HANGUL),
+    'HYGothic-Medium': (_CJK_PUNCTUATION, *_HANGUL),
+}
+
+
+def _ranges(codes):
+    """Sorted code points as (first, last) ranges"""
+    ranges = []
+    for code in sorted(codes):
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return ranges
+
+
+def _char_class(ranges):
+    return ''.join(f'\\U{first:08x}' if first == last else f'\\U{first:08x}-\\U{last:08x}' for first, last in ranges)
+
+
+class FallbackFonts:
+    """Splits text into runs by the font that can draw it"""
+
+    def __init__(self, entries=None):
+        self._entries = entries
+        self._lock = threading.Lock()
+        self._missing = {}
+        self._classifiers = {}
+        self._fallbacks = None
+        self._registered = set()
+        self.unavailable = []
+        self.fallback_runs = Counter()
+
+    @property
+    def entries(self):
+        """The fonts given to the constructor, else PDF_FALLBACK_FONTS, in priority order"""
+        entries = self._entries
+        if entries is None:
+            entries = getattr(settings, 'PDF_FALLBACK_FONTS', DEFAULT_FALLBACK_FONTS)
+        return [entry.strip() for entry in entries.split(',') if entry.strip()]
+
+    def text_runs(self, text, font_name):
+        """Return ((run, font name), ...) covering `text` in order"""
+        if text.isascii():
+            return ((text, font_name),)
+        missing = self._missing.get(font_name)
+        if missing is None:
+            missing = self._compile_missing(font_name)
+        if missing.search(text) is None:
+            return ((text, font_name),)
+
+        classifier = self._classifiers.get(font_name)
+        if classifier is None:
+            classifier = self._compile_classifier(font_name)
+        fonts = [font_name, *[name for name, _ in self._fallbacks], font_name]
+        runs = []
+        for match in classifier.finditer(text):
+            run_font = fonts[match.lastindex - 1]
+            if runs and runs[-1][1] == run_font:
+                runs[-1][0] += match.group()
+            else:
+                runs.append([match.group(), run_font])
+        for _, run_font in runs:
+            if run_font != font_name:
+                self._ensure(run_font)
+                self.fallback_runs[run_font] += 1
+        return tuple((run, run_font) for run, run_font in runs)
+
+    def stats(self):
+        return {
+            'fallback_fonts': [name for name, _ in self._fallbacks or ()],
+            'unavailable': list(self.unavailable),
+            'registered': sorted(self._registered),
+            'runs': dict(self.fallback_runs),
+        }
+
+    def _compile_missing(self, font_name):
+        face = pdfmetrics.getFont(font_name).face
+        covered = _char_class(_ranges(face.charToGlyph))
+        missing = re.compile(f'[^{covered}]')
+        with self._lock:
+            self._missing[font_name] = missing
+        return missing
+
+    def _compile_classifier(self, font_name):
+        with self._lock:
+            if self._fallbacks is None:
+                self._fallbacks = self._load_coverage()
+        # Each font only gets the characters no earlier font covers, so runs
+        # of the requested face are not swallowed by a fallback font
+        covered = set(pdfmetrics.getFont(font_name).face.charToGlyph)
+        classes = [_ranges(covered)]
+        for _, codes in self._fallbacks:
+            codes = codes - covered
+            classes.append(_ranges(codes))
+            covered |= codes
+        # Characters no font covers stay in the requested face, as before
+        pattern = '|'.join(f'([{_char_class(ranges)}]+)' if ranges else '(?!)()' for ranges in classes) + '|(.)'
+        classifier = re.compile(pattern, re.DOTALL)
+        with self._lock:
+            self._classifiers[font_name] = classifier
+        return classifier
+
+    def _load_coverage(self):
+        fallbacks = []
+        for entry in self.entries:
+            if entry in CID_FONT_COVERAGE:
+                fallbacks.append((entry, {code for first, last in CID_FONT_COVERAGE[entry] for code in range(first, last + 1)}))
+                continue
+            name = os.path.splitext(os.path.basename(entry))[0]
+            try:
+                registry.add_font_file(name, entry)
+                fallbacks.append((name, set(registry.load(name).face.charToGlyph)))
+            except FontRegistrationError:
+                # Named fonts that are neither CID fonts nor readable TrueType files are skipped
+                self.unavailable.append(entry)
+        return fallbacks
+
+    def _ensure(self, name):
+        if name in self._registered:
+            return
+        with self._lock:
+            if name in self._registered:
+                return
+            if name in CID_FONT_COVERAGE:
+                pdfmetrics.registerFont(UnicodeCIDFont(name))
+            else:
+                registry.ensure(name)
+            self._registered.add(name)
+
+
+fallback_fonts = FallbackFonts()
+
+
+def text_runs(text, font_name):
+    """Split `text` into (run, font name) pairs, falling back from `font_name` where it has no glyphs"""
+    return fallback_fonts.text_runs(text, font_name)
+
+
+def runs_units(runs):
+    """Width of `runs` in font units"""
+    return sum(advance_table(font_name).units(run) for run, font_name in runs)
+
+
+def runs_width(runs, font_size):
+    """Width of `runs` in points"""
+    return 0.001 * font_size * runs_units(runs)
+
+
+def draw_runs(canvas, x, y, runs, font_name, font_size):
+    """
+    drawString() for text split by text_runs(). Leaves `font_name` selected;
+    text in a single run in it is drawn exactly as drawString() would.
+    """
+    current = font_name
+    for run, run_font in runs:
+        if run_font != current:
+            canvas.setFont(run_font, font_size)
+            current = run_font
+        canvas.drawString(x, y, run)
+        if len(runs) > 1:
+            x += advance_table(run_font).width(run, font_size)
+    if current != font_name:
+        canvas.setFont(font_name, font_size)
+
+
+def font_fallback_stats():
+    return fallback_fonts.stats()
@@ -0,0 +1,249 @@
+"""
+Process-wide registry for the Inter font faces shipped in ``asset/font``.
+
+Each face is parsed at most once per worker and registered with ReportLab the
+first time a layout asks for it. The parsed font tables are also persisted to
+an on-disk cache so that a freshly started worker can skip TrueType parsing.
+
+Cache files hold only plain data, written with ``marshal``, and are named by
+and checked against the SHA-256 of the font file they were parsed from. They
+are only read if owned by the current user and not writable by anyone else.
+"""
+
+import hashlib
+import marshal
+import os
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+from reportlab import Version as REPORTLAB_VERSION
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFNameBytes, TTFont, TTFontFace, TTEncoding
+
+from .cache_files import read_private, write_cache_file
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_PATH = os.path.join(BASE_DIR, "asset", "font")
+FONT_CACHE_DIR = os.environ.get(
+    'PDF_FONT_CACHE_DIR',
+    os.path.join(os.path.dirname(BASE_DIR), '.cache', 'fonts')
+)
+
+# Bump when the layout of the cached face tables changes
+FONT_CACHE_FORMAT = 2
+
+# Face attributes not stored in the cache: the font data is read from the
+# font file itself, and the scaling function is rebuilt
+UNCACHED_FACE_ATTRIBUTES = ('_ttf_data', '_pdfScale')
+
+# Names used by the layout code that differ from the font file name
+FONT_ALIASES = {
+    'Inter': 'Inter-Regular',
+}
+
+# Faces used on every report, registered eagerly by preload_fonts()
+DEFAULT_FONTS = ('Inter', 'Inter-Bold')
+
+
+class FontRegistrationError(Exception):
+    """Raised when a font face cannot be found or loaded"""
+
+
+_subset_lock = threading.Lock()
+
+
+class SharedTTFontFace(TTFontFace):
+    """TTFontFace that documents rendered on different threads can share"""
+
+    def makeSubset(self, subset):
+        # makeSubset seeks around the face's in-memory font data, so two
+        # documents being saved at the same time must not interleave here
+        with _subset_lock:
+            return TTFontFace.makeSubset(self, subset)
+
+
+def _scale_function(units_per_em):
+    """Rebuild the glyph unit scaling function dropped when caching a face"""
+    if units_per_em == 1000:
+        return lambda x: x
+    multiplier = 1000 / units_per_em
+    return lambda x: x * multiplier
+
+
+class FontRegistry:
+    """Loads font faces once per process and registers them lazily"""
+
+    def __init__(self, font_path=FONT_PATH, cache_dir=FONT_CACHE_DIR):
+        self.font_path = font_path
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._registered = set()
+        # Faces outside the font directory (fallback fonts), by name
+        self._extra_files = {}
+        # Faces loaded by load() and not registered yet
+        self._loaded = {}
+        self._registration_seconds = {}
+        self._hits = 0
+        self._misses = 0
+        self._disk_hits = 0
+        self._disk_misses = 0
+        self._cache_write_errors = 0
+
+    def available_fonts(self):
+        """Return the names of every face found in the font directory"""
+        names = set()
+        for filename in os.listdir(self.font_path):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() == '.ttf':
+                names.add(stem)
+        for alias, stem in FONT_ALIASES.items():
+            if stem in names:
+                names.add(alias)
+        return sorted(names)
+
+    def font_file(self, name):
+        """Return the TrueType file backing a registered font name"""
+        if name in self._extra_files:
+            return self._extra_files[name]
+        stem = FONT_ALIASES.get(name, name)
+        return os.path.join(self.font_path, f"{stem}.ttf")
+
+    def add_font_file(self, name, path):
+        """Make the TrueType file at `path` available as font `name`"""
+        self._extra_files[name] = path
+
+    def load(self, name):
+        """Return the TTFont for `name`, parsing it if needed but without registering it"""
+        if name in self._registered:
+            return pdfmetrics.getFont(name)
+        with self._lock:
+            font = self._loaded.get(name)
+            if font is None:
+                font = self._loaded[name] = self._load(name)
+            return font
+
+    def is_registered(self, name):
+        return name in self._registered
+
+    def ensure(self, name):
+        """Register font `name` with ReportLab if it is not registered yet"""
+        if name in self._registered:
+            self._hits += 1
+            return
+
+        with self._lock:
+            if name in self._registered:
+                self._hits += 1
+                return
+
+            start = time.perf_counter()
+            font = self._loaded.pop(name, None) or self._load(name)
+            pdfmetrics.registerFont(font)
+            self._registration_seconds[name] = time.perf_counter() - start
+            self._registered.add(name)
+            self._misses += 1
+
+    def preload(self, names=DEFAULT_FONTS):
+        """Eagerly register a set of faces, e.g. before forking workers"""
+        for name in names:
+            self.ensure(name)
+
+    def stats(self):
+        """Return registration timings and hit/miss counters"""
+        return {
+            'registered': sorted(self._registered),
+            'hits': self._hits,
+            'misses': self._misses,
+            'disk_cache_hits': self._disk_hits,
+            'disk_cache_misses': self._disk_misses,
+            'disk_cache_write_errors': self._cache_write_errors,
+            'registration_seconds': dict(self._registration_seconds),
+            'total_registration_seconds': sum(self._registration_seconds.values()),
+        }
+
+    def _cache_file(self, path, digest):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        key = f"{stem}-{digest[:16]}-rl{REPORTLAB_VERSION}-v{FONT_CACHE_FORMAT}"
+        return os.path.join(self.cache_dir, f"{key}.marshal")
+
+    def _load(self, name):
+        path = self.font_file(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise FontRegistrationError(f"Font '{name}' not found at {path}") from e
+
+        digest = hashlib.sha256(data).hexdigest()
+        cache_file = self._cache_file(path, digest)
+        face = self._read_cached_face(cache_file, digest, data)
+        if face is None:
+            self._disk_misses += 1
+            try:
+                face = SharedTTFontFace(path)
+            except Exception as e:
+                raise FontRegistrationError(f"Font '{name}' could not be parsed: {e}") from e
+            self._write_cached_face(cache_file, digest, face)
+        else:
+            self._disk_hits += 1
+
+        font = TTFont.__new__(TTFont)
+        font.fontName = name
+        font.face = face
+        font.encoding = TTEncoding()
+        font.state = WeakKeyDictionary()
+        font._asciiReadable = rl_config.ttfAsciiReadable
+        font.shapable = True
+        return font
+
+    def _read_cached_face(self, cache_file, digest, data):
+        cached = read_private(cache_file)
+        if cached is None:
+            return None
+        try:
+            cached_format, cached_digest, name_fields, tables = marshal.loads(cached)
+        except (EOFError, ValueError, TypeError):
+            return None
+        if cached_format != FONT_CACHE_FORMAT or cached_digest != digest or not isinstance(tables, dict):
+            return None
+
+        face = SharedTTFontFace.__new__(SharedTTFontFace)
+        face.__dict__.update(tables)
+        for key in name_fields:
+            setattr(face, key, TTFNameBytes(tables[key]))
+        face._ttf_data = data
+        face._pdfScale = _scale_function(face.unitsPerEm)
+        return face
+
+    def _write_cached_face(self, cache_file, digest, face):
+        tables = {k: v for k, v in face.__dict__.items() if k not in UNCACHED_FACE_ATTRIBUTES}
+        # marshal only writes exact built-in types
+        name_fields = [k for k, v in tables.items() if isinstance(v, TTFNameBytes)]
+        for key in name_fields:
+            tables[key] = bytes(tables[key])
+        try:
+            data = marshal.dumps((FONT_CACHE_FORMAT, digest, name_fields, tables))
+        except ValueError:
+            data = None
+        if data is None or not write_cache_file(cache_file, data):
+            self._cache_write_errors += 1
+
+
+registry = FontRegistry()
+
+
+def ensure_font(name):
+    """Register font `name` on first use"""
+    registry.ensure(name)
+
+
+def preload_fonts(names=DEFAULT_FONTS):
+    """Register the faces every report needs"""
+    registry.preload(names)
+
+
+def font_stats():
+    """Return the process-wide font registry statistics"""
+    return registry.stats()
@@ -0,0 +1,124 @@
+"""
+Per-page fragment cache.
+
+The sector, ticker and methodology pages do not depend on the per-request
+title or email, so each one is laid out once and recorded as a display list
+of canvas calls. Later reports replay the recorded calls onto their own
+canvas, skipping content building, text measurement and font-size fitting.
+
+Fragments are recorded rather than kept as finished PDF form XObjects because
+TrueType text in a ReportLab content stream is encoded against the font
+subsets of one particular document; replaying the drawing calls lets every
+document build its own subsets while producing the same page content.
+"""
+
+import threading
+from collections import OrderedDict
+
+from .sectors import sector_config
+
+# Canvas methods a fragment may call. They are recorded and replayed as-is.
+RECORDED_METHODS = frozenset([
+    'setFont', 'setFillColor', 'setFillColorRGB', 'setStrokeColor',
+    'setLineWidth', 'drawString', 'rect', 'roundRect',
+])
+
+# Read-only canvas methods a fragment may call without being recorded
+PASSTHROUGH_METHODS = frozenset(['stringWidth'])
+
+MAX_FRAGMENTS = 512
+
+
+class RecordingCanvas:
+    """Canvas proxy that draws through to `canvas` and records every call"""
+
+    def __init__(self, canvas):
+        self._canvas = canvas
+        self.operations = []
+
+    def __getattr__(self, name):
+        if name in PASSTHROUGH_METHODS:
+            return getattr(self._canvas, name)
+        if name not in RECORDED_METHODS:
+            raise TypeError(f"Canvas.{name} cannot be used in a cached page fragment")
+
+        method = getattr(self._canvas, name)
+        operations = self.operations
+
+        def record(*args, **kwargs):
+            operations.append((name, args, kwargs))
+            return method(*args, **kwargs)
+        return record
+
+
+class FragmentCache:
+    """LRU cache of recorded page fragments, reset whenever the sector config changes"""
+
+    def __init__(self, max_fragments=MAX_FRAGMENTS):
+        self.max_fragments = max_fragments
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self._config_version = None
+        self._hits = 0
+        self._misses = 0
+
+    def draw(self, canvas, key, draw_page, *args):
+        """
+        Draw fragment `key` onto `canvas`, replaying it from the cache when
+        possible. On a miss, `draw_page(canvas, *args)` is run and recorded.
+        """
+        self._check_config()
+        operations = self._fragments.get(key)
+
+        if operations is None:
+            self._misses += 1
+            recorder = RecordingCanvas(canvas)
+            draw_page(recorder, *args)
+            self._store(key, tuple(recorder.operations))
+            return
+
+        self._hits += 1
+        with self._lock:
+            if key in self._fragments:
+                self._fragments.move_to_end(key)
+        for name, call_args, call_kwargs in operations:
+            getattr(canvas, name)(*call_args, **call_kwargs)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        return {
+            'fragments': len(self._fragments),
+            'max_fragments': self.max_fragments,
+            'hits': self._hits,
+            'misses': self._misses,
+            'config_version': self._config_version,
+        }
+
+    def _check_config(self):
+        version = sector_config.current_version()
+        if version != self._config_version:
+            with self._lock:
+                self._fragments.clear()
+                self._config_version = version
+
+    def _store(self, key, operations):
+        with self._lock:
+            self._fragments[key] = operations
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_fragments:
+                self._fragments.popitem(last=False)
+
+
+fragment_cache = FragmentCache()
+
+
+def draw_fragment(canvas, key, draw_page, *args):
+    """Draw a cacheable page fragment onto `canvas`"""
+    fragment_cache.draw(canvas, key, draw_page, *args)
+
+
+def fragment_stats():
+    return fragment_cache.stats()
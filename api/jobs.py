@@ -0,0 +1,228 @@
+"""
+Background report jobs.
+
+Submitting a job records it in the ``ReportJob`` table and returns straight
+away; a worker claims queued jobs, renders them through the configured render
+backend and writes the PDF to ``PDF_JOB_DIR``. Identical submissions share a
+job while it is pending or its artefact is still live, and finished jobs are
+purged together with their files once ``PDF_JOB_TTL_SECONDS`` have passed.
+
+By default each web process runs ``PDF_JOB_WORKERS`` worker threads, started on
+the first submission. Set it to 0 and run ``python manage.py run_report_jobs``
+to process jobs in a separate process instead.
+
+``PDF_JOB_DIR`` defaults to ``.cache/jobs`` in the project directory. It is
+created with mode 0700, and artefacts are only served if they are owned by the
+current user and not writable by anyone else. The ``PDF_JOB_*`` settings are
+read when used.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .cache_files import open_private, write_atomic
+from .models import ReportJob
+from .profiles import get_profile
+from .report_cache import render_report
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+JOB_POLL_SECONDS = 1.0
+PURGE_INTERVAL_SECONDS = 60
+
+# Notified whenever a job finished in this process, to wake long-polls early
+_finished = threading.Condition()
+
+
+def job_dir():
+    return getattr(settings, 'PDF_JOB_DIR', None) or os.path.join(os.path.dirname(BASE_DIR), '.cache', 'jobs')
+
+
+def job_ttl_seconds():
+    return getattr(settings, 'PDF_JOB_TTL_SECONDS', 3600)
+
+
+def job_stale_seconds():
+    """A job left 'running' this long is assumed to belong to a dead worker"""
+    return getattr(settings, 'PDF_JOB_STALE_SECONDS', 300)
+
+
+def job_params_key(title_text, email_text, sector, ticker, profile):
+    """Stable hash of the parameters that determine a report's content"""
+    params = json.dumps([title_text, email_text, sector, ticker, profile])
+    return hashlib.sha256(params.encode('utf-8')).hexdigest()
+
+
+def artefact_path(job):
+    return os.path.join(job_dir(), f"{job.id}.pdf")
+
+
+def open_artefact(job):
+    """Open the PDF of a finished job; FileNotFoundError once it has been purged"""
+    return open_private(artefact_path(job))
+
+
+def submit_job(title_text, email_text, sector, ticker, profile=None):
+    """
+    Return (job, created). A pending job or live artefact for the same
+    parameters is reused instead of queueing a new render.
+    """
+    profile = get_profile(profile).name
+    params_key = job_params_key(title_text, email_text, sector, ticker, profile)
+    now = timezone.now()
+    existing = (
+        ReportJob.objects
+        .filter(params_key=params_key, status__in=[ReportJob.QUEUED, ReportJob.RUNNING, ReportJob.DONE])
+        .order_by('-created_at')
+    )
+    for job in existing:
+        if job.status != ReportJob.DONE or (job.expires_at > now and os.path.exists(artefact_path(job))):
+            return job, False
+
+    job = ReportJob.objects.create(
+        params_key=params_key,
+        title=title_text,
+        email=email_text,
+        sector=sector,
+        ticker=ticker,
+        profile=profile,
+    )
+    job_worker.notify()
+    return job, True
+
+
+def claim_next_job():
+    """Atomically move the oldest queued (or stale running) job to running"""
+    stale_before = timezone.now() - timedelta(seconds=job_stale_seconds())
+    for _ in range(5):
+        job = (
+            ReportJob.objects.filter(status=ReportJob.QUEUED).first()
+            or ReportJob.objects.filter(status=ReportJob.RUNNING, started_at__lt=stale_before).first()
+        )
+        if job is None:
+            return None
+        started_at = timezone.now()
+        claimed = ReportJob.objects.filter(pk=job.pk, status=job.status, started_at=job.started_at).update(
+            status=ReportJob.RUNNING, started_at=started_at,
+        )
+        if claimed:
+            job.status = ReportJob.RUNNING
+            job.started_at = started_at
+            return job
+        # Another worker claimed it first, try the next one
+    return None
+
+
+def run_job(job):
+    """Render `job` and record the outcome"""
+    try:
+        report, _ = render_report(job.title, job.email, job.sector, job.ticker, block=True, profile=job.profile)
+        with report.open() as pdf_file:
+            write_atomic(artefact_path(job), lambda f: shutil.copyfileobj(pdf_file, f))
+    except Exception as e:
+        job.status = ReportJob.FAILED
+        job.error = str(e) or e.__class__.__name__
+    else:
+        job.status = ReportJob.DONE
+        job.size = report.size
+        job.etag = report.etag
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + timedelta(seconds=job_ttl_seconds())
+    job.save(update_fields=['status', 'error', 'size', 'etag', 'finished_at', 'expires_at'])
+
+    with _finished:
+        _finished.notify_all()
+
+
+def purge_expired_jobs():
+    """Delete finished jobs past their TTL and their files; return the count"""
+    expired = list(ReportJob.objects.filter(expires_at__lte=timezone.now()))
+    for job in expired:
+        try:
+            os.remove(artefact_path(job))
+        except FileNotFoundError:
+            pass
+    ReportJob.objects.filter(pk__in=[job.pk for job in expired]).delete()
+    return len(expired)
+
+
+def wait_for_job(job_id, timeout):
+    """Return the job after it finishes or `timeout` seconds pass, or None if unknown"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = ReportJob.objects.filter(pk=job_id).first()
+        remaining = deadline - time.monotonic()
+        if job is None or job.is_finished or remaining <= 0:
+            return job
+        # Jobs finished by another process are only seen on the next poll
+        with _finished:
+            _finished.wait(min(remaining, JOB_POLL_SECONDS))
+
+
+def process_jobs(stop_event=None, once=False):
+    """Worker loop: run queued jobs until `stop_event` is set"""
+    wake = job_worker.wake
+    next_purge = 0
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        if time.monotonic() >= next_purge:
+            purge_expired_jobs()
+            next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        wake.wait(JOB_POLL_SECONDS)
+        wake.clear()
+
+
+class JobWorker:
+    """Worker threads running process_jobs() inside the web process"""
+
+    def __init__(self, threads=None):
+        self._thread_count = threads
+        self.wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def threads(self):
+        if self._thread_count is not None:
+            return self._thread_count
+        return getattr(settings, 'PDF_JOB_WORKERS', 1)
+
+    def start(self):
+        with self._lock:
+            if self._threads or self.threads <= 0:
+                return
+            for i in range(self.threads):
+                thread = threading.Thread(
+                    target=process_jobs, args=(self._stop,), name=f"report-job-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after a job was queued, starting them if needed"""
+        self.start()
+        self.wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self.wake.set()
+
+
+job_worker = JobWorker()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import process_jobs, purge_expired_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the background report job worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--purge', action='store_true', help='Only delete expired jobs and exit')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            self.stdout.write(f"Purged {purge_expired_jobs()} expired jobs")
+            return
+
+        self.stdout.write('Processing report jobs, press Ctrl+C to stop')
+        try:
+            process_jobs(once=options['once'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cover import cover_stats
+from api.disk_cache import disk_cache_stats
+from api.fonts import font_stats
+from api.warmup import warm_shared_caches
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the caches kept on disk and shared with the web workers: parsed fonts, themed covers and, "
+        "with --reports and PDF_DISK_CACHE_DIR, every sector's typical company reports. "
+        "This process cannot warm the in-memory caches of running workers; they warm themselves at start-up "
+        "(gunicorn_config.py waits for it in when_ready/post_worker_init) and every PDF_WARMUP_INTERVAL_SECONDS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('sectors', nargs='*', help='Sectors whose reports to render (default: all configured sectors)')
+        parser.add_argument('--reports', action='store_true',
+                            help='Also render the full reports with the default title and email into the disk cache')
+
+    def handle(self, *args, **options):
+        try:
+            result = warm_shared_caches(sectors=options['sectors'], reports=options['reports'],
+                                        progress=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for step, seconds in result['seconds'].items():
+            self.stdout.write(f"  {step:<12}{seconds * 1000:>10.1f} ms")
+        fonts = font_stats()
+        covers = cover_stats()
+        self.stdout.write(f"  font cache: {fonts['disk_cache_hits']} hits, {fonts['disk_cache_misses']} parsed; "
+                          f"themed covers: {covers['themed_covers']} ({covers['themed_disk_cache_misses']} built)")
+        if options['reports']:
+            self.stdout.write(f"  disk cache: {disk_cache_stats()['writes']} reports written")
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed shared caches for {result['sectors']} sectors and {result['reports']} reports "
+            f"in {result['seconds']['total']:.2f}s"
+        ))
@@ -0,0 +1,125 @@
+"""
+Prometheus text exposition for ``/api/metrics/``.
+
+Publishes the per-stage request duration histograms collected by timing.py,
+plus the numeric counters of the caches, pools and schedulers through their
+existing stats() functions. Values are per process: with several gunicorn
+workers each scrape is answered by whichever worker takes the request.
+
+Labels that come from request input, such as unknown sector names, are only
+published for known values; the rest are summed under ``name="other"`` so
+clients cannot create arbitrarily many series.
+"""
+
+import math
+import os
+
+from .timing import stage_metrics
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def stats_sources():
+    """
+    (metric prefix, stats function, known label values) for every component
+    that reports stats. Known label values are None where every label comes
+    from code or configuration rather than from requests.
+    """
+    from .authentication import auth_stats
+    from .cover import cover_stats
+    from .disk_cache import disk_cache_stats
+    from .font_fallback import font_fallback_stats
+    from .fonts import font_stats
+    from .fragments import fragment_stats
+    from .pdf_template import template_stats
+    from .render_backend import get_render_backend
+    from .report_cache import report_cache
+    from .sectors import sector_config, sector_stats
+    from .throttling import throttle_stats
+    from .ticker_data import ticker_data_stats
+    from .warmup import warmup_stats
+
+    return [
+        ('pdf_auth', auth_stats, None),
+        ('pdf_cover', cover_stats, None),
+        ('pdf_disk_cache', disk_cache_stats, None),
+        ('pdf_font_fallback', font_fallback_stats, None),
+        ('pdf_fonts', font_stats, None),
+        ('pdf_fragments', fragment_stats, None),
+        ('pdf_render_backend', lambda: get_render_backend().stats(), None),
+        ('pdf_report_cache', report_cache.stats, None),
+        ('pdf_sectors', sector_stats, sector_config.sectors),
+        ('pdf_templates', template_stats, None),
+        ('pdf_throttle', throttle_stats, None),
+        ('pdf_ticker_data', ticker_data_stats, None),
+        ('pdf_warmup', warmup_stats, None),
+    ]
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value))
+
+
+def histogram_lines():
+    name = 'pdf_request_stage_seconds'
+    lines = [
+        f'# HELP {name} Time spent in each stage of a timed PDF request',
+        f'# TYPE {name} histogram',
+    ]
+    for stage, (buckets, total, count) in stage_metrics.snapshot().items():
+        for bound, cumulative in buckets:
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{format_value(bound)}"}} {cumulative}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {format_value(total)}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+    return lines
+
+
+def label_value(value):
+    """Escape a label value as the text exposition format requires"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def stats_lines(prefix, stats, known_labels=None):
+    """
+    Numeric stats as untyped samples; dicts of numbers become one labelled
+    series. With `known_labels`, values outside it are summed as "other".
+    """
+    lines = []
+    for key, value in stats.items():
+        name = f'{prefix}_{key}'
+        if is_number(value):
+            lines.append(f'# TYPE {name} untyped')
+            lines.append(f'{name} {format_value(value)}')
+        elif isinstance(value, dict) and value and all(is_number(v) for v in value.values()):
+            if known_labels is not None:
+                series = {}
+                for label, item in value.items():
+                    label = label if label in known_labels else 'other'
+                    series[label] = series.get(label, 0) + item
+                value = series
+            lines.append(f'# TYPE {name} untyped')
+            for label, item in sorted(value.items()):
+                lines.append(f'{name}{{name="{label_value(label)}"}} {format_value(item)}')
+    return lines
+
+
+def render_metrics():
+    """The full metrics page as text"""
+    lines = [
+        '# TYPE pdf_process_id untyped',
+        f'pdf_process_id {os.getpid()}',
+    ]
+    lines.extend(histogram_lines())
+    for prefix, stats, known_labels in stats_sources():
+        try:
+            lines.extend(stats_lines(prefix, stats(), known_labels() if known_labels else None))
+        except Exception:
+            # One broken component should not hide the others
+            continue
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='profile',
+            field=models.CharField(default='standard', max_length=16),
+        ),
+    ]
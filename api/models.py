@@ -1,3 +1,46 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class ReportJob(models.Model):
+    """A report rendered in the background and kept on disk until it expires"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # sha256 of the normalised parameters, used to deduplicate submissions
+    params_key = models.CharField(max_length=64, db_index=True)
+    title = models.TextField()
+    email = models.TextField()
+    sector = models.TextField(blank=True)
+    ticker = models.TextField(blank=True)
+    # Output profile name, see profiles.py
+    profile = models.CharField(max_length=16, default='standard')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True)
+    size = models.PositiveIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.title} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
@@ -1,21 +1,21 @@
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib import colors
 from io import BytesIO
 import os
-import json
-from dotenv import load_dotenv
-from supabase import create_client
-from datetime import datetime
-from reportlab.lib.utils import ImageReader
-import requests
-import unicodedata
-
-load_dotenv()
+from .fonts import ensure_font, preload_fonts
+from .font_fallback import draw_runs, runs_units, runs_width, text_runs
+from .cover import FALLBACK_COVER_COLOR, draw_cover_image, theme_color
+from .text_layout import fit_justified_text
+from .text_metrics import fitting_font_size_for_units
+from .sectors import sector_config
+from .fragments import draw_fragment
+from .ticker_data import get_ticker_data
+from .profiles import apply_profile, get_profile
+from .timing import stage
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSET_PATH = os.path.join(BASE_DIR, "asset")
+PAGE_SIZE = (595, 842)
 
 def hex_to_rgb(hex_color):
     """Convert hex color to RGB tuple for reportlab"""
@@ -29,11 +29,13 @@ def draw_name_tag(c, text, x, y, padding_x=10, padding_y=6, fill_color=colors.wh
     - x, y: bottom-left corner of the rectangle.
     """
     # Measure text width
+    ensure_font(font_name)
     c.setFont(font_name, font_size)
-    text_width = c.stringWidth(text, font_name, font_size)
+    runs = text_runs(text, font_name)
+    width = runs_width(runs, font_size)
 
     # Total width and height with padding
-    rect_width = text_width + 2 * padding_x
+    rect_width = width + 2 * padding_x
     rect_height = font_size + 2 * padding_y
 
     # Draw rounded rectangle
@@ -46,62 +48,36 @@ def draw_name_tag(c, text, x, y, padding_x=10, padding_y=6, fill_color=colors.wh
     c.setFillColor(text_color)
     text_x = x + padding_x
     text_y = y + padding_y + 1
-    c.drawString(text_x, text_y, text)
+    draw_runs(c, text_x, text_y, runs, font_name, font_size)
 
 def draw_shrinking_text(c, text, max_width, x, y, font_name='Inter-Bold', initial_font_size=20, min_font_size=5, color=colors.black):
     """Draw text that shrinks to fit within max_width"""
-    font_size = initial_font_size
+    ensure_font(font_name)
+    runs = text_runs(text, font_name)
+    with stage('text_fit'):
+        font_size = fitting_font_size_for_units(runs_units(runs), max_width, initial_font_size, min_font_size)
     c.setFillColor(color)
-    
-    while font_size >= min_font_size:
-        c.setFont(font_name, font_size)
-        text_width = c.stringWidth(text, font_name, font_size)
-        if text_width <= max_width:
-            break
-        font_size -= 1
-    
-    c.drawString(x, y, text)
+    c.setFont(font_name, font_size)
+    draw_runs(c, x, y, runs, font_name, font_size)
 
 def draw_justified_text(c, text, x, y, max_width, max_height, font_name="Inter", initial_font_size=14, min_font_size=8, line_spacing=2):
     """Draw justified text that fits within specified dimensions"""
+    ensure_font(font_name)
     c.setFillColor(colors.black)
-    font_size = initial_font_size
-    
-    while font_size >= min_font_size:
-        c.setFont(font_name, font_size)
-        
-        words = text.split()
-        line = ""
-        lines = []
-
-        # Split text into lines based on max_width
-        for word in words:
-            test_line = f"{line} {word}".strip()
-            if c.stringWidth(test_line, font_name, font_size) <= max_width:
-                line = test_line
-            else:
-                lines.append(line)
-                line = word
-        if line:
-            lines.append(line)
-
-        line_height = font_size + line_spacing
-        total_height = line_height * len(lines)
 
-        # Check if total height fits within max_height
-        if total_height <= max_height:
-            break
-        else:
-            font_size -= 1  # Shrink font and try again
+    with stage('text_fit'):
+        font_size, lines = fit_justified_text(text, font_name, max_width, max_height,
+                                              initial_font_size=initial_font_size, min_font_size=min_font_size,
+                                              line_spacing=line_spacing)
+    c.setFont(font_name, font_size)
+    line_height = font_size + line_spacing
 
     # Draw lines with justification
-    for i, line in enumerate(lines):
-        line_words = line.split()
-
+    for i, (line_words, word_widths) in enumerate(lines):
         if i == len(lines) - 1 or len(line_words) == 1:
-            c.drawString(x, y, line)
+            c.drawString(x, y, " ".join(line_words))
         else:
-            total_word_width = sum(c.stringWidth(word, font_name, font_size) for word in line_words)
+            total_word_width = sum(word_widths)
             space_count = len(line_words) - 1
             if space_count > 0:
                 extra_space = (max_width - total_word_width) / space_count
@@ -109,9 +85,9 @@ def draw_justified_text(c, text, x, y, max_width, max_height, font_name="Inter",
                 extra_space = 0
 
             word_x = x
-            for word in line_words:
+            for word, word_width in zip(line_words, word_widths):
                 c.drawString(word_x, y, word)
-                word_x += c.stringWidth(word, font_name, font_size) + extra_space
+                word_x += word_width + extra_space
 
         y -= line_height
 
@@ -147,43 +123,42 @@ def cover_text_generator(pdf, height, sector, ticker, email_text, title_text):
             corner_radius=5,
             font_name="Inter", font_size=10
         )
-        text_width = pdfmetrics.stringWidth(tag, "Inter", 10)
-        x += text_width + 2 * 10 + 10  # tag width + spacing
+        tag_width = runs_width(text_runs(tag, "Inter"), 10)
+        x += tag_width + 2 * 10 + 10  # tag width + spacing
 
-    draw_shrinking_text(pdf, title_text, 400, 64, height-690-15, font_name='Inter-Bold', initial_font_size=20, min_font_size=5, color=colors.white)
+    # Without a title and email this is the shared cover of a report template
+    if title_text is not None:
+        draw_cover_title(pdf, height, title_text)
 
     pdf.setFont('Inter', 20)
     pdf.setFillColor(colors.white)
     pdf.drawString(64, height-737-15, "For")
 
     # Email
-    r, g, b = hex_to_rgb("#F0748A")
-    pdf.setFillColorRGB(r, g, b)
-    draw_shrinking_text(pdf, email_text, 400, 105, height-737-15, font_name='Inter-Bold', initial_font_size=18, min_font_size=10, color=colors.HexColor("#F0748A"))
+    if email_text is not None:
+        r, g, b = hex_to_rgb("#F0748A")
+        pdf.setFillColorRGB(r, g, b)
+        draw_cover_email(pdf, height, email_text)
 
-def load_sectors_config():
-    """Load sector configuration from JSON file"""
-    try:
-        config_path = os.path.join(ASSET_PATH, "sectors_config.json")
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
+def draw_cover_title(pdf, height, title_text):
+    draw_shrinking_text(pdf, title_text, 400, 64, height-690-15, font_name='Inter-Bold', initial_font_size=20, min_font_size=5, color=colors.white)
 
-def generate_sector_page(pdf, sector, height):
-    """Generate sector analysis page with enhanced content"""
-    config = load_sectors_config()
-    sector_info = config.get("sectors", {}).get(sector, {})
-    
-    pdf.setFont('Inter-Bold', 24)
-    pdf.setFillColor(colors.HexColor("#F0748A"))
-    pdf.drawString(64, height-120, f"Sector Analysis: {sector}")
-    
-    # Get sector-specific information
-    description = sector_info.get("description", f"Analysis of the {sector.lower()} sector")
-    key_metrics = sector_info.get("key_metrics", ["Revenue Growth", "Market Share", "Profitability"])
-    subcategories = sector_info.get("subcategories", [])
-    risk_factors = sector_info.get("risk_factors", ["Market volatility", "Economic cycles"])
+def draw_cover_email(pdf, height, email_text):
+    draw_shrinking_text(pdf, email_text, 400, 105, height-737-15, font_name='Inter-Bold', initial_font_size=18, min_font_size=10, color=colors.HexColor("#F0748A"))
+
+def build_sector_content(sector, sector_info):
+    """Build the body text of the sector analysis page"""
+    # Get sector-specific information, with generic text for unknown sectors
+    if sector_info is not None:
+        description = sector_info.description or f"Analysis of the {sector.lower()} sector"
+        key_metrics = sector_info.key_metrics
+        subcategories = sector_info.subcategories
+        risk_factors = sector_info.risk_factors
+    else:
+        description = f"Analysis of the {sector.lower()} sector"
+        key_metrics = ["Revenue Growth", "Market Share", "Profitability"]
+        subcategories = []
+        risk_factors = ["Market volatility", "Economic cycles"]
     
     # Build enhanced sector content
     sector_content = f"""
@@ -224,37 +199,86 @@ def generate_sector_page(pdf, sector, height):
     through comparative analysis with other sectors, historical performance trends, and 
     forward-looking indicators.
     """
+    return sector_content
+
+def generate_sector_page(pdf, sector, sector_info, height):
+    """Generate sector analysis page with enhanced content"""
+    pdf.setFont('Inter-Bold', 24)
+    pdf.setFillColor(colors.HexColor("#F0748A"))
+    draw_runs(pdf, 64, height-120, text_runs(f"Sector Analysis: {sector}", 'Inter-Bold'), 'Inter-Bold', 24)
     
     # Draw sector content
+    sector_content = build_sector_content(sector, sector_info)
     draw_justified_text(pdf, sector_content, 64, height-180, 464, 500, 
                        font_name="Inter", initial_font_size=12, min_font_size=8, line_spacing=3)
 
-def generate_ticker_page(pdf, ticker, height):
-    """Generate ticker analysis page"""
-    pdf.setFont('Inter-Bold', 24)
-    pdf.setFillColor(colors.HexColor("#F0748A"))
-    pdf.drawString(64, height-120, f"Ticker Analysis: {ticker}")
-    
-    # Mock ticker data (in real implementation, this would come from API)
+# Shown on the ticker page for values the ticker data provider does not have
+TICKER_PLACEHOLDERS = {
+    'exchange': '[Exchange Name]',
+    'market_cap': '[Market Capitalization]',
+    'industry': '[Industry Classification]',
+    'listing_date': '[IPO Date]',
+    'revenue_growth': '[YoY Growth %]',
+    'profit_margin': '[Operating/Net Margins]',
+    'return_on_equity': '[ROE %]',
+    'debt_to_equity': '[D/E Ratio]',
+    'pe_ratio': '[P/E Ratio]',
+}
+
+PERCENT_FIELDS = ('revenue_growth', 'profit_margin', 'return_on_equity')
+RATIO_FIELDS = ('debt_to_equity', 'pe_ratio')
+
+
+def format_market_cap(value):
+    """Abbreviate a market capitalisation, e.g. 3.0e12 -> '3.00T'"""
+    for threshold, suffix in ((1e12, 'T'), (1e9, 'B'), (1e6, 'M')):
+        if abs(value) >= threshold:
+            return f"{value / threshold:.2f}{suffix}"
+    return f"{value:,.0f}"
+
+
+def ticker_field_values(ticker_info):
+    """Display strings for the ticker page, falling back to placeholders"""
+    values = dict(TICKER_PLACEHOLDERS)
+    if ticker_info is None:
+        return values
+
+    for field in TICKER_PLACEHOLDERS:
+        value = getattr(ticker_info, field)
+        if value is None or value == '':
+            continue
+        if field == 'market_cap':
+            values[field] = format_market_cap(value)
+        elif field in PERCENT_FIELDS:
+            values[field] = f"{value * 100:.1f}%"
+        elif field in RATIO_FIELDS:
+            values[field] = f"{value:.2f}"
+        else:
+            values[field] = str(value)
+    return values
+
+def build_ticker_content(ticker, ticker_info=None):
+    """Build the body text of the ticker analysis page from a TickerData (or None)"""
+    values = ticker_field_values(ticker_info)
     ticker_content = f"""
     {ticker} - Company Analysis
     
     Ticker Symbol: {ticker}
-    Exchange: [Exchange Name]
-    Market Cap: [Market Capitalization]
-    Industry: [Industry Classification]
-    Listing Date: [IPO Date]
+    Exchange: {values['exchange']}
+    Market Cap: {values['market_cap']}
+    Industry: {values['industry']}
+    Listing Date: {values['listing_date']}
     
     Company Overview:
     This analysis covers the fundamental and technical aspects of {ticker}, including 
     financial performance, business model, competitive positioning, and investment outlook.
     
     Key Financial Metrics:
-    • Revenue Growth: [YoY Growth %]
-    • Profit Margins: [Operating/Net Margins]
-    • Return on Equity: [ROE %]
-    • Debt-to-Equity Ratio: [D/E Ratio]
-    • Price-to-Earnings Ratio: [P/E Ratio]
+    • Revenue Growth: {values['revenue_growth']}
+    • Profit Margins: {values['profit_margin']}
+    • Return on Equity: {values['return_on_equity']}
+    • Debt-to-Equity Ratio: {values['debt_to_equity']}
+    • Price-to-Earnings Ratio: {values['pe_ratio']}
     
     Business Highlights:
     • Core business operations and revenue streams
@@ -268,62 +292,20 @@ def generate_ticker_page(pdf, ticker, height):
     • Volume analysis and liquidity metrics
     • Moving averages and momentum indicators
     """
+    return ticker_content
+
+def generate_ticker_page(pdf, ticker, ticker_info, height):
+    """Generate ticker analysis page"""
+    pdf.setFont('Inter-Bold', 24)
+    pdf.setFillColor(colors.HexColor("#F0748A"))
+    draw_runs(pdf, 64, height-120, text_runs(f"Ticker Analysis: {ticker}", 'Inter-Bold'), 'Inter-Bold', 24)
     
     # Draw ticker content
+    ticker_content = build_ticker_content(ticker, ticker_info)
     draw_justified_text(pdf, ticker_content, 64, height-180, 464, 500, 
                        font_name="Inter", initial_font_size=12, min_font_size=8, line_spacing=3)
 
-def generate_sector_pdf(title_text, email_text, sector, ticker):
-    """Main function to generate sector ticker PDF"""
-    buffer = BytesIO()
-    width, height = 595, 842
-
-    # Register fonts
-    try:
-        pdfmetrics.registerFont(TTFont('Inter', os.path.join(ASSET_PATH, "font/Inter-Regular.ttf")))
-        pdfmetrics.registerFont(TTFont('Inter-Bold', os.path.join(ASSET_PATH, "font/Inter-Bold.ttf")))
-    except:
-        # Fallback to default fonts if custom fonts are not available
-        pass
-
-    pdf = canvas.Canvas(buffer, pagesize=(width, height))
-
-    # Cover Page
-    try:
-        pdf.drawImage(os.path.join(ASSET_PATH, 'cover.png'), 0, 0, width, height)
-    except:
-        # If cover image not available, create a simple colored background
-        pdf.setFillColor(colors.HexColor("#1A365D"))
-        pdf.rect(0, 0, width, height, fill=1)
-    
-    cover_text_generator(pdf, height, sector, ticker, email_text, title_text)
-    pdf.showPage()
-
-    # Sector Analysis Page
-    if sector:
-        # Create sector page background
-        pdf.setFillColor(colors.HexColor("#F7FAFC"))
-        pdf.rect(0, 0, width, height, fill=1)
-        generate_sector_page(pdf, sector, height)
-        pdf.showPage()
-
-    # Ticker Analysis Page
-    if ticker:
-        # Create ticker page background
-        pdf.setFillColor(colors.HexColor("#F7FAFC"))
-        pdf.rect(0, 0, width, height, fill=1)
-        generate_ticker_page(pdf, ticker, height)
-        pdf.showPage()
-
-    # Methodology Page
-    pdf.setFillColor(colors.HexColor("#F7FAFC"))
-    pdf.rect(0, 0, width, height, fill=1)
-    
-    pdf.setFont('Inter-Bold', 24)
-    pdf.setFillColor(colors.HexColor("#F0748A"))
-    pdf.drawString(64, height-120, "Analysis Methodology")
-    
-    methodology_content = """
+METHODOLOGY_CONTENT = """
     Research Methodology and Disclaimers
     
     This sector and ticker analysis report is generated using a combination of quantitative 
@@ -355,26 +337,105 @@ def generate_sector_pdf(title_text, email_text, sector, ticker):
     This analysis is generated using automated systems and may contain errors or 
     omissions. The authors disclaim any liability for decisions made based on this report.
     """
+
+def generate_methodology_page(pdf, height):
+    """Generate analysis methodology page"""
+    pdf.setFont('Inter-Bold', 24)
+    pdf.setFillColor(colors.HexColor("#F0748A"))
+    pdf.drawString(64, height-120, "Analysis Methodology")
     
-    draw_justified_text(pdf, methodology_content, 64, height-180, 464, 500, 
+    draw_justified_text(pdf, METHODOLOGY_CONTENT, 64, height-180, 464, 500, 
                        font_name="Inter", initial_font_size=11, min_font_size=8, line_spacing=3)
-    
-    pdf.showPage()
 
-    pdf.save()
+def draw_content_page(pdf, width, height, generate_page, *args):
+    """Draw the light page background, then the page content"""
+    pdf.setFillColor(colors.HexColor("#F7FAFC"))
+    pdf.rect(0, 0, width, height, fill=1)
+    generate_page(pdf, *args, height)
+
+def generate_sector_pdf(title_text, email_text, sector, ticker, output=None, profile=None):
+    """
+    Main function to generate sector ticker PDF. The document is written to
+    `output` (any writable binary file, a new BytesIO by default), which is
+    returned positioned at the start. `profile` names the output profile
+    (see profiles.py) that decides how compactly it is encoded.
+    """
+    buffer = output if output is not None else BytesIO()
+    profile = get_profile(profile)
+
+    # Register fonts (parsed once per worker, see fonts.py)
+    with stage('fonts'):
+        preload_fonts()
+
+    # Resolved once per report, so unknown sectors are counted once per report
+    sector_info = sector_config.lookup(sector) if sector else None
+    pdf = report_canvas(buffer, profile)
+    draw_report(pdf, title_text, email_text, sector, sector_info, ticker, profile)
+
+    with stage('save'):
+        pdf.save()
     buffer.seek(0)
     return buffer
 
-def contains_non_ascii(text):
-    """Check if text contains non-ASCII characters"""
-    for char in text:
-        code = ord(char)
-        if (0x4E00 <= code <= 0x9FFF) or \
-            (0xAC00 <= code <= 0xD7A3) or \
-            (0x3040 <= code <= 0x309F) or \
-            (0x30A0 <= code <= 0x30FF):
-            return True
-        category = unicodedata.category(char)
-        if category.startswith('C'):
-            return True
-    return False
+def report_canvas(buffer, profile):
+    """Canvas writing a report to `buffer`, encoded as the OutputProfile says"""
+    # Streams are compressed by the profile's filters instead
+    pdf = canvas.Canvas(buffer, pagesize=PAGE_SIZE, pageCompression=0)
+    apply_profile(pdf, profile)
+    return pdf
+
+def draw_report(pdf, title_text, email_text, sector, sector_info, ticker, profile):
+    """
+    Draw every page of a report onto `pdf`, without saving it. `sector_info`
+    is the SectorInfo `sector` resolves to, or None
+    """
+    width, height = PAGE_SIZE
+
+    # Cover Page, themed with the sector's colour when it has one
+    cover_color = theme_color(sector_info.color_scheme) if sector_info else None
+    with stage('cover'):
+        try:
+            draw_cover_image(pdf, 0, 0, width, height, profile.cover_variant, cover_color)
+        except:
+            # If cover image not available, create a simple colored background
+            pdf.setFillColor(colors.HexColor(cover_color or FALLBACK_COVER_COLOR))
+            pdf.rect(0, 0, width, height, fill=1)
+
+        cover_text_generator(pdf, height, sector, ticker, email_text, title_text)
+        pdf.showPage()
+
+    draw_content_pages(pdf, width, height, sector, sector_info, ticker)
+
+def draw_content_pages(pdf, width, height, sector, sector_info, ticker):
+    """
+    Draw the sector, ticker and methodology pages. They do not depend on the
+    title or email, so they are recorded once and replayed from the fragment cache.
+    `sector_info` is the SectorInfo `sector` resolves to, or None
+    """
+    if sector:
+        with stage('sector_page'):
+            draw_fragment(pdf, ('sector', sector), draw_content_page, width, height, generate_sector_page, sector,
+                          sector_info)
+            pdf.showPage()
+
+    if ticker:
+        with stage('ticker_data'):
+            ticker_info = get_ticker_data(ticker)
+        with stage('ticker_page'):
+            # Keyed by the data too, so a refreshed quote re-renders the page
+            draw_fragment(pdf, ('ticker', ticker, ticker_info), draw_content_page, width, height,
+                          generate_ticker_page, ticker, ticker_info)
+            pdf.showPage()
+
+    with stage('methodology'):
+        draw_fragment(pdf, ('methodology',), draw_content_page, width, height, generate_methodology_page)
+        pdf.showPage()
+
+def warm_page_fragments(sector=None, ticker=None):
+    """Record the content page fragments for `sector` and/or `ticker` without saving a PDF"""
+    width, height = PAGE_SIZE
+    preload_fonts()
+    pdf = canvas.Canvas(BytesIO(), pagesize=PAGE_SIZE)
+    # Not a report, so unknown sectors are not counted as fallbacks
+    sector_info = sector_config.get(sector_config.resolve(sector)) if sector else None
+    draw_content_pages(pdf, width, height, sector, sector_info, ticker)
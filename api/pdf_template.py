@@ -0,0 +1,314 @@
+"""
+Template rendering: personalised reports stamped onto a shared base PDF.
+
+Only the title and email on the cover differ between reports for the same
+sector, ticker (and ticker data) and output profile. With
+``PDF_TEMPLATE_RENDERING=True``, a base PDF without them is rendered once per
+such combination and kept in memory. Each report is then the base bytes
+followed by a PDF incremental update (ISO 32000-1, section 7.5.6) holding a
+new content stream with the title and email, a replacement cover page object
+that draws it after the original cover stream, and a cross-reference section
+chained to the base's with /Prev. ReportLab only lays out two strings.
+
+TrueType text is encoded against the font subsets of one document (see
+fragments.py), so the new stream is drawn on a scratch canvas that shares a
+frozen snapshot of the base document's Inter-Bold subset. That subset holds
+every ASCII glyph plus TEMPLATE_EXTRA_CHARS; titles or emails with any other
+character, or needing a fallback font (font_fallback.py), are rendered in
+full instead.
+"""
+
+import copy
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfdoc import PDFError
+from reportlab.pdfgen import canvas
+
+from .font_fallback import text_runs
+from .fonts import preload_fonts
+from .pdf_generator import (
+    PAGE_SIZE, draw_cover_email, draw_cover_title, draw_report, generate_sector_pdf, report_canvas,
+)
+from .profiles import FlateFilter, get_profile
+from .sectors import sector_config
+from .ticker_data import get_ticker_data
+from .timing import stage
+
+# Fonts of the stamped cover text
+COVER_TEXT_FONTS = ('Inter-Bold',)
+# Reserved in the base's subsets on top of ASCII: Latin-1 letters
+TEMPLATE_EXTRA_CHARS = ''.join(chr(code) for code in range(0xC0, 0x100) if code not in (0xD7, 0xF7))
+
+
+class TemplateError(Exception):
+    """Raised when a base PDF does not have the structure stamping relies on"""
+
+
+def _object_number(reference):
+    return int(reference.split()[0])
+
+
+class ReportTemplate:
+    """A rendered base PDF and what is needed to append a personalised cover"""
+
+    def __init__(self, data, font_states, compress_level):
+        self.data = data
+        self.font_states = font_states
+        self.filter = FlateFilter(compress_level)
+
+        try:
+            trailer = data[data.rindex(b'trailer'):]
+            self.startxref = int(re.search(rb'startxref\s+(\d+)', trailer).group(1))
+            self.size = int(re.search(rb'/Size (\d+)', trailer).group(1))
+            self.root = re.search(rb'/Root (\d+ \d+ R)', trailer).group(1)
+            self.info = re.search(rb'/Info (\d+ \d+ R)', trailer).group(1)
+            self.file_id = re.search(rb'/ID\s*\[\s*<([0-9a-fA-F]+)>', trailer).group(1)
+
+            catalog = self._object(_object_number(self.root))
+            pages = self._object(int(re.search(rb'/Pages (\d+) 0 R', catalog).group(1)))
+            self.page_number = int(re.search(rb'/Kids \[\s*(\d+) 0 R', pages).group(1))
+            page = self._object(self.page_number)
+            contents = re.search(rb'/Contents (\d+ 0 R)', page)
+        except (AttributeError, KeyError, ValueError) as e:
+            raise TemplateError(f"Unexpected base PDF structure: {e}") from e
+
+        # The cover page object, split where the stamped stream joins its contents
+        self.page_head = page[:contents.start()] + b'/Contents [ ' + contents.group(1) + b' '
+        self.page_tail = b' ]' + page[contents.end():] + b'endobj\n'
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def stamp(self, title_text, email_text, output):
+        """
+        Write the personalised report to `output`. Returns False, writing
+        nothing, if the text needs glyphs the base does not have.
+        """
+        content = self.cover_text(title_text, email_text)
+        if content is None:
+            return False
+
+        stream = self.filter.encode(content)
+        stream_number = self.size
+        page_offset = len(self.data)
+        page = b'%s%d 0 R%s' % (self.page_head, stream_number, self.page_tail)
+        stream_offset = page_offset + len(page)
+        stream_object = b'%d 0 obj\n<<\n/Filter [ /%s ] /Length %d\n>>\nstream\n%s\nendstream\nendobj\n' % (
+            stream_number, self.filter.pdfname.encode('ascii'), len(stream), stream)
+        xref_offset = stream_offset + len(stream_object)
+        # A new second file identifier marks this as a different version of the base
+        version_id = hashlib.md5(self.file_id + content).hexdigest().encode('ascii')
+        update = b''.join([
+            page, stream_object,
+            b'xref\n0 1\n0000000000 65535 f \n',
+            b'%d 1\n%010d 00000 n \n' % (self.page_number, page_offset),
+            b'%d 1\n%010d 00000 n \n' % (stream_number, stream_offset),
+            b'trailer\n<<\n/ID [<%s><%s>]\n/Info %s\n/Prev %d\n/Root %s\n/Size %d\n>>\n' % (
+                self.file_id, version_id, self.info, self.startxref, self.root, stream_number + 1),
+            b'startxref\n%d\n%%%%EOF\n' % xref_offset,
+        ])
+        output.write(self.data)
+        output.write(update)
+        return True
+
+    def cover_text(self, title_text, email_text):
+        """Content stream drawing the title and email, or None if they cannot be encoded"""
+        for text in (title_text, email_text):
+            # Fallback fonts are not in the template's font resources
+            if any(font_name not in COVER_TEXT_FONTS for _, font_name in text_runs(text, 'Inter-Bold')):
+                return None
+        scratch = canvas.Canvas(BytesIO(), pagesize=PAGE_SIZE)
+        doc = scratch._doc
+        for font, state in self.font_states:
+            font.state[doc] = state
+        try:
+            height = PAGE_SIZE[1]
+            draw_cover_title(scratch, height, title_text)
+            draw_cover_email(scratch, height, email_text)
+        except PDFError:
+            return None
+        finally:
+            for font, _ in self.font_states:
+                font.state.pop(doc, None)
+        return '\n'.join(scratch._code).encode('latin-1') + b'\n'
+
+    def _object(self, number):
+        xref = self.data[self.startxref:]
+        first, count = map(int, re.match(rb'xref\s+(\d+) (\d+)\s+', xref).groups())
+        if not first <= number < first + count:
+            raise KeyError(number)
+        entry_start = re.match(rb'xref\s+\d+ \d+\s+', xref).end() + 20 * (number - first)
+        offset = int(xref[entry_start:entry_start + 10])
+        return self.data[offset:self.data.index(b'endobj', offset)]
+
+
+def build_template(sector, ticker, profile):
+    """Render the base PDF shared by every report for `sector`, `ticker` and `profile`"""
+    preload_fonts()
+    buffer = BytesIO()
+    pdf = report_canvas(buffer, profile)
+    # Not a report: the reports stamped from it count unknown sectors
+    sector_info = sector_config.get(sector_config.resolve(sector)) if sector else None
+    draw_report(pdf, None, None, sector, sector_info, ticker, profile)
+
+    # Give the cover fonts' subsets the extra glyphs, then freeze a copy of
+    # their assignments for stamping before save() discards them
+    doc = pdf._doc
+    font_states = []
+    for font_name in COVER_TEXT_FONTS:
+        font = pdfmetrics.getFont(font_name)
+        font.splitString(TEMPLATE_EXTRA_CHARS, doc)
+        font.getSubsetInternalName(0, doc)
+        state = copy.copy(font.state[doc])
+        state.assignments = dict(state.assignments)
+        state.subsets = [list(subset) for subset in state.subsets]
+        state.frozen = 1
+        font_states.append((font, state))
+
+    pdf.save()
+    return ReportTemplate(buffer.getvalue(), tuple(font_states), profile.compress_level)
+
+
+class _TemplateBuild:
+    """A template being built, which concurrent misses for the same key wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.template = None
+
+
+class TemplateCache:
+    """
+    LRU cache of report templates within a byte budget, reset when the sector
+    config changes. Concurrent misses for the same key share one build.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._templates = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._config_version = None
+        self._hits = 0
+        self._misses = 0
+        self._stamped = 0
+        self._fallbacks = 0
+
+    @property
+    def max_bytes(self):
+        """The byte budget given to the constructor, else PDF_TEMPLATE_CACHE_MAX_BYTES"""
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'PDF_TEMPLATE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+    def get(self, sector, ticker, profile):
+        """Return the template for `sector`, `ticker` and `profile`, building it on a miss"""
+        version = sector_config.current_version()
+        if version != self._config_version:
+            self.clear()
+            self._config_version = version
+
+        # Keyed by the ticker data too, so a refreshed quote rebuilds the template
+        ticker_info = get_ticker_data(ticker) if ticker else None
+        key = (sector, ticker, ticker_info, profile.name)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self._hits += 1
+                return template
+            build = self._building.get(key)
+            owner = build is None
+            if owner:
+                build = self._building[key] = _TemplateBuild()
+                self._misses += 1
+            else:
+                self._hits += 1
+
+        if not owner:
+            build.done.wait()
+            if build.template is not None:
+                return build.template
+            # The build failed; this caller reports its own error
+            return build_template(sector, ticker, profile)
+
+        try:
+            template = build.template = build_template(sector, ticker, profile)
+            max_bytes = self.max_bytes
+            with self._lock:
+                if template.nbytes <= max_bytes:
+                    if key in self._templates:
+                        self._bytes -= self._templates.pop(key).nbytes
+                    self._templates[key] = template
+                    self._bytes += template.nbytes
+                    while self._bytes > max_bytes:
+                        _, oldest = self._templates.popitem(last=False)
+                        self._bytes -= oldest.nbytes
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            build.done.set()
+        return template
+
+    def stamp(self, title_text, email_text, sector, ticker, profile, output):
+        """Write the report to `output` from its template; False if it must be rendered in full"""
+        with stage('template'):
+            template = self.get(sector, ticker, profile)
+        with stage('stamp'):
+            stamped = template.stamp(title_text, email_text, output)
+        with self._lock:
+            if stamped:
+                self._stamped += 1
+            else:
+                self._fallbacks += 1
+        if stamped and sector:
+            # Counts the report as generate_sector_pdf() does
+            sector_config.lookup(sector)
+        return stamped
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'templates': len(self._templates),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+            'stamped': self._stamped,
+            'fallbacks': self._fallbacks,
+        }
+
+
+template_cache = TemplateCache()
+
+
+def render_sector_pdf(title_text, email_text, sector, ticker, output=None, profile=None):
+    """
+    generate_sector_pdf(), stamping the title and email onto a cached template
+    when PDF_TEMPLATE_RENDERING is enabled
+    """
+    if not getattr(settings, 'PDF_TEMPLATE_RENDERING', False):
+        return generate_sector_pdf(title_text, email_text, sector, ticker, output=output, profile=profile)
+
+    buffer = output if output is not None else BytesIO()
+    profile = get_profile(profile)
+    if not template_cache.stamp(title_text, email_text, sector, ticker, profile, buffer):
+        return generate_sector_pdf(title_text, email_text, sector, ticker, output=buffer, profile=profile.name)
+    buffer.seek(0)
+    return buffer
+
+
+def template_stats():
+    return template_cache.stats()
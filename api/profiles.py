@@ -0,0 +1,73 @@
+"""
+Output profiles: how compactly a report is encoded.
+
+Every profile draws exactly the same pages; they differ only in the cover
+image variant embedded (see cover.py) and in how the page streams, font
+subsets and ToUnicode maps are compressed:
+
+- ``lean``: 72 dpi ``low`` cover, streams compressed at the highest zlib level.
+  For mobile links and bulk archives.
+- ``standard``: the ``PDF_COVER_VARIANT`` cover (the full-resolution ``high`` JPEG by
+  default), zlib's default level.
+- ``print``: the ``max`` cover, full resolution without chroma subsampling.
+
+No profile uses ReportLab's default ASCII85 stream encoding, which only
+makes binary data 25% larger. Fonts are always embedded as per-document
+subsets of the glyphs used, the smallest form ReportLab can write.
+"""
+
+import zlib
+from collections import namedtuple
+
+from django.conf import settings
+
+from .cover import default_cover_variant
+
+OutputProfile = namedtuple('OutputProfile', ['name', 'cover_variant', 'compress_level'])
+
+OUTPUT_PROFILES = {
+    'lean': OutputProfile('lean', 'low', 9),
+    # Takes PDF_COVER_VARIANT when looked up
+    'standard': OutputProfile('standard', None, 6),
+    'print': OutputProfile('print', 'max', 6),
+}
+
+
+class FlateFilter:
+    """ReportLab stream filter: zlib at a chosen compression level, without ASCII85"""
+
+    pdfname = 'FlateDecode'
+
+    def __init__(self, level):
+        self.level = level
+
+    def encode(self, text):
+        if isinstance(text, str):
+            text = text.encode('utf8')
+        return zlib.compress(text, self.level)
+
+    def decode(self, encoded):
+        return zlib.decompress(encoded)
+
+
+_filters = {profile.name: [FlateFilter(profile.compress_level)] for profile in OUTPUT_PROFILES.values()}
+
+
+def get_profile(name=None):
+    """Return the OutputProfile called `name` (default: PDF_DEFAULT_PROFILE)"""
+    name = (name or getattr(settings, 'PDF_DEFAULT_PROFILE', 'standard')).strip().lower()
+    if name not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown profile '{name}', expected one of {', '.join(OUTPUT_PROFILES)}")
+    profile = OUTPUT_PROFILES[name]
+    if profile.cover_variant is None:
+        profile = profile._replace(cover_variant=default_cover_variant())
+    return profile
+
+
+def apply_profile(pdf, profile):
+    """
+    Set up a canvas created with pageCompression=0 to compress its streams
+    as `profile` says. Streams without explicit filters (page contents, font
+    subsets, ToUnicode maps) then use the document's default filters.
+    """
+    pdf._doc.defaultStreamFilters = _filters[profile.name]
@@ -0,0 +1,298 @@
+"""
+Configurable backend that runs generate_sector_pdf (or its template-stamping
+variant, see pdf_template.py) for the views.
+
+``inline`` renders on the request thread (the original behaviour), ``thread``
+uses a thread pool and ``process`` a process pool, so one gunicorn worker can
+keep every core busy with ReportLab work. Pool backends accept at most
+``workers + max_queue`` jobs at a time; beyond that, render() fails fast with
+RenderBackendBusy so the view can answer 503 instead of piling up requests.
+
+``timeout`` bounds a render from when it starts running. A job still queued
+after ``timeout`` seconds is cancelled, also with RenderBackendBusy, so time
+spent waiting behind other renders never turns into a 504 for a job that
+never ran.
+"""
+
+import contextvars
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .timing import collect_timings, current_timings
+
+RENDER_BACKENDS = ('inline', 'thread', 'process')
+
+# How often a caller whose job is still queued checks whether it has started
+START_POLL_SECONDS = 0.05
+
+
+class RenderBackendBusy(Exception):
+    """Raised when the render queue is full"""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render job does not finish within the configured timeout"""
+
+
+def warm_worker(warm_pages=False):
+    """Load fonts, cover variants and sector config in a fresh pool process"""
+    from .cover import prepare_cover_variants
+    from .fonts import preload_fonts
+    from .sectors import sector_config
+
+    preload_fonts()
+    prepare_cover_variants()
+    sector_config.current_version()
+    if warm_pages:
+        from .warmup import warm_up
+        warm_up()
+
+
+class PDFSpool(tempfile.SpooledTemporaryFile):
+    """
+    SpooledTemporaryFile that rolls over to disk *before* buffering a write
+    that would exceed `max_size`. ReportLab writes the whole document in one
+    call, so the stock class would copy a large PDF into memory first.
+    """
+
+    def write(self, s):
+        if not self._rolled and self.tell() + len(s) > self._max_size:
+            self.rollover()
+        return super().write(s)
+
+
+def render_pdf_file(title_text, email_text, sector, ticker, spool_threshold, spool_dir=None, profile=None):
+    """Render one report into a PDFSpool and return it positioned at the start"""
+    from .pdf_template import render_sector_pdf
+
+    output = PDFSpool(max_size=spool_threshold, dir=spool_dir)
+    try:
+        return render_sector_pdf(title_text, email_text, sector, ticker, output=output, profile=profile)
+    except BaseException:
+        output.close()
+        raise
+
+
+def render_pdf_path(title_text, email_text, sector, ticker, spool_dir=None, profile=None):
+    """Render one report into a named temporary file and return its path"""
+    from .pdf_template import render_sector_pdf
+
+    fd, path = tempfile.mkstemp(suffix='.pdf', dir=spool_dir)
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            render_sector_pdf(title_text, email_text, sector, ticker, output=output, profile=profile)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def render_pdf_path_timed(title_text, email_text, sector, ticker, spool_dir=None, profile=None):
+    """render_pdf_path for a pool process: returns (path, stage timings in seconds)"""
+    with collect_timings() as timings:
+        path = render_pdf_path(title_text, email_text, sector, ticker, spool_dir, profile)
+    return path, timings.snapshot() if timings is not None else {}
+
+
+def open_rendered_path(path):
+    """Open a file produced by render_pdf_path; it is deleted once closed"""
+    output = open(path, 'rb')
+    os.remove(path)
+    return output
+
+
+def _discard_rendered_path(future):
+    if not future.cancelled() and future.exception() is None:
+        os.remove(future.result()[0])
+
+
+def _close_rendered_file(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class RenderBackend:
+    """Runs render jobs inline or on a bounded thread/process pool"""
+
+    def __init__(self, mode='inline', workers=None, max_queue=16, timeout=30, start_method='spawn',
+                 spool_threshold=1024 * 1024, spool_dir=None, warm_pages=False):
+        if mode not in RENDER_BACKENDS:
+            raise ValueError(f"Unknown render backend '{mode}', expected one of {RENDER_BACKENDS}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.start_method = start_method
+        self.spool_threshold = spool_threshold
+        self.spool_dir = spool_dir
+        self.warm_pages = warm_pages
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._queue_timeouts = 0
+        self._timeouts = 0
+        self._completed = 0
+
+    def render(self, title_text, email_text, sector, ticker, block=False, profile=None):
+        """
+        Render a report and return a readable binary file holding the PDF.
+        PDFs larger than `spool_threshold` live on disk rather than in memory;
+        either way the file is deleted when it is closed.
+
+        With block=False a full queue raises RenderBackendBusy immediately;
+        with block=True the caller waits up to `timeout` for a free slot.
+        A job that does not start within `timeout` raises RenderBackendBusy
+        too, and one that runs longer than `timeout` RenderTimeout.
+        """
+        if self.mode == 'inline':
+            return render_pdf_file(
+                title_text, email_text, sector, ticker, self.spool_threshold, self.spool_dir, profile
+            )
+
+        if not self._slots.acquire(blocking=block, timeout=self.timeout if block else None):
+            with self._counter_lock:
+                self._rejected += 1
+            raise RenderBackendBusy('Render queue is full')
+
+        try:
+            if self.mode == 'process':
+                # Hand the PDF back through the filesystem instead of pickling it
+                future = self._get_executor().submit(
+                    render_pdf_path_timed, title_text, email_text, sector, ticker, self.spool_dir, profile
+                )
+            else:
+                # Run in the caller's context, so stage timings reach its request
+                future = self._get_executor().submit(
+                    contextvars.copy_context().run,
+                    render_pdf_file, title_text, email_text, sector, ticker, self.spool_threshold, self.spool_dir,
+                    profile
+                )
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._counter_lock:
+            self._in_flight += 1
+        # The slot is held until the job really ends, even if we stop waiting
+        future.add_done_callback(self._job_done)
+
+        self._wait_until_started(future)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._counter_lock:
+                self._timeouts += 1
+            if not future.cancel():
+                future.add_done_callback(_discard_rendered_path if self.mode == 'process' else _close_rendered_file)
+            raise RenderTimeout(f'Rendering took longer than {self.timeout}s') from None
+
+        if self.mode == 'process':
+            path, stages = result
+            timings = current_timings()
+            if timings is not None:
+                timings.merge(stages)
+            return open_rendered_path(path)
+        return result
+
+    def _wait_until_started(self, future):
+        """Wait up to `timeout` for `future` to leave the queue; cancel it and raise RenderBackendBusy if it does not"""
+        # A process pool marks jobs running once they are handed to its call
+        # queue, which holds at most one job more than there are workers
+        queued_until = time.monotonic() + self.timeout
+        while not future.running() and not future.done():
+            remaining = queued_until - time.monotonic()
+            if remaining <= 0:
+                if future.cancel():
+                    with self._counter_lock:
+                        self._queue_timeouts += 1
+                    raise RenderBackendBusy(f'Render did not start within {self.timeout}s')
+                # It started just now
+                return
+            wait([future], timeout=min(remaining, START_POLL_SECONDS))
+
+    def queue_depth(self):
+        """Jobs submitted to the pool that have not finished yet"""
+        return self._in_flight
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'in_flight': self._in_flight,
+            'completed': self._completed,
+            'rejected': self._rejected,
+            'queue_timeouts': self._queue_timeouts,
+            'timeouts': self._timeouts,
+        }
+
+    def _job_done(self, future):
+        with self._counter_lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self.mode == 'process':
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context(self.start_method),
+                            initializer=warm_worker,
+                            initargs=(self.warm_pages,),
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_render_backend():
+    """Return the process-wide render backend configured in settings.py"""
+    global _backend
+    if _backend is None:
+        from django.conf import settings
+
+        with _backend_lock:
+            if _backend is None:
+                _backend = RenderBackend(
+                    mode=getattr(settings, 'PDF_RENDER_BACKEND', 'inline'),
+                    workers=getattr(settings, 'PDF_RENDER_WORKERS', None),
+                    max_queue=getattr(settings, 'PDF_RENDER_MAX_QUEUE', 16),
+                    timeout=getattr(settings, 'PDF_RENDER_TIMEOUT_SECONDS', 30),
+                    start_method=getattr(settings, 'PDF_RENDER_START_METHOD', 'spawn'),
+                    spool_threshold=getattr(settings, 'PDF_SPOOL_THRESHOLD_BYTES', 1024 * 1024),
+                    spool_dir=getattr(settings, 'PDF_SPOOL_DIR', None),
+                    warm_pages=getattr(settings, 'PDF_WARMUP_ON_STARTUP', True),
+                )
+    return _backend
+
+
+def _reset_after_fork():
+    # A pool created in a preloaded master has no threads or processes in a
+    # forked worker; each worker creates its own on first use
+    global _backend, _backend_lock
+    _backend = None
+    _backend_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
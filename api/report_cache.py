@@ -0,0 +1,232 @@
+"""
+In-process cache of finished PDF reports.
+
+Entries are keyed by the normalised request parameters, including the output
+profile, and the sector config version, and evicted by age (TTL) and
+least-recent use once the total size exceeds a byte budget.
+Reports larger than ``PDF_SPOOL_THRESHOLD_BYTES`` are never held in memory:
+render_report() returns them as a SpooledReport backed by a temporary file.
+
+With ``PDF_DISK_CACHE_DIR`` set, the shared disk cache (disk_cache.py) takes
+over: misses are written there and returned as DiskReports, whatever their
+size, so the bytes are never held in memory and hits can be sent by path.
+
+ETags are derived from what a report is rendered from (see report_etag()),
+not from its bytes, which carry a per-render creation date and file ID. Every
+worker therefore gives the same report the same ETag, cached or not.
+"""
+
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .disk_cache import DISK_CACHE_FORMAT, disk_cache
+from .profiles import get_profile
+from .sectors import sector_config
+from .ticker_data import get_ticker_data
+from .timing import stage
+
+
+class CachedReport:
+    """Finished PDF bytes together with their strong ETag"""
+
+    __slots__ = ('data', 'etag', 'created')
+
+    def __init__(self, data, etag):
+        self.data = data
+        self.etag = etag
+        self.created = time.monotonic()
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def open(self):
+        """Return a file object reading the PDF (shares the cached bytes)"""
+        return io.BytesIO(self.data)
+
+
+class SpooledReport:
+    """
+    A rendered PDF too large to cache, kept in a temporary file that is
+    deleted when closed. It can be read once, via open() or `data`.
+    """
+
+    def __init__(self, file, size, etag):
+        self.file = file
+        self.size = size
+        self.etag = etag
+
+    def open(self):
+        """Return the underlying file; the caller is responsible for closing it"""
+        return self.file
+
+    @property
+    def data(self):
+        with self.file:
+            return self.file.read()
+
+
+class ReportCache:
+    """Thread-safe LRU/TTL cache of PDF bytes with a total size budget"""
+
+    def __init__(self, max_bytes=None, ttl_seconds=None):
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_bytes(self):
+        """The byte budget given to the constructor, else PDF_CACHE_MAX_BYTES"""
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+    @property
+    def ttl_seconds(self):
+        """The TTL given to the constructor, else PDF_CACHE_TTL_SECONDS"""
+        if self._ttl_seconds is not None:
+            return self._ttl_seconds
+        return getattr(settings, 'PDF_CACHE_TTL_SECONDS', 300)
+
+    def get(self, key):
+        """Return the CachedReport for `key`, or None if missing or expired"""
+        key = (sector_config.current_version(), key)
+        ttl_seconds = self.ttl_seconds
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key, data, etag):
+        """Store `data` under `key` and return the resulting CachedReport"""
+        entry = CachedReport(data, etag)
+        if entry.size > self.max_bytes:
+            # Never cache a single report larger than the whole budget
+            return entry
+
+        # Reports rendered from an older sector config are never looked up again
+        key = (sector_config.current_version(), key)
+        max_bytes = self.max_bytes
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions,
+        }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+def stream_chunk_bytes():
+    return getattr(settings, 'PDF_STREAM_CHUNK_BYTES', 64 * 1024)
+
+
+def spool_threshold_bytes():
+    return getattr(settings, 'PDF_SPOOL_THRESHOLD_BYTES', 1024 * 1024)
+
+
+report_cache = ReportCache()
+
+
+def render_report(title_text, email_text, sector, ticker, block=False, profile=None):
+    """
+    Return (report, cache status), rendering the PDF on a cache miss. The
+    report is a DiskReport when the disk cache is enabled. Otherwise it is a
+    CachedReport, or a SpooledReport for PDFs over the spool threshold, which
+    are not cached.
+    """
+    with stage('cache'):
+        report = lookup_report(report_key(title_text, email_text, sector, ticker, profile))
+    if report is not None:
+        return report, 'HIT'
+    return render_uncached_report(title_text, email_text, sector, ticker, block=block, profile=profile), 'MISS'
+
+
+def report_key(title_text, email_text, sector, ticker, profile=None):
+    """Report cache key; profiles are resolved so the default has one entry"""
+    return (title_text, email_text, sector, ticker, get_profile(profile).name)
+
+
+def report_etag(key):
+    """
+    Strong ETag of the report for cache `key`: a hash of the key, the sector
+    config and the ticker data the report is drawn from
+    """
+    ticker = key[3]
+    ticker_info = get_ticker_data(ticker) if ticker else None
+    inputs = json.dumps([DISK_CACHE_FORMAT, sector_config.current_digest(), *key, ticker_info])
+    return '"%s"' % hashlib.sha256(inputs.encode('utf-8')).hexdigest()[:32]
+
+
+def lookup_report(key):
+    """Return the cached report for `key` from memory or disk, or None"""
+    report = report_cache.get(key)
+    if report is None and disk_cache.enabled:
+        report = disk_cache.get(key)
+    return report
+
+
+def render_uncached_report(title_text, email_text, sector, ticker, block=False, profile=None):
+    """Render a report through the render backend and cache it if it is small enough"""
+    from .render_backend import get_render_backend
+
+    key = report_key(title_text, email_text, sector, ticker, profile)
+    with stage('render'):
+        output = get_render_backend().render(title_text, email_text, sector, ticker, block=block, profile=profile)
+    if disk_cache.enabled:
+        try:
+            with stage('cache'):
+                report = disk_cache.put(key, output)
+        except OSError:
+            # Disk full or unwritable: fall back to memory for this report
+            pass
+        else:
+            output.close()
+            return report
+    size = output.seek(0, io.SEEK_END)
+    output.seek(0)
+    if size > spool_threshold_bytes():
+        return SpooledReport(output, size, report_etag(key))
+
+    with output:
+        data = output.read()
+    return report_cache.put(key, data, report_etag(key))
@@ -0,0 +1,280 @@
+"""
+Sector configuration service.
+
+``asset/sectors_config.json`` is parsed once into immutable per-sector records
+and only re-read when the file's mtime changes. A normalised lookup index maps
+capitalisation variants, common aliases and near-miss spellings onto the
+canonical sector names.
+
+Near misses are corrected word by word against the words of the indexed
+names, at most one edit per word, through a deletion index built with the
+config: a word's candidates are the vocabulary words sharing it or one of its
+single-character deletions, so correcting costs a few dict lookups per word.
+Names longer than any indexed name are not corrected at all.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from types import MappingProxyType
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SECTORS_CONFIG_PATH = os.path.join(BASE_DIR, "asset", "sectors_config.json")
+
+SectorInfo = namedtuple('SectorInfo', [
+    'name', 'description', 'key_metrics', 'subcategories',
+    'typical_companies', 'risk_factors', 'color_scheme',
+])
+
+# Alternative names clients use for the configured sectors. Sectors may also
+# list their own "aliases" in sectors_config.json.
+SECTOR_ALIASES = {
+    'tech': 'Technology',
+    'information technology': 'Technology',
+    'health care': 'Healthcare',
+    'health': 'Healthcare',
+    'financials': 'Financial',
+    'finance': 'Financial',
+    'financial services': 'Financial',
+    'consumer cyclical': 'Consumer Discretionary',
+    'consumer defensive': 'Consumer Staples',
+    'industrial': 'Industrials',
+    'basic materials': 'Materials',
+    'utility': 'Utilities',
+    'realestate': 'Real Estate',
+    'communications': 'Communication Services',
+    'telecommunications': 'Communication Services',
+    'telecom': 'Communication Services',
+}
+
+# Bound on memoised near-miss lookups and per-name fallback counters, so
+# arbitrary user input cannot grow them forever
+MAX_RESOLVED_NAMES = 1024
+# Longer names are never resolved, without even being normalised
+MAX_SECTOR_NAME_LENGTH = 100
+
+
+class SectorConfigError(Exception):
+    """Raised when sectors_config.json cannot be parsed"""
+
+
+def normalize_key(name):
+    """Lower-case `name`, treat '&' as 'and' and collapse punctuation/whitespace"""
+    name = name.lower().replace('&', ' and ')
+    return ' '.join(re.findall(r'[a-z0-9]+', name))
+
+
+def _deletions(word):
+    """`word` and every string one character shorter"""
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _within_one_edit(a, b):
+    """True if `a` becomes `b` by one insertion, deletion, substitution or adjacent swap"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    if len(a) == len(b):
+        return a[1:] == b[1:] or (a[:2] == b[1::-1] and a[2:] == b[2:])
+    return a[1:] == b or a == b[1:]
+
+
+def _record(name, info):
+    return SectorInfo(
+        name=name,
+        description=info.get("description"),
+        key_metrics=tuple(info.get("key_metrics", ())),
+        subcategories=tuple(info.get("subcategories", ())),
+        typical_companies=tuple(info.get("typical_companies", ())),
+        risk_factors=tuple(info.get("risk_factors", ())),
+        color_scheme=info.get("color_scheme"),
+    )
+
+
+class SectorConfig:
+    """Parsed sector configuration with mtime-based hot reload"""
+
+    def __init__(self, path=SECTORS_CONFIG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._sectors = MappingProxyType({})
+        self._index = {}
+        self._resolved = OrderedDict()
+        self._vocabulary = Counter()
+        self._deletion_index = {}
+        self._max_words = 0
+        self.version = 0
+        self.digest = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.fallbacks = Counter()
+
+    def sectors(self):
+        """Return a read-only mapping of canonical sector name to SectorInfo"""
+        self._refresh()
+        return self._sectors
+
+    def current_version(self):
+        """Return the config version, reloading first if the file changed"""
+        self._refresh()
+        return self.version
+
+    def current_digest(self):
+        """Return a hash of the config file's contents, the same on every host"""
+        self._refresh()
+        return self.digest
+
+    def get(self, name):
+        """Return the SectorInfo for a canonical sector name, or None"""
+        return self.sectors().get(name)
+
+    def resolve(self, name):
+        """Map a user-supplied sector name onto a canonical name, or None"""
+        self._refresh()
+        if len(name) > MAX_SECTOR_NAME_LENGTH:
+            return None
+        key = normalize_key(name)
+        canonical = self._index.get(key)
+        if canonical is not None:
+            return canonical
+
+        # Names that resolve to nothing are remembered too
+        with self._lock:
+            if key in self._resolved:
+                self._resolved.move_to_end(key)
+                return self._resolved[key]
+
+        canonical = self._index.get(self._correct(key))
+        with self._lock:
+            self._resolved[key] = canonical
+            while len(self._resolved) > MAX_RESOLVED_NAMES:
+                self._resolved.popitem(last=False)
+        return canonical
+
+    def lookup(self, name):
+        """
+        Return the SectorInfo for `name` (resolving aliases), or None.
+        Misses are counted so generic fallback pages show up in stats().
+        """
+        canonical = self.resolve(name) if name else None
+        if canonical is None:
+            if name not in self.fallbacks and len(self.fallbacks) >= MAX_RESOLVED_NAMES:
+                name = '(other)'
+            self.fallbacks[name] += 1
+            return None
+        return self._sectors.get(canonical)
+
+    def stats(self):
+        return {
+            'sectors': len(self._sectors),
+            'version': self.version,
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+            'resolved_names': len(self._resolved),
+            'fallbacks': dict(self.fallbacks),
+            'fallback_total': sum(self.fallbacks.values()),
+        }
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and self.version:
+            return
+
+        with self._lock:
+            if mtime == self._mtime and self.version:
+                return
+            self._load(mtime)
+
+    def _load(self, mtime):
+        if mtime is None:
+            # No config file: every sector uses the generic page
+            config, raw = {}, b''
+        else:
+            try:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+                config = json.loads(raw)
+            except (OSError, ValueError) as e:
+                self.reload_errors += 1
+                if self.version:
+                    # Keep serving the last good configuration
+                    self._mtime = mtime
+                    return
+                raise SectorConfigError(f"Could not load {self.path}: {e}") from e
+
+        sectors = {}
+        index = {}
+        for name, info in config.get("sectors", {}).items():
+            sectors[name] = _record(name, info)
+            index[normalize_key(name)] = name
+            for alias in info.get("aliases", ()):
+                index.setdefault(normalize_key(alias), name)
+        for alias, name in SECTOR_ALIASES.items():
+            if name in sectors:
+                index.setdefault(normalize_key(alias), name)
+
+        vocabulary = Counter(word for indexed in index for word in indexed.split())
+        deletion_index = {}
+        for word in vocabulary:
+            for deletion in _deletions(word):
+                deletion_index.setdefault(deletion, []).append(word)
+
+        self._sectors = MappingProxyType(sectors)
+        self._index = index
+        self._resolved = OrderedDict()
+        self._vocabulary = vocabulary
+        self._deletion_index = deletion_index
+        self._max_words = max((len(indexed.split()) for indexed in index), default=0)
+        self._mtime = mtime
+        self.digest = hashlib.sha256(raw).hexdigest()
+        self.version += 1
+        self.reloads += 1
+
+    def _correct(self, key):
+        """Correct each word of `key` by at most one edit against the sector vocabulary"""
+        words = key.split()
+        if len(words) > self._max_words:
+            return None
+        vocabulary = self._vocabulary
+        deletion_index = self._deletion_index
+        corrected = []
+        for word in words:
+            if word not in vocabulary:
+                candidates = {
+                    candidate
+                    for deletion in _deletions(word)
+                    for candidate in deletion_index.get(deletion, ())
+                    if _within_one_edit(word, candidate)
+                }
+                if not candidates:
+                    return None
+                # The word most indexed names use, then the first alphabetically
+                word = min(candidates, key=lambda candidate: (-vocabulary[candidate], candidate))
+            corrected.append(word)
+        return ' '.join(corrected)
+
+
+sector_config = SectorConfig()
+
+
+def normalize_sector(sector):
+    """Return the canonical name for `sector`, or its title-cased form if unknown"""
+    canonical = sector_config.resolve(sector)
+    if canonical is not None:
+        return canonical
+    return ' '.join([w.capitalize() for w in sector.split()])
+
+
+def sector_stats():
+    """Return sector configuration statistics, including fallback counts"""
+    return sector_config.stats()
@@ -1,3 +1,985 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from io import BytesIO
+from unittest import mock
+
+import jwt
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from reportlab.pdfbase import pdfmetrics
+
+from . import async_views, jobs, metrics, render_backend
+from .authentication import AuthenticationError, TokenVerifier
+from .batch import stream_report_zip
+from .disk_cache import DiskReport, DiskReportCache, disk_cache, disk_cache_stats
+from .font_fallback import FallbackFonts
+from .fonts import preload_fonts
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, format_value, label_value, stats_lines
+from .models import ReportJob
+from .pdf_generator import METHODOLOGY_CONTENT, build_sector_content, generate_sector_pdf
+from .pdf_template import ReportTemplate, TemplateCache
+from .profiles import get_profile
+from .render_backend import RenderBackend, RenderBackendBusy
+from .report_cache import CachedReport, render_report, report_cache
+from .sectors import SectorConfig, sector_config
+from .text_layout import fit_justified_text
+from .text_metrics import advance_table, fitting_font_size_for_units, text_width
+from .throttling import SharedAnonRateThrottle, ThrottledRequest, ThrottleStore
+from .ticker_data import FakeTickerBackend, TickerData, TickerDataError, TickerDataProvider
+from .views import AuthenticatedAPIView, MetricsView, byte_range, pdf_file_response, sendfile_response
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+# The shared password the module-level token verifier was built with
+PASSWORD = os.environ.get('PASSWORD', 'default_password')
+
+
+class ThrottleStoreTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        path = os.path.join(self.directory, 'throttle.sqlite3')
+        # Two stores on one file stand in for two worker processes
+        self.first = ThrottleStore(path)
+        self.second = ThrottleStore(path)
+
+    def test_window_is_shared_between_connections(self):
+        now = 6000.0
+        self.assertEqual(self.first.hit('client', 3, 60, now=now), (True, None))
+        self.assertEqual(self.second.hit('client', 3, 60, now=now + 1), (True, None))
+        self.assertEqual(self.first.hit('client', 3, 60, now=now + 2), (True, None))
+
+        allowed, wait = self.second.hit('client', 3, 60, now=now + 3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 57)
+        # Rejected requests are not counted, and other clients are unaffected
+        self.assertFalse(self.first.hit('client', 3, 60, now=now + 4)[0])
+        self.assertTrue(self.first.hit('other', 3, 60, now=now + 4)[0])
+
+    def test_previous_window_slides_out(self):
+        now = 6000.0
+        for store in (self.first, self.second, self.first, self.second):
+            self.assertTrue(store.hit('client', 4, 60, now=now)[0])
+        self.assertFalse(self.first.hit('client', 4, 60, now=now + 60)[0])
+
+        # A quarter into the next window, three of the four previous hits still count
+        self.assertTrue(self.second.hit('client', 4, 60, now=now + 75)[0])
+        self.assertFalse(self.first.hit('client', 4, 60, now=now + 75)[0])
+        # Two windows later nothing is left
+        self.assertTrue(self.first.hit('client', 4, 60, now=now + 180)[0])
+
+    def test_store_path_is_read_on_use(self):
+        path = os.path.join(self.directory, 'configured.sqlite3')
+        with override_settings(PDF_THROTTLE_DB=path):
+            self.assertEqual(ThrottleStore().path, path)
+
+    def test_store_writable_by_other_users_is_refused(self):
+        os.chmod(self.directory, 0o777)
+        with self.assertRaises(PermissionError):
+            self.first.hit('client', 3, 60)
+
+    def test_unavailable_store_rejects_requests(self):
+        os.chmod(self.directory, 0o777)
+        throttle = SharedAnonRateThrottle()
+        request = ThrottledRequest(RequestFactory().get('/api/health/'), AnonymousUser())
+        with mock.patch.object(throttle, 'store', self.first):
+            with self.assertLogs('api.throttling', 'ERROR'):
+                self.assertFalse(throttle.allow_request(request, None))
+            with override_settings(PDF_THROTTLE_FAIL_OPEN=True), self.assertLogs('api.throttling', 'ERROR'):
+                self.assertTrue(throttle.allow_request(request, None))
+        self.assertEqual(self.first.stats()['errors'], 2)
+
+
+class DiskReportCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = DiskReportCache(self.directory, max_bytes=10 ** 9, ttl_seconds=300)
+
+    def put(self, name, size=1000):
+        return self.cache.put((name,), BytesIO(b'x' * size))
+
+    def test_get_returns_what_put_stored(self):
+        self.assertIsNone(self.cache.get(('report',)))
+        stored = self.put('report')
+        found = self.cache.get(('report',))
+        self.assertEqual(found.path, stored.path)
+        self.assertEqual(found.etag, stored.etag)
+        self.assertEqual(found.data, b'x' * 1000)
+
+    def test_expired_reports_are_misses_and_swept(self):
+        report = self.put('report')
+        rendered = time.time() - 600
+        os.utime(report.path, (rendered, rendered))
+
+        self.assertIsNone(self.cache.get(('report',)))
+        self.assertEqual(self.cache.sweep(), 1)
+        self.assertFalse(os.path.exists(report.path))
+
+    def test_sweep_evicts_least_recently_used(self):
+        now = time.time()
+        reports = {name: self.put(name) for name in ('old', 'used', 'new')}
+        for name, atime in (('old', now - 30), ('used', now - 10), ('new', now - 20)):
+            os.utime(reports[name].path, (atime, now))
+
+        self.cache = DiskReportCache(self.directory, max_bytes=2500, ttl_seconds=300)
+        self.assertEqual(self.cache.sweep(now), 1)
+        self.assertIsNone(self.cache.get(('old',)))
+        self.assertIsNotNone(self.cache.get(('used',)))
+        self.assertIsNotNone(self.cache.get(('new',)))
+        self.assertEqual(self.cache.stats()['bytes'], 2000)
+
+    @override_settings(PDF_SENDFILE_HEADER='X-Accel-Redirect', PDF_SENDFILE_PREFIX='/protected-pdfs/')
+    def test_x_accel_redirect_maps_into_the_cache_directory(self):
+        report = self.put('report')
+        response = sendfile_response(report, 'Report.pdf')
+
+        uri = response['X-Accel-Redirect']
+        self.assertEqual(uri, '/protected-pdfs/' + report.relative_path.replace(os.sep, '/'))
+        self.assertEqual(os.path.join(self.directory, uri[len('/protected-pdfs/'):]), report.path)
+        self.assertEqual(response.content, b'')
+        self.assertIn('Report.pdf', response['Content-Disposition'])
+
+    @override_settings(PDF_SENDFILE_HEADER='X-Sendfile')
+    def test_x_sendfile_uses_the_file_path(self):
+        report = self.put('report')
+        self.assertEqual(sendfile_response(report, 'Report.pdf')['X-Sendfile'], report.path)
+
+    @override_settings(PDF_SENDFILE_HEADER=None)
+    def test_no_sendfile_without_header_setting(self):
+        self.assertIsNone(sendfile_response(self.put('report'), 'Report.pdf'))
+
+    def test_shared_cache_reads_its_settings_on_use(self):
+        self.assertFalse(disk_cache.enabled)
+        self.assertEqual(disk_cache_stats(), {})
+
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        with override_settings(PDF_DISK_CACHE_DIR=self.directory, PDF_DISK_CACHE_TTL_SECONDS=60):
+            self.assertEqual(disk_cache.ttl_seconds, 60)
+            report, status = render_report('Disk report', 'tests@supertype.ai', 'Technology', '')
+            self.assertEqual(status, 'MISS')
+            self.assertIsInstance(report, DiskReport)
+            self.assertTrue(report.path.startswith(self.directory))
+            self.assertEqual(render_report('Disk report', 'tests@supertype.ai', 'Technology', '')[1], 'HIT')
+            self.assertGreaterEqual(disk_cache_stats()['hits'], 1)
+
+
+class TokenVerifierTests(TestCase):
+    def setUp(self):
+        self.verifier = TokenVerifier('test-secret', 'HS256', 'shared-password')
+
+    def token(self, email='tests@supertype.ai', exp=None, secret='test-secret'):
+        exp = int(time.time()) + 60 if exp is None else exp
+        return jwt.encode({'email': email, 'exp': exp}, secret, algorithm='HS256')
+
+    def test_valid_token_is_cached(self):
+        token = self.token()
+        self.assertEqual(self.verifier.verify(f'Bearer {token}'), 'tests@supertype.ai')
+        self.assertEqual(self.verifier.verify(f'Bearer {token}'), 'tests@supertype.ai')
+        self.assertEqual(self.verifier.stats(), {'cached_tokens': 1, 'hits': 1, 'misses': 1})
+
+    def test_cached_token_is_rejected_after_its_expiry(self):
+        # PyJWT compares whole seconds
+        exp = int(time.time()) + 1
+        token = self.token(exp=exp)
+        self.assertEqual(self.verifier.verify(f'Bearer {token}'), 'tests@supertype.ai')
+        time.sleep(exp - time.time() + 0.1)
+        with self.assertRaisesMessage(AuthenticationError, 'Token has expired'):
+            self.verifier.verify(f'Bearer {token}')
+        self.assertEqual(self.verifier.stats()['cached_tokens'], 0)
+
+    def test_tampered_token_is_not_served_from_the_cache(self):
+        token = self.token()
+        self.verifier.verify(f'Bearer {token}')
+        # Another payload under the cached token's signature
+        header, payload, _ = self.token(email='intruder@example.com').split('.')
+        tampered = '.'.join([header, payload, token.split('.')[2]])
+
+        with self.assertRaises(AuthenticationError):
+            self.verifier.verify(f'Bearer {tampered}')
+        with self.assertRaises(AuthenticationError):
+            self.verifier.verify(f"Bearer {self.token(secret='other-secret')}")
+
+    def test_shared_password(self):
+        self.assertIsNone(self.verifier.verify('shared-password'))
+        self.assertIsNone(self.verifier.verify('Bearer shared-password'))
+        for header in ('wrong-password', 'Bearer wrong-password', '', 'shared-password '):
+            with self.assertRaisesMessage(AuthenticationError, 'Invalid credentials'):
+                self.verifier.verify(header)
+
+
+class BatchZipTests(TestCase):
+    def read_archive(self, chunks):
+        return zipfile.ZipFile(BytesIO(b''.join(chunks)))
+
+    def test_streams_reports_and_manifest(self):
+        specs = [{'title': 'First report'}, {'title': 'Second/report'}]
+        archive = self.read_archive(stream_report_zip(specs, lambda spec: spec['title'].encode()))
+
+        self.assertEqual(archive.namelist(), ['001-First_report.pdf', '002-Second_report.pdf', 'manifest.json'])
+        self.assertEqual(archive.read('002-Second_report.pdf'), b'Second/report')
+        reports = json.loads(archive.read('manifest.json'))['reports']
+        self.assertEqual([report['status'] for report in reports], ['ok', 'ok'])
+        self.assertEqual(reports[0]['file'], '001-First_report.pdf')
+        self.assertEqual(reports[0]['bytes'], len(b'First report'))
+
+    def test_errors_become_manifest_entries(self):
+        def render(spec):
+            if spec['title'] == 'broken':
+                raise ValueError('Unknown sector')
+            return b'%PDF'
+
+        specs = [{'title': 'fine'}, 'Missing title', {'title': 'broken'}]
+        archive = self.read_archive(stream_report_zip(specs, render))
+
+        self.assertEqual(archive.namelist(), ['001-fine.pdf', 'manifest.json'])
+        reports = json.loads(archive.read('manifest.json'))['reports']
+        self.assertEqual([report['status'] for report in reports], ['ok', 'error', 'error'])
+        self.assertEqual(reports[1]['error'], 'Missing title')
+        self.assertEqual(reports[2]['error'], 'Unknown sector')
+        self.assertEqual(reports[2]['title'], 'broken')
+
+    def test_renders_at_most_max_workers_at_once(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def render(spec):
+            with lock:
+                running.append(spec)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(spec)
+            return b'%PDF'
+
+        specs = [{'title': f'report {index}'} for index in range(12)]
+        archive = self.read_archive(stream_report_zip(specs, render, max_workers=3))
+
+        self.assertEqual(len(archive.namelist()), 13)
+        self.assertLessEqual(max(peak), 3)
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+
+    def render(self, email='tests@supertype.ai', profile=None):
+        return render_report('Sector Report', email, 'Technology', '', profile=profile)
+
+    def test_etag_is_the_same_for_every_render_of_a_report(self):
+        first, status = self.render()
+        self.assertEqual(status, 'MISS')
+        self.assertEqual(self.render()[1], 'HIT')
+
+        # As another worker would render it
+        report_cache.clear()
+        second, status = self.render()
+        self.assertEqual(status, 'MISS')
+        self.assertEqual(second.etag, first.etag)
+
+        self.assertNotEqual(self.render(email='other@supertype.ai')[0].etag, first.etag)
+        self.assertNotEqual(self.render(profile='lean')[0].etag, first.etag)
+
+    def test_settings_are_read_on_use(self):
+        self.render()
+        with override_settings(PDF_CACHE_TTL_SECONDS=-1):
+            self.assertEqual(self.render()[1], 'MISS')
+        with override_settings(PDF_CACHE_MAX_BYTES=0):
+            report_cache.clear()
+            self.render()
+            self.assertEqual(report_cache.stats()['entries'], 0)
+        self.assertEqual(self.render()[1], 'MISS')
+        self.assertEqual(self.render()[1], 'HIT')
+
+    def test_sector_config_reload_invalidates_cached_reports(self):
+        self.render()
+        version = sector_config.current_version()
+        with mock.patch.object(sector_config, 'current_version', return_value=version + 1):
+            self.assertEqual(self.render()[1], 'MISS')
+
+
+def legacy_fit_justified_text(text, font_name, max_width, max_height, initial_font_size, min_font_size, line_spacing):
+    """The word-by-word fitting loop draw_justified_text used before text_layout.py"""
+    font_size = initial_font_size
+    while font_size >= min_font_size:
+        lines = []
+        line = ''
+        for word in text.split():
+            test_line = f"{line} {word}".strip()
+            if pdfmetrics.stringWidth(test_line, font_name, font_size) <= max_width:
+                line = test_line
+            else:
+                lines.append(line)
+                line = word
+        if line:
+            lines.append(line)
+        if (font_size + line_spacing) * len(lines) <= max_height:
+            break
+        font_size -= 1
+    return max(font_size, min_font_size), lines
+
+
+class JustifiedLayoutTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        preload_fonts()
+
+    def test_matches_the_legacy_layout(self):
+        texts = [build_sector_content(sector, sector_config.get(sector)) for sector in ('Technology', 'Healthcare')]
+        texts += [METHODOLOGY_CONTENT, 'Supercalifragilisticexpialidocious ' * 3]
+        # The page box, then boxes that force the font to shrink, down to below the minimum
+        for max_width, max_height in ((464, 500), (300, 400), (180, 300), (40, 200)):
+            for text in texts:
+                with self.subTest(box=(max_width, max_height), text=text[:20]):
+                    expected = legacy_fit_justified_text(text, 'Inter', max_width, max_height, 12, 8, 3)
+                    font_size, lines = fit_justified_text(
+                        text, 'Inter', max_width, max_height, initial_font_size=12, min_font_size=8, line_spacing=3)
+                    self.assertEqual((font_size, [' '.join(words) for words, _ in lines]), expected)
+
+
+def legacy_fitting_font_size(text, font_name, max_width, initial_font_size, min_font_size):
+    """The shrinking loop draw_shrinking_text used before text_metrics.py"""
+    font_size = initial_font_size
+    while font_size >= min_font_size:
+        if pdfmetrics.stringWidth(text, font_name, font_size) <= max_width:
+            break
+        font_size -= 1
+    return max(font_size, min_font_size)
+
+
+class TextMetricsTests(TestCase):
+    texts = [
+        '', 'Sector Ticker Analysis Report', 'human@supertype.ai', 'WWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWW',
+        'Résumé – “Überblick” • 2024', 'Sector Ticker Analysis Report For Q3 ' * 4,
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        preload_fonts()
+
+    def test_widths_match_reportlab(self):
+        for font_name in ('Inter', 'Inter-Bold'):
+            for text in self.texts:
+                with self.subTest(font_name=font_name, text=text):
+                    self.assertAlmostEqual(text_width(text, font_name, 13), pdfmetrics.stringWidth(text, font_name, 13))
+
+    def test_fitting_font_size_matches_the_legacy_loop(self):
+        for text in self.texts:
+            units = advance_table('Inter-Bold').units(text)
+            # Widths at which the text fits exactly at some size are the edge cases
+            exact = [pdfmetrics.stringWidth(text, 'Inter-Bold', size) for size in (7, 12, 15)]
+            for max_width in (0, 50, 120, 200, 333, 400, 1000, *exact):
+                for initial_font_size, min_font_size in ((20, 5), (18, 10)):
+                    with self.subTest(text=text, max_width=max_width, initial_font_size=initial_font_size):
+                        self.assertEqual(
+                            fitting_font_size_for_units(units, max_width, initial_font_size, min_font_size),
+                            legacy_fitting_font_size(text, 'Inter-Bold', max_width, initial_font_size, min_font_size),
+                        )
+
+
+class SectorConfigTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'sectors_config.json')
+        self.write({
+            'Technology': {'description': 'Software and hardware'},
+            'Healthcare': {'aliases': ['Pharma']},
+            'Consumer Discretionary': {},
+        })
+        self.config = SectorConfig(self.path)
+
+    def write(self, sectors, mtime_ns=None):
+        with open(self.path, 'w') as f:
+            json.dump({'sectors': sectors}, f)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_aliases(self):
+        self.assertEqual(self.config.resolve('tech'), 'Technology')
+        self.assertEqual(self.config.resolve('Health Care'), 'Healthcare')
+        self.assertEqual(self.config.resolve('pharma'), 'Healthcare')
+
+    def test_case_whitespace_and_punctuation(self):
+        self.assertEqual(self.config.resolve('  TECHNOLOGY '), 'Technology')
+        self.assertEqual(self.config.resolve('consumer   discretionary'), 'Consumer Discretionary')
+        self.assertEqual(self.config.resolve('Consumer-Discretionary'), 'Consumer Discretionary')
+
+    def test_one_edit_corrections(self):
+        self.assertEqual(self.config.resolve('Helthcare'), 'Healthcare')
+        self.assertEqual(self.config.resolve('Tecnhology'), 'Technology')
+        self.assertEqual(self.config.resolve('Healthcarre'), 'Healthcare')
+        self.assertEqual(self.config.resolve('Consumer Discretionery'), 'Consumer Discretionary')
+
+    def test_distant_names_are_not_corrected(self):
+        for name in ('Hlthcr', 'Astrology', 'Technology Healthcare Consumer', 'x' * 101, ''):
+            with self.subTest(name=name):
+                self.assertIsNone(self.config.resolve(name))
+        # Unknown names are counted as fallbacks
+        self.assertIsNone(self.config.lookup('Astrology'))
+        self.assertEqual(self.config.stats()['fallbacks'], {'Astrology': 1})
+
+    def test_reloads_when_the_file_changes(self):
+        version, digest = self.config.current_version(), self.config.current_digest()
+        self.assertIsNone(self.config.resolve('Energy'))
+
+        mtime_ns = os.stat(self.path).st_mtime_ns + 10 ** 9
+        self.write({'Energy': {'description': 'Oil and gas'}}, mtime_ns)
+        self.assertEqual(self.config.resolve('Enrgy'), 'Energy')
+        self.assertIsNone(self.config.resolve('Technology'))
+        self.assertEqual(self.config.current_version(), version + 1)
+        self.assertNotEqual(self.config.current_digest(), digest)
+
+        # A broken file keeps the last good configuration
+        with open(self.path, 'w') as f:
+            f.write('{')
+        os.utime(self.path, ns=(mtime_ns + 10 ** 9, mtime_ns + 10 ** 9))
+        self.assertEqual(self.config.resolve('Energy'), 'Energy')
+        self.assertEqual(self.config.stats()['reload_errors'], 1)
+
+
+class TickerDataTests(TestCase):
+    def provider(self, ttl, stale_ttl):
+        backend = FakeTickerBackend()
+        provider = TickerDataProvider(backend, ttl=ttl, stale_ttl=stale_ttl)
+        self.addCleanup(provider._refresher.shutdown)
+        return provider, backend
+
+    def test_fake_backend(self):
+        found = FakeTickerBackend().fetch_many({'AAPL', 'NOPE'})
+        self.assertEqual(list(found), ['AAPL'])
+        self.assertIsInstance(found['AAPL'], TickerData)
+        self.assertEqual(found['AAPL'].name, 'Apple Inc.')
+
+        backend = FakeTickerBackend()
+        backend.fail = True
+        with self.assertRaises(TickerDataError):
+            backend.fetch_many({'AAPL'})
+
+    def test_prefetch_fetches_every_ticker_in_one_call(self):
+        provider, backend = self.provider(ttl=60, stale_ttl=60)
+        provider.prefetch(['aapl', 'MSFT ', 'NOPE', ''])
+        self.assertEqual(backend.calls, 1)
+
+        self.assertEqual(provider.get('AAPL').exchange, 'NASDAQ')
+        self.assertEqual(provider.get('msft').name, 'Microsoft Corporation')
+        # Unknown tickers are cached too
+        self.assertIsNone(provider.get('NOPE'))
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(provider.stats()['hits'], 3)
+
+    def test_stale_entry_is_served_while_it_is_refreshed(self):
+        provider, backend = self.provider(ttl=0, stale_ttl=60)
+        provider.prefetch(['AAPL'])
+        backend.records['AAPL'] = dict(backend.records['AAPL'], name='Apple')
+
+        self.assertEqual(provider.get('AAPL').name, 'Apple Inc.')
+        provider._refresher.shutdown(wait=True)
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(provider.stats()['stale_hits'], 1)
+        self.assertEqual(provider._entries['AAPL'][0].name, 'Apple')
+
+    def test_expired_entry_is_fetched_again(self):
+        provider, backend = self.provider(ttl=0, stale_ttl=0)
+        provider.prefetch(['AAPL'])
+        backend.records['AAPL'] = dict(backend.records['AAPL'], name='Apple')
+
+        self.assertEqual(provider.get('AAPL').name, 'Apple')
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(provider.stats()['misses'], 2)
+
+        # A failed fetch serves the last value instead
+        backend.fail = True
+        self.assertEqual(provider.get('AAPL').name, 'Apple')
+        self.assertEqual(provider.stats()['errors'], 1)
+
+    @override_settings(TICKER_DATA_BACKEND='fake', TICKER_DATA_TTL_SECONDS=5, TICKER_DATA_STALE_SECONDS=7)
+    def test_settings_are_read_on_use(self):
+        provider = TickerDataProvider()
+        self.addCleanup(provider._refresher.shutdown)
+        self.assertIsInstance(provider.backend, FakeTickerBackend)
+        self.assertEqual((provider.ttl, provider.stale_ttl), (5, 7))
+
+
+class RenderBackendTests(TestCase):
+    def setUp(self):
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = []
+        # Titles rendered in a fixed time instead of blocking until released
+        self.durations = {}
+        patcher = mock.patch.object(render_backend, 'render_pdf_file', self.blocking_render)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def blocking_render(self, title_text, *args):
+        self.started.append(title_text)
+        if title_text in self.durations:
+            time.sleep(self.durations[title_text])
+        else:
+            self.release.wait(5)
+        return BytesIO(b'%PDF-1.4 ' + title_text.encode())
+
+    def backend(self, **options):
+        backend = RenderBackend(mode='thread', workers=1, **options)
+        self.addCleanup(backend.shutdown)
+        return backend
+
+    def occupy(self, backend, title='running'):
+        """Start a render that blocks until self.release is set"""
+        def render():
+            try:
+                backend.render(title, '', '', '', block=True)
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=render)
+        thread.start()
+        self.addCleanup(thread.join)
+        # Cleanups run last in, first out
+        self.addCleanup(self.release.set)
+        for _ in range(100):
+            if title in self.started:
+                return
+            time.sleep(0.01)
+        self.fail('Render did not start')
+
+    def get_pdf(self, backend, title):
+        client = Client(HTTP_HOST='localhost')
+        with mock.patch.object(render_backend, '_backend', backend), \
+                mock.patch.object(AuthenticatedAPIView, 'throttle_classes', []):
+            return client.get('/api/generate-sector-pdf/', {'title': title}, HTTP_AUTHORIZATION=PASSWORD)
+
+    @override_settings(PDF_RENDER_RETRY_AFTER_SECONDS=7)
+    def test_full_queue_answers_503_with_retry_after(self):
+        backend = self.backend(max_queue=0, timeout=5)
+        self.occupy(backend)
+
+        response = self.get_pdf(backend, 'rejected')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(backend.stats()['rejected'], 1)
+        self.assertNotIn('rejected', self.started)
+
+    def test_slow_render_answers_504(self):
+        backend = self.backend(max_queue=0, timeout=0.2)
+
+        response = self.get_pdf(backend, 'slow')
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(backend.stats()['timeouts'], 1)
+        # The slot is held until the render really ends
+        self.assertEqual(backend.queue_depth(), 1)
+        self.release.set()
+        for _ in range(100):
+            if backend.queue_depth() == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(backend.queue_depth(), 0)
+
+    def test_timeout_starts_when_the_render_starts(self):
+        backend = self.backend(max_queue=1, timeout=0.4)
+        self.occupy(backend)
+        # Queued for 0.25s, then rendered in 0.25s: over the timeout in total, within it for each
+        self.durations['queued'] = 0.25
+        threading.Timer(0.25, self.release.set).start()
+        output = backend.render('queued', '', '', '', block=True)
+        self.assertEqual(output.read(), b'%PDF-1.4 queued')
+        self.assertEqual(backend.stats()['timeouts'], 0)
+
+    def test_job_that_never_starts_is_cancelled(self):
+        backend = self.backend(max_queue=1, timeout=0.2)
+        self.occupy(backend)
+
+        with self.assertRaises(RenderBackendBusy):
+            backend.render('queued', '', '', '', block=True)
+        self.assertEqual(backend.stats()['queue_timeouts'], 1)
+        self.assertEqual(backend.queue_depth(), 1)
+        self.release.set()
+        time.sleep(0.05)
+        self.assertNotIn('queued', self.started)
+
+
+class AsyncRenderTests(TestCase):
+    def setUp(self):
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = []
+        for patcher in (
+            mock.patch.object(async_views, 'render_uncached_report', self.render),
+            mock.patch.object(async_views, 'check_throttles', return_value=None),
+            mock.patch.object(async_views, '_pool', None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def render(self, title_text, *args, profile=None):
+        self.started.append(title_text)
+        if title_text == 'queued':
+            time.sleep(0.25)
+        return CachedReport(b'%PDF-1.4 ' + title_text.encode(), '"%s"' % title_text)
+
+    def occupy(self, pool, seconds=None):
+        """Hold the pool's only thread until self.release is set, or for `seconds`"""
+        pool.executor.submit(self.release.wait, seconds or 5)
+        self.addCleanup(pool.executor.shutdown)
+        # Cleanups run last in, first out
+        self.addCleanup(self.release.set)
+
+    def get_pdf(self, title):
+        client = Client(HTTP_HOST='localhost')
+        return client.get('/api/async/generate-sector-pdf/', {'title': title}, HTTP_AUTHORIZATION=PASSWORD)
+
+    @override_settings(PDF_ASYNC_RENDER_THREADS=2, PDF_RENDER_MAX_QUEUE=3)
+    def test_pool_is_built_from_settings_on_first_use(self):
+        pool = async_views.get_render_pool()
+        self.addCleanup(pool.executor.shutdown)
+        self.assertEqual(pool.threads, 2)
+        self.assertEqual(pool.max_pending, 5)
+        self.assertIs(async_views.get_render_pool(), pool)
+
+    @override_settings(PDF_RENDER_TIMEOUT_SECONDS=0.2, PDF_ASYNC_RENDER_THREADS=1, PDF_RENDER_MAX_QUEUE=1)
+    def test_render_that_never_starts_answers_503(self):
+        self.occupy(async_views.get_render_pool())
+
+        response = self.get_pdf('never')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.release.set()
+        time.sleep(0.05)
+        self.assertNotIn('never', self.started)
+
+    @override_settings(PDF_RENDER_TIMEOUT_SECONDS=0.4, PDF_ASYNC_RENDER_THREADS=1, PDF_RENDER_MAX_QUEUE=1)
+    def test_timeout_starts_when_the_render_starts(self):
+        # Queued for 0.25s, then rendered in 0.25s: over the timeout in total, within it for each
+        self.occupy(async_views.get_render_pool(), seconds=0.25)
+
+        response = self.get_pdf('queued')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'%PDF-1.4 queued')
+
+
+class MetricsTests(TestCase):
+    # A sample line of the text exposition format: name, optional labels, value
+    SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="([^"\\]|\\.)*",?)*\})? \S+$')
+
+    def setUp(self):
+        patcher = mock.patch.object(MetricsView, 'throttle_classes', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_metrics(self, **headers):
+        return Client(HTTP_HOST='localhost').get('/api/metrics/', **headers)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(label_value('plain'), 'plain')
+        self.assertEqual(label_value('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+    def test_stats_lines(self):
+        stats = {
+            'hits': 3,
+            'seconds': 0.25,
+            'ready': True,
+            'path': '/tmp/x',
+            'unknown': float('nan'),
+            'empty': {},
+            'by_sector': {'Energy': 1, 'bogus"\n': 2, 'typo': 4},
+        }
+        self.assertEqual(stats_lines('pdf_test', stats, {'Energy'}), [
+            '# TYPE pdf_test_hits untyped',
+            'pdf_test_hits 3',
+            '# TYPE pdf_test_seconds untyped',
+            'pdf_test_seconds 0.25',
+            '# TYPE pdf_test_ready untyped',
+            'pdf_test_ready 1',
+            '# TYPE pdf_test_by_sector untyped',
+            'pdf_test_by_sector{name="Energy"} 1',
+            'pdf_test_by_sector{name="other"} 6',
+        ])
+        self.assertIn('pdf_test_by_sector{name="bogus\\"\\n"} 2', stats_lines('pdf_test', stats))
+        self.assertEqual(format_value(float('inf')), '+Inf')
+
+    def test_metrics_require_the_metrics_token(self):
+        with override_settings(PDF_METRICS_TOKEN=None):
+            self.assertEqual(self.get_metrics().status_code, 403)
+            self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with override_settings(PDF_METRICS_TOKEN='scrape'):
+            self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION=PASSWORD).status_code, 403)
+            self.assertEqual(self.get_metrics(HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+    @override_settings(PDF_METRICS_TOKEN='scrape')
+    def test_exposition_format(self):
+        histograms = {'auth': ([(0.005, 1), (float('inf'), 2)], 0.0125, 2)}
+        with mock.patch.object(metrics.stage_metrics, 'snapshot', return_value=histograms):
+            response = self.get_metrics(HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response['Content-Type'], METRICS_CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE pdf_request_stage_seconds histogram', lines)
+        self.assertIn('pdf_request_stage_seconds_bucket{stage="auth",le="0.005"} 1', lines)
+        self.assertIn('pdf_request_stage_seconds_bucket{stage="auth",le="+Inf"} 2', lines)
+        self.assertIn('pdf_request_stage_seconds_sum{stage="auth"} 0.0125', lines)
+        self.assertIn('pdf_request_stage_seconds_count{stage="auth"} 2', lines)
+        self.assertIn(f'pdf_process_id {os.getpid()}', lines)
+        for line in lines:
+            if not line.startswith('#'):
+                self.assertRegex(line, self.SAMPLE)
+
+
+class ReportJobTests(TransactionTestCase):
+    def setUp(self):
+        self.job_dir = os.path.join(tempfile.mkdtemp(), 'jobs')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.job_dir))
+        # Jobs are run by the test itself
+        overrides = override_settings(PDF_JOB_DIR=self.job_dir, PDF_JOB_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.object(AuthenticatedAPIView, 'throttle_classes', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=PASSWORD)
+
+    def submit(self, title='Job report'):
+        return self.client.post('/api/jobs/', {'title': title, 'sector': 'Technology'})
+
+    def test_identical_submissions_share_a_job(self):
+        first = self.submit()
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(self.submit().json()['job_id'], first.json()['job_id'])
+        self.assertNotEqual(self.submit('Other report').json()['job_id'], first.json()['job_id'])
+
+        jobs.process_jobs(once=True)
+        # The finished job is reused while its PDF is live
+        second = self.submit()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['job_id'], first.json()['job_id'])
+        self.assertEqual(ReportJob.objects.count(), 2)
+
+    def test_download_after_the_job_finished(self):
+        job_id = self.submit().json()['job_id']
+        download_url = f'/api/jobs/{job_id}/download/'
+        self.assertEqual(self.client.get(download_url).status_code, 409)
+
+        jobs.process_jobs(once=True)
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(response['ETag'], ReportJob.objects.get(pk=job_id).etag)
+        self.assertEqual(os.stat(self.job_dir).st_mode & 0o777, 0o700)
+
+    def test_artefacts_writable_by_others_are_not_served(self):
+        job_id = self.submit().json()['job_id']
+        jobs.process_jobs(once=True)
+        os.chmod(os.path.join(self.job_dir, f'{job_id}.pdf'), 0o666)
+        with self.assertRaises(PermissionError):
+            self.client.get(f'/api/jobs/{job_id}/download/')
+
+    def test_expired_jobs_are_purged_with_their_files(self):
+        job_id = self.submit().json()['job_id']
+        with override_settings(PDF_JOB_TTL_SECONDS=0):
+            jobs.process_jobs(once=True)
+        self.assertEqual(jobs.purge_expired_jobs(), 1)
+
+        self.assertEqual(os.listdir(self.job_dir), [])
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/download/').status_code, 404)
+        self.assertNotEqual(self.submit().json()['job_id'], job_id)
+
+    def test_status_long_poll_returns_when_the_job_finishes(self):
+        job_id = self.submit().json()['job_id']
+        response = self.client.get(f'/api/jobs/{job_id}/', {'wait': 0.1})
+        self.assertEqual(response.json()['status'], ReportJob.QUEUED)
+
+        def work():
+            time.sleep(0.2)
+            jobs.process_jobs(once=True)
+            connection.close()
+
+        worker = threading.Thread(target=work)
+        worker.start()
+        self.addCleanup(worker.join)
+        started = time.monotonic()
+        response = self.client.get(f'/api/jobs/{job_id}/', {'wait': 10})
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.json()['status'], ReportJob.DONE)
+        self.assertIn('download_url', response.json())
+
+
+class ByteRangeTests(TestCase):
+    def test_parses_single_ranges(self):
+        self.assertEqual(byte_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(byte_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(byte_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(byte_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(byte_range('bytes=-5000', 1000), (0, 999))
+
+    def test_ignores_unsupported_or_malformed_ranges(self):
+        self.assertIsNone(byte_range('items=0-99', 1000))
+        self.assertIsNone(byte_range('bytes=0-1,5-9', 1000))
+        self.assertIsNone(byte_range('bytes=a-b', 1000))
+        self.assertIsNone(byte_range('bytes=50-10', 1000))
+
+    def test_rejects_unsatisfiable_ranges(self):
+        self.assertIs(byte_range('bytes=1000-', 1000), False)
+        self.assertIs(byte_range('bytes=-0', 1000), False)
+        self.assertIs(byte_range('bytes=0-', 0), False)
+
+
+class PDFFileResponseTests(TestCase):
+    data = bytes(range(256)) * 4
+    etag = '"report-1"'
+
+    def respond(self, **headers):
+        request = RequestFactory().get('/api/pdf/', **headers)
+        response = pdf_file_response(request, BytesIO(self.data), len(self.data), self.etag, 'report.pdf')
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_whole_file_without_range(self):
+        response, body = self.respond()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(body, self.data)
+
+    def test_partial_content(self):
+        response, body = self.respond(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(body, self.data[10:20])
+
+    def test_partial_content_to_end_of_file(self):
+        response, body = self.respond(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1023/{len(self.data)}')
+        self.assertEqual(body, self.data[1000:])
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.respond(HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response, body = self.respond(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"report-0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+        response, body = self.respond(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+
+
+class TemplateStampTests(TestCase):
+    title = 'Sector Ticker Analysis Report'
+    email = 'tests@supertype.ai'
+    sector = 'Technology'
+
+    def setUp(self):
+        self.profile = get_profile(None)
+        self.template = TemplateCache().get(self.sector, '', self.profile)
+
+    def stamp(self, title, email):
+        output = BytesIO()
+        stamped = self.template.stamp(title, email, output)
+        return stamped, output.getvalue()
+
+    def cover_stream(self, data):
+        template = ReportTemplate(data, (), self.profile.compress_level)
+        page = template._object(template.page_number)
+        obj = template._object(int(re.search(rb'/Contents (\d+) 0 R', page).group(1)))
+        return zlib.decompress(obj[obj.index(b'stream\n') + len(b'stream\n'):])
+
+    def test_stamped_report_is_a_valid_incremental_update(self):
+        stamped, data = self.stamp(self.title, self.email)
+        self.assertTrue(stamped)
+        self.assertTrue(data.startswith(self.template.data))
+        update = data[len(self.template.data):]
+        self.assertTrue(update.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Prev %d\n' % self.template.startxref, update)
+
+        xref = int(re.findall(rb'startxref\n(\d+)', data)[-1])
+        self.assertTrue(data[xref:].startswith(b'xref\n'))
+        entries = re.findall(rb'\n(\d+) 1\n(\d{10}) 00000 n', data[xref:])
+        self.assertEqual(len(entries), 2)
+        for number, offset in entries:
+            self.assertTrue(data[int(offset):].startswith(number + b' 0 obj'))
+
+    def test_stamped_text_matches_a_full_render(self):
+        _, data = self.stamp(self.title, self.email)
+        update = data[len(self.template.data):]
+        stamped = zlib.decompress(update[update.index(b'stream\n') + 7:update.index(b'\nendstream')])
+        full = generate_sector_pdf(self.title, self.email, self.sector, '', profile=self.profile.name).getvalue()
+
+        full_lines = self.cover_stream(full).splitlines()
+        self.assertEqual([line for line in stamped.splitlines() if line and line not in full_lines], [])
+
+    def test_text_outside_the_template_subset_is_not_stamped(self):
+        stamped, data = self.stamp('市場レポート', self.email)
+        self.assertFalse(stamped)
+        self.assertEqual(data, b'')
+
+    def test_stamped_report_reparses_like_a_full_render(self):
+        if pymupdf is None:
+            self.skipTest('PyMuPDF is not installed')
+        _, data = self.stamp(self.title, self.email)
+        full = generate_sector_pdf(self.title, self.email, self.sector, '', profile=self.profile.name).getvalue()
+
+        with pymupdf.open(stream=data, filetype='pdf') as stamped_doc, \
+                pymupdf.open(stream=full, filetype='pdf') as full_doc:
+            self.assertFalse(stamped_doc.is_repaired)
+            self.assertEqual(stamped_doc.page_count, full_doc.page_count)
+            # The stamped text is drawn last, so only the extraction order differs
+            self.assertEqual(sorted(stamped_doc[0].get_text().split()), sorted(full_doc[0].get_text().split()))
+            self.assertIn(self.email, stamped_doc[0].get_text())
+
+
+class FontFallbackTests(TestCase):
+    def setUp(self):
+        preload_fonts()
+        self.fonts = FallbackFonts()
+
+    def test_cjk_and_hangul_text_gets_cid_font_runs(self):
+        self.assertEqual(self.fonts.text_runs('Report 市場レポート', 'Inter'), (
+            ('Report ', 'Inter'), ('市場', 'STSong-Light'), ('レポート', 'HeiseiKakuGo-W5'),
+        ))
+        self.assertEqual(self.fonts.text_runs('한국 보고서', 'Inter-Bold'), (
+            ('한국', 'HYGothic-Medium'), (' ', 'Inter-Bold'), ('보고서', 'HYGothic-Medium'),
+        ))
+        self.assertEqual(self.fonts.stats()['runs'], {'STSong-Light': 1, 'HeiseiKakuGo-W5': 1, 'HYGothic-Medium': 2})
+
+    def test_cid_fonts_reach_the_pdf(self):
+        data = generate_sector_pdf('한국 市場', 'tests@supertype.ai', 'Technology', '').getvalue()
+        self.assertIn(b'/HYGothic-Medium', data)
+        self.assertIn(b'/STSong-Light', data)
+
+    def test_text_the_face_covers_skips_the_fallback_lookup(self):
+        with mock.patch.object(self.fonts, '_compile_missing', side_effect=AssertionError):
+            self.assertEqual(self.fonts.text_runs('Sector Report 2024', 'Inter'), (('Sector Report 2024', 'Inter'),))
+        self.assertEqual(self.fonts.text_runs('Café Résumé', 'Inter'), (('Café Résumé', 'Inter'),))
+        # Covered non-ASCII text never loads the fallback fonts
+        self.assertIsNone(self.fonts._fallbacks)
+        self.assertEqual(self.fonts.stats()['runs'], {})
+
+    @override_settings(PDF_FALLBACK_FONTS='HYGothic-Medium, ')
+    def test_fallback_fonts_are_read_from_settings(self):
+        fonts = FallbackFonts()
+        self.assertEqual(fonts.entries, ['HYGothic-Medium'])
+        self.assertEqual(fonts.text_runs('市場 한국', 'Inter'), (('市場 ', 'Inter'), ('한국', 'HYGothic-Medium')))
 
-# Create your tests here.
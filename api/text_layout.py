@@ -0,0 +1,121 @@
+"""
+Fit-to-box layout engine for justified paragraphs.
+
+Every word is measured once, in font units (1/1000 em) from the font's
+advance table (see text_metrics.py), and the widths are accumulated into
+running sums. Wrapping the text at a given font size is then a binary search
+per line over those sums, and the largest font size whose wrapped text fits
+in the box is itself found by binary search. Line breaks are identical to the
+original greedy word-by-word loop.
+"""
+
+from .text_metrics import advance_table
+
+
+def measure_words(words, font_name):
+    """Return the width of each word and of a space, in font units"""
+    table = advance_table(font_name)
+    return table.word_units(words), table.units(' ')
+
+
+def cumulative_widths(word_units, space_units):
+    """Running width of the first i words, counting one space after each word"""
+    totals = [0]
+    running = 0
+    for units in word_units:
+        running += units + space_units
+        totals.append(running)
+    return totals
+
+
+def wrap_words(totals, space_units, scale, max_width):
+    """
+    Greedily break words into lines no wider than max_width.
+
+    `totals` comes from cumulative_widths() and `scale` converts font units to
+    points (0.001 * font_size). Returns (start, end) word index ranges. As in
+    the original loop, a first word wider than the box produces an empty line.
+    """
+    word_count = len(totals) - 1
+    lines = []
+    start = 0
+
+    while start < word_count:
+        base = totals[start] + space_units
+        # Largest `end` whose words start..end-1 still fit on one line
+        low, high = start, word_count
+        while low < high:
+            mid = (low + high + 1) // 2
+            if scale * (totals[mid] - base) <= max_width:
+                low = mid
+            else:
+                high = mid - 1
+
+        if low == start:
+            # A word wider than the box always gets a line of its own
+            if start == 0:
+                lines.append((0, 0))
+            low = start + 1
+        lines.append((start, low))
+        start = low
+
+    return lines
+
+
+def fit_justified_text(text, font_name, max_width, max_height, initial_font_size=14, min_font_size=8, line_spacing=2):
+    """
+    Find the largest font size, stepping down by 1pt from initial_font_size,
+    at which `text` wraps into max_width and max_height.
+
+    Returns (font_size, lines) where each line is a (words, word_widths) pair
+    with widths in points. If even min_font_size overflows, the text is laid
+    out at min_font_size.
+    """
+    words = text.split()
+    word_units, space_units = measure_words(words, font_name)
+    totals = cumulative_widths(word_units, space_units)
+
+    sizes = []
+    size = initial_font_size
+    while size >= min_font_size:
+        sizes.append(size)
+        size -= 1
+    if not sizes:
+        sizes.append(initial_font_size)
+
+    def wrap(font_size):
+        return wrap_words(totals, space_units, 0.001 * font_size, max_width)
+
+    def fits(font_size, lines):
+        return (font_size + line_spacing) * len(lines) <= max_height
+
+    # Most paragraphs fit at the initial size, so try that first
+    lines = wrap(sizes[0])
+    if fits(sizes[0], lines):
+        return _measured_lines(words, word_units, sizes[0], lines)
+
+    # Taller fonts never need fewer lines, so "fits" is monotonic in size:
+    # binary search for the first (largest) remaining size that fits
+    low, high = 1, len(sizes) - 1
+    best = None
+    while low <= high:
+        mid = (low + high) // 2
+        lines = wrap(sizes[mid])
+        if fits(sizes[mid], lines):
+            best = (sizes[mid], lines)
+            high = mid - 1
+        else:
+            low = mid + 1
+
+    if best is None:
+        best = (sizes[-1], wrap(sizes[-1]))
+
+    return _measured_lines(words, word_units, *best)
+
+
+def _measured_lines(words, word_units, font_size, ranges):
+    scale = 0.001 * font_size
+    lines = []
+    for start, end in ranges:
+        lines.append((words[start:end], [scale * units for units in word_units[start:end]]))
+    return font_size, lines
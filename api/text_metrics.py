@@ -0,0 +1,108 @@
+"""
+Text measurement backed by per-font glyph advance tables.
+
+For each registered font the advance widths (in font units, 1/1000 em) of the
+first ADVANCE_TABLE_SIZE code points are copied into a flat array indexed by
+code point, so measuring a string is a single C-level ``map``/``sum`` over its
+characters instead of a dict lookup per character. Code points outside the
+table fall back to the font's own width dict. Results are identical to
+``pdfmetrics.stringWidth``.
+"""
+
+import math
+import threading
+from array import array
+
+from reportlab.pdfbase import pdfmetrics
+
+# Covers Latin, Greek, Cyrillic and General Punctuation (bullets, dashes)
+ADVANCE_TABLE_SIZE = 0x2100
+
+
+class AdvanceTable:
+    """Advance widths of one font, in font units, indexed by code point"""
+
+    def __init__(self, font_name):
+        font = pdfmetrics.getFont(font_name)
+        self.font_name = font_name
+        self._font = font
+        face = getattr(font, 'face', None)
+        char_widths = getattr(face, 'charWidths', None)
+
+        if char_widths is None:
+            # Type 1 fonts only cover a single-byte encoding; let ReportLab measure
+            self._table = None
+            return
+
+        default = face.defaultWidth
+        self._widths = char_widths
+        self._default = default
+        self._table = array('d', (char_widths.get(code, default) for code in range(ADVANCE_TABLE_SIZE)))
+        self._lookup = self._table.__getitem__
+
+    def units(self, text):
+        """Width of `text` in font units"""
+        if self._table is None:
+            return self._font.stringWidth(text, 1000)
+        try:
+            return sum(map(self._lookup, map(ord, text)))
+        except IndexError:
+            get, default, size, table = self._widths.get, self._default, ADVANCE_TABLE_SIZE, self._table
+            return sum([table[code] if code < size else get(code, default) for code in map(ord, text)])
+
+    def word_units(self, words):
+        """Widths of every word in `words`, in font units"""
+        units = self.units
+        return [units(word) for word in words]
+
+    def width(self, text, font_size):
+        """Width of `text` in points, as pdfmetrics.stringWidth computes it"""
+        return 0.001 * font_size * self.units(text)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def advance_table(font_name):
+    """Return the (cached) advance table for a registered font"""
+    table = _tables.get(font_name)
+    if table is None:
+        with _tables_lock:
+            table = _tables.get(font_name)
+            if table is None:
+                table = _tables[font_name] = AdvanceTable(font_name)
+    return table
+
+
+def text_width(text, font_name, font_size):
+    """Width of `text` in points"""
+    return advance_table(font_name).width(text, font_size)
+
+
+def fitting_font_size(text, font_name, max_width, initial_font_size, min_font_size):
+    """
+    Largest size, stepping down by 1pt from initial_font_size, at which `text`
+    fits in max_width, solved directly from the text width at 1000 units.
+    Never returns less than min_font_size.
+    """
+    return fitting_font_size_for_units(advance_table(font_name).units(text), max_width, initial_font_size, min_font_size)
+
+
+def fitting_font_size_for_units(units, max_width, initial_font_size, min_font_size):
+    """fitting_font_size() for text `units` font units wide at size 1000"""
+    if units <= 0:
+        return initial_font_size
+
+    def fits(size):
+        return 0.001 * size * units <= max_width
+
+    # Width is linear in size: initial - steps <= max_width / units * 1000
+    steps = max(0, math.ceil(initial_font_size - max_width * 1000 / units))
+    size = initial_font_size - steps
+    # Guard against rounding in the division on either side of the boundary
+    if size < initial_font_size and fits(size + 1):
+        size += 1
+    elif not fits(size):
+        size -= 1
+    return max(size, min_font_size)
@@ -0,0 +1,235 @@
+"""
+Rate limiting shared by every worker process on the host.
+
+DRF's throttles keep each client's request history in the Django cache, which
+is per-process local memory unless ``CACHES`` says otherwise: with N gunicorn
+workers a client really gets N times its rate, and the history list is
+rewritten on every request. These throttles keep one sliding-window counter
+per client in a SQLite file (``PDF_THROTTLE_DB``) instead. Each request reads
+and updates a single row, so the cost stays constant however busy the client is.
+
+The window is approximated from the current and previous fixed windows:
+``previous * (1 - elapsed / duration) + current``. Like DRF's throttles,
+rejected requests are not counted.
+
+``PDF_THROTTLE_DB`` defaults to ``.cache/throttle`` in the project directory.
+Its directory is created with mode 0700 and, like the database file, must
+not be writable by other users. If the store cannot be used, requests are
+rejected and the error is logged, unless ``PDF_THROTTLE_FAIL_OPEN`` is set.
+
+check_throttles() applies the same throttles to plain Django views, such as
+the async endpoints, which DRF does not dispatch.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+from .cache_files import is_private, private_dir
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Expired counters are deleted every this many hits in each process
+PRUNE_EVERY = 1000
+
+
+class ThrottleStore:
+    """Sliding-window request counters in a SQLite file shared between processes"""
+
+    def __init__(self, path=None, timeout=5.0):
+        self._path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._rejected = 0
+        self._errors = 0
+
+    @property
+    def path(self):
+        return self._path or throttle_db_path()
+
+    def hit(self, key, num_requests, duration, now=None):
+        """
+        Count a request for `key` if it is within `num_requests` per `duration`
+        seconds. Return (allowed, seconds to wait before retrying or None).
+        """
+        now = time.time() if now is None else now
+        window = math.floor(now / duration) * duration
+        elapsed = now - window
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_start, hits, previous_hits FROM throttle WHERE key = ?', (key,)
+            ).fetchone()
+            current = previous = 0
+            if row is not None and row[0] == window:
+                current, previous = row[1], row[2]
+            elif row is not None and row[0] == window - duration:
+                previous = row[1]
+
+            estimate = previous * (1 - elapsed / duration) + current
+            if estimate + 1 > num_requests:
+                allowed = False
+                wait = duration - elapsed
+                if previous:
+                    # When enough of the previous window has slid out
+                    until_free = duration * (previous + current + 1 - num_requests) / previous - elapsed
+                    wait = min(wait, max(until_free, 0))
+            else:
+                allowed = True
+                wait = None
+                conn.execute(
+                    'INSERT OR REPLACE INTO throttle (key, window_start, hits, previous_hits, expires) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, window, current + 1, previous, window + 2 * duration),
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._hits += 1
+            if not allowed:
+                self._rejected += 1
+            prune = self._hits % PRUNE_EVERY == 0
+        if prune:
+            self.prune(now)
+        return allowed, wait
+
+    def prune(self, now=None):
+        """Delete counters whose windows have all passed"""
+        now = time.time() if now is None else now
+        self._connection().execute('DELETE FROM throttle WHERE expires < ?', (now,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM throttle')
+
+    def record_error(self):
+        with self._lock:
+            self._errors += 1
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'hits': self._hits,
+            'rejected': self._rejected,
+            'errors': self._errors,
+        }
+
+    def _connection(self):
+        # One connection per thread, and never one inherited across fork()
+        path = self.path
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            if self._local.path == path:
+                return conn
+            # PDF_THROTTLE_DB changed since this thread connected
+            conn.close()
+
+        # Anyone who could write the database could reset their own counters
+        private_dir(os.path.dirname(os.path.abspath(path)))
+        if os.path.exists(path) and not is_private(os.stat(path)):
+            raise PermissionError(f"{path} is writable by other users")
+        conn = sqlite3.connect(path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Counters are disposable; losing the last writes in a power cut is fine
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS throttle ('
+            'key TEXT PRIMARY KEY, window_start REAL, hits INTEGER, previous_hits INTEGER, expires REAL)'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._local.path = path
+        return conn
+
+
+def throttle_db_path():
+    return getattr(settings, 'PDF_THROTTLE_DB', None) or os.path.join(
+        os.path.dirname(BASE_DIR), '.cache', 'throttle', 'throttle.sqlite3'
+    )
+
+
+throttle_store = ThrottleStore()
+
+
+class SharedRateThrottleMixin:
+    """Replaces SimpleRateThrottle's cache history with the shared ThrottleStore"""
+
+    store = throttle_store
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        try:
+            allowed, self._wait = self.store.hit(self.key, self.num_requests, self.duration)
+        except (sqlite3.Error, OSError):
+            self.store.record_error()
+            fail_open = getattr(settings, 'PDF_THROTTLE_FAIL_OPEN', False)
+            logger.exception(
+                'Throttle store %s is unavailable, %s request', self.store.path,
+                'allowing' if fail_open else 'rejecting',
+            )
+            return fail_open
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class SharedUserRateThrottle(SharedRateThrottleMixin, UserRateThrottle):
+    pass
+
+
+class SharedAnonRateThrottle(SharedRateThrottleMixin, AnonRateThrottle):
+    pass
+
+
+class ThrottledRequest:
+    """What the throttles read from a DRF request, for a plain Django request"""
+
+    def __init__(self, request, user):
+        self.META = request.META
+        self.user = user
+
+
+def check_throttles(request, user=None):
+    """
+    Run the default throttle classes as DRF would for `request`, made by the
+    authenticated `user` or anonymously. Return None if it is allowed, else
+    the Throttled exception DRF would raise.
+    """
+    throttled_request = ThrottledRequest(request, user or AnonymousUser())
+    durations = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(throttled_request, None):
+            durations.append(throttle.wait())
+    if not durations:
+        return None
+    return Throttled(max((duration for duration in durations if duration is not None), default=None))
+
+
+def throttle_stats():
+    return throttle_store.stats()
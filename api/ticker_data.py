@@ -0,0 +1,313 @@
+"""
+Ticker data provider for the ticker analysis page.
+
+Company data comes from a backend: ``supabase`` (one shared client per
+process, so HTTP connections are pooled and reused), ``fake`` (in-memory
+sample data for offline development and tests) or ``none`` (no data; the
+page keeps its placeholders). Results are cached in memory per ticker.
+Fresh entries are served directly. Entries past ``ttl`` but within
+``stale_ttl`` are served immediately while one background refresh runs.
+Anything older is fetched again, batching every missing ticker of a request
+into a single backend call.
+
+``TICKER_DATA_BACKEND`` (default ``none``), ``SUPABASE_URL``/``SUPABASE_KEY``,
+``TICKER_DATA_TABLE``, ``TICKER_DATA_TTL_SECONDS`` and
+``TICKER_DATA_STALE_SECONDS`` are read from settings.py when first used.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Percentages are fractions (0.12 means 12%); market_cap is in the listing currency
+TickerData = namedtuple('TickerData', [
+    'ticker', 'name', 'exchange', 'market_cap', 'industry', 'listing_date',
+    'revenue_growth', 'profit_margin', 'return_on_equity', 'debt_to_equity', 'pe_ratio',
+])
+
+TICKER_BACKENDS = ('none', 'fake', 'supabase')
+
+# Bound on cached tickers, so arbitrary user input cannot grow the cache forever
+MAX_TICKERS = 4096
+
+
+class TickerDataError(Exception):
+    """Raised by a backend when ticker data cannot be fetched"""
+
+
+def normalize_ticker(ticker):
+    return ticker.strip().upper()
+
+
+def _record(ticker, row):
+    return TickerData(ticker=ticker, **{field: row.get(field) for field in TickerData._fields if field != 'ticker'})
+
+
+class NullTickerBackend:
+    """Backend used when no data source is configured"""
+
+    def fetch_many(self, tickers):
+        return {}
+
+
+class FakeTickerBackend:
+    """In-memory backend with sample data, for offline development and tests"""
+
+    SAMPLE_DATA = {
+        'AAPL': {
+            'name': 'Apple Inc.', 'exchange': 'NASDAQ', 'market_cap': 3.0e12,
+            'industry': 'Consumer Electronics', 'listing_date': '1980-12-12',
+            'revenue_growth': 0.02, 'profit_margin': 0.24, 'return_on_equity': 1.47,
+            'debt_to_equity': 1.8, 'pe_ratio': 31.5,
+        },
+        'MSFT': {
+            'name': 'Microsoft Corporation', 'exchange': 'NASDAQ', 'market_cap': 3.1e12,
+            'industry': 'Software', 'listing_date': '1986-03-13',
+            'revenue_growth': 0.16, 'profit_margin': 0.36, 'return_on_equity': 0.37,
+            'debt_to_equity': 0.3, 'pe_ratio': 35.2,
+        },
+        'BBCA': {
+            'name': 'Bank Central Asia Tbk.', 'exchange': 'IDX', 'market_cap': 1.2e15,
+            'industry': 'Banks', 'listing_date': '2000-05-31',
+            'revenue_growth': 0.08, 'profit_margin': 0.47, 'return_on_equity': 0.21,
+            'debt_to_equity': 0.0, 'pe_ratio': 24.1,
+        },
+    }
+
+    def __init__(self, records=None, latency=0.0):
+        self.records = dict(self.SAMPLE_DATA if records is None else records)
+        self.latency = latency
+        self.calls = 0
+        self.fail = False
+
+    def fetch_many(self, tickers):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise TickerDataError('Fake backend failure')
+        return {ticker: _record(ticker, self.records[ticker]) for ticker in tickers if ticker in self.records}
+
+
+class SupabaseTickerBackend:
+    """Reads company rows from a Supabase table through one shared client"""
+
+    def __init__(self, url, key, table='companies', symbol_column='symbol', timeout=5):
+        self.url = url
+        self.key = key
+        self.table = table
+        self.symbol_column = symbol_column
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        """Create the supabase client on first use and share it afterwards"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import ClientOptions, create_client
+
+                    self._client = create_client(
+                        self.url, self.key, options=ClientOptions(postgrest_client_timeout=self.timeout)
+                    )
+        return self._client
+
+    def reset_after_fork(self):
+        # The client's pooled connections belong to the parent process
+        self._client = None
+        self._lock = threading.Lock()
+
+    def fetch_many(self, tickers):
+        columns = ','.join([self.symbol_column] + [f for f in TickerData._fields if f != 'ticker'])
+        try:
+            response = (
+                self.client().table(self.table)
+                .select(columns)
+                .in_(self.symbol_column, list(tickers))
+                .execute()
+            )
+        except Exception as e:
+            raise TickerDataError(f'Supabase query failed: {e}') from e
+
+        results = {}
+        for row in response.data:
+            ticker = normalize_ticker(str(row.get(self.symbol_column, '')))
+            if ticker in tickers:
+                results[ticker] = _record(ticker, row)
+        return results
+
+
+class TickerDataProvider:
+    """
+    TTL cache with stale-while-revalidate in front of a ticker backend. The
+    backend, `ttl` and `stale_ttl` default to the TICKER_DATA_* settings.
+    """
+
+    def __init__(self, backend=None, ttl=None, stale_ttl=None):
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        # ticker -> (TickerData or None, fetched_at)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ticker-refresh')
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._fetches = 0
+        self._errors = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = make_backend(getattr(settings, 'TICKER_DATA_BACKEND', 'none'))
+        return self._backend
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'TICKER_DATA_TTL_SECONDS', 300)
+
+    @property
+    def stale_ttl(self):
+        if self._stale_ttl is not None:
+            return self._stale_ttl
+        return getattr(settings, 'TICKER_DATA_STALE_SECONDS', 3600)
+
+    def get(self, ticker):
+        """Return the TickerData for `ticker`, or None if it is unknown or unavailable"""
+        if not ticker:
+            return None
+        ticker = normalize_ticker(ticker)
+        return self.get_many([ticker]).get(ticker)
+
+    def get_many(self, tickers):
+        """Return {ticker: TickerData or None}, fetching all missing tickers in one call"""
+        tickers = {normalize_ticker(t) for t in tickers if t}
+        now = time.monotonic()
+        ttl, stale_ttl = self.ttl, self.stale_ttl
+        results = {}
+        missing = []
+        stale = []
+
+        with self._lock:
+            for ticker in tickers:
+                entry = self._entries.get(ticker)
+                age = now - entry[1] if entry is not None else None
+                if age is not None and age < ttl:
+                    self._hits += 1
+                    results[ticker] = entry[0]
+                elif age is not None and age < ttl + stale_ttl:
+                    self._stale_hits += 1
+                    results[ticker] = entry[0]
+                    if ticker not in self._refreshing:
+                        self._refreshing.add(ticker)
+                        stale.append(ticker)
+                else:
+                    self._misses += 1
+                    missing.append(ticker)
+
+        if stale:
+            self._refresher.submit(self._refresh, stale)
+        if missing:
+            results.update(self._fetch(missing))
+        return results
+
+    def prefetch(self, tickers):
+        """Load several tickers into the cache in one backend call"""
+        self.get_many(tickers)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_after_fork(self):
+        """Give a forked worker its own locks, refresh thread and backend connections"""
+        self._lock = threading.Lock()
+        self._backend_lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ticker-refresh')
+        if hasattr(self._backend, 'reset_after_fork'):
+            self._backend.reset_after_fork()
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self._entries),
+            'hits': self._hits,
+            'stale_hits': self._stale_hits,
+            'misses': self._misses,
+            'fetches': self._fetches,
+            'errors': self._errors,
+        }
+
+    def _fetch(self, tickers):
+        self._fetches += 1
+        try:
+            found = self.backend.fetch_many(tickers)
+        except TickerDataError:
+            self._errors += 1
+            # Serve whatever we still have rather than failing the report
+            with self._lock:
+                return {t: self._entries[t][0] if t in self._entries else None for t in tickers}
+
+        fetched_at = time.monotonic()
+        results = {ticker: found.get(ticker) for ticker in tickers}
+        with self._lock:
+            for ticker, data in results.items():
+                # Unknown tickers are cached too, so they are not looked up on every request
+                self._entries.pop(ticker, None)
+                self._entries[ticker] = (data, fetched_at)
+            while len(self._entries) > MAX_TICKERS:
+                # Oldest fetch first
+                del self._entries[next(iter(self._entries))]
+        return results
+
+    def _refresh(self, tickers):
+        try:
+            self._fetch(tickers)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(tickers)
+
+
+def make_backend(name):
+    """Build the ticker backend called `name` from settings.py"""
+    if name not in TICKER_BACKENDS:
+        raise ValueError(f"Unknown ticker data backend '{name}', expected one of {TICKER_BACKENDS}")
+    if name == 'fake':
+        return FakeTickerBackend()
+    if name == 'supabase':
+        return SupabaseTickerBackend(
+            url=getattr(settings, 'SUPABASE_URL', None),
+            key=getattr(settings, 'SUPABASE_KEY', None),
+            table=getattr(settings, 'TICKER_DATA_TABLE', 'companies'),
+            symbol_column=getattr(settings, 'TICKER_DATA_SYMBOL_COLUMN', 'symbol'),
+            timeout=getattr(settings, 'TICKER_DATA_TIMEOUT_SECONDS', 5),
+        )
+    return NullTickerBackend()
+
+
+ticker_data = TickerDataProvider()
+
+if hasattr(os, 'register_at_fork'):
+    # Cached entries stay shared with the parent (e.g. gunicorn --preload)
+    os.register_at_fork(after_in_child=ticker_data.reset_after_fork)
+
+
+def get_ticker_data(ticker):
+    return ticker_data.get(ticker)
+
+
+def ticker_data_stats():
+    return ticker_data.stats()
@@ -0,0 +1,183 @@
+"""
+Per-stage timing of PDF requests.
+
+A view opens a collector with ``collect_timings()``. Code on the request path
+then wraps its work in ``with stage('cover'):``, and each stage's duration is
+added to the request's Timings. Views send them back in a ``Server-Timing``
+header and add them to the process-wide histograms served by ``/api/metrics/``.
+
+Outside a collector (batch renders, background jobs, warm-up), or with
+``PDF_TIMING_ENABLED=False``, stage() returns a shared no-op context manager,
+so a hook costs one context variable lookup. The collector is a context
+variable, so it follows asyncio tasks. Render pools propagate it themselves
+(see render_backend.py).
+"""
+
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('pdf_timings', default=None)
+
+
+class Timings:
+    """Seconds spent in each stage of one request, in the order stages were first seen"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        # Render pool threads add stages while the request thread may be reading
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, stages):
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stages)
+
+    def server_timing(self):
+        """Value for a Server-Timing header"""
+        return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.snapshot().items())
+
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Context manager timing stage `name` of the current request, if one is being timed"""
+    timings = _current.get()
+    if timings is None:
+        return NULL_STAGE
+    return _Stage(timings, name)
+
+
+def current_timings():
+    return _current.get()
+
+
+class collect_timings:
+    """Time the stages run inside the block; `as` gives the Timings, or None when disabled"""
+
+    def __init__(self):
+        self.timings = None
+        self._token = None
+
+    def __enter__(self):
+        if getattr(settings, 'PDF_TIMING_ENABLED', True):
+            self.timings = Timings()
+            self._token = _current.set(self.timings)
+        return self.timings
+
+    def __exit__(self, *exc_info):
+        if self._token is not None:
+            _current.reset(self._token)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        """[(upper bound, observations at or below it)], ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((float('inf'), self.count))
+        return result
+
+
+class StageMetrics:
+    """Per-stage duration histograms aggregated over every timed request"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, timings):
+        stages = timings.snapshot()
+        with self._lock:
+            for name, seconds in stages.items():
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+    def snapshot(self):
+        """{stage: ([(upper bound, cumulative count)], sum, count)}"""
+        with self._lock:
+            return {
+                name: (histogram.cumulative(), histogram.sum, histogram.count)
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+stage_metrics = StageMetrics()
+
+
+def record_timings(timings):
+    """Add a finished request's timings to the histograms"""
+    stage_metrics.observe(timings)
+
+
+def finish_timings(response, timings, started):
+    """Add the request's total time, send the stages as Server-Timing and record them"""
+    if timings is None:
+        return response
+    timings.add('total', time.perf_counter() - started)
+    response['Server-Timing'] = timings.server_timing()
+    record_timings(timings)
+    return response
@@ -1,10 +1,24 @@
 from django.urls import path
-from .views import SectorTickerPDFAPIView, SupertypeTokenView, HealthCheckView, DebugConfigView
+from . import async_views
+from .views import (
+    SectorTickerPDFAPIView, SectorTickerPDFBatchAPIView, SupertypeTokenView, HealthCheckView, DebugConfigView,
+    MetricsView, ReadinessView,
+    ReportJobSubmitAPIView, ReportJobStatusAPIView, ReportJobDownloadAPIView,
+)
 
 urlpatterns = [
     path('', HealthCheckView.as_view(), name='health-check'),
     path('health/', HealthCheckView.as_view(), name='health-check-alt'),
+    path('ready/', ReadinessView.as_view(), name='readiness'),
     path('debug/', DebugConfigView.as_view(), name='debug-config'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('generate-sector-pdf/', SectorTickerPDFAPIView.as_view(), name='generate-sector-pdf'),
+    path('generate-sector-pdf/batch/', SectorTickerPDFBatchAPIView.as_view(), name='generate-sector-pdf-batch'),
+    path('jobs/', ReportJobSubmitAPIView.as_view(), name='report-job-submit'),
+    path('jobs/<uuid:job_id>/', ReportJobStatusAPIView.as_view(), name='report-job-status'),
+    path('jobs/<uuid:job_id>/download/', ReportJobDownloadAPIView.as_view(), name='report-job-download'),
     path('token/', SupertypeTokenView.as_view(), name='api_token_auth'),
+    # Native async variants, for ASGI servers such as uvicorn
+    path('async/generate-sector-pdf/', async_views.sector_ticker_pdf_view, name='generate-sector-pdf-async'),
+    path('async/token/', async_views.token_view, name='api_token_auth_async'),
 ]
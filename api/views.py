@@ -1,15 +1,30 @@
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from django.http import HttpResponse
-from .pdf_generator import generate_sector_pdf  # Adjust import path accordingly
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header, parse_etags
+from .authentication import MetricsTokenPermission, SupertypeAuthentication
+from .report_cache import render_report, stream_chunk_bytes
+from .sectors import normalize_sector
+from .batch import stream_report_zip
+from .disk_cache import DiskReport
+from .jobs import open_artefact, submit_job, wait_for_job
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from .models import ReportJob
+from .profiles import get_profile
+from .render_backend import RenderBackendBusy, RenderTimeout
+from .ticker_data import ticker_data
+from .timing import collect_timings, finish_timings, stage
+from .warmup import readiness
 import jwt
 import datetime
+import hmac
 import sys
+import time
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
 import os
-from dotenv import load_dotenv
-load_dotenv()
 
 class HealthCheckView(APIView):
     """Simple health check endpoint"""
@@ -29,6 +44,15 @@ class HealthCheckView(APIView):
             'environment': env_status
         })
 
+class ReadinessView(APIView):
+    """Readiness probe: 200 once this worker is warmed up and can take renders, else 503"""
+    # Probes must never be throttled, nor count against their host's limit
+    throttle_classes = []
+
+    def get(self, request):
+        ready, details = readiness()
+        return Response(details, status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
 class DebugConfigView(APIView):
     """Debug endpoint to check configuration"""
     def get(self, request):
@@ -41,75 +65,317 @@ class DebugConfigView(APIView):
             'current_working_directory': os.getcwd()
         })
 
+class MetricsView(APIView):
+    """Prometheus metrics: request stage timings and cache counters of this process"""
+    authentication_classes = []
+    permission_classes = [MetricsTokenPermission]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+def issue_token(email, password):
+    """Return (response data, HTTP status) for a token request"""
+    if not email or not password:
+        return {'detail': 'Email and password required'}, status.HTTP_400_BAD_REQUEST
+
+    if not email.endswith('@supertype.ai'):
+        return {'detail': 'Unauthorized email domain'}, status.HTTP_401_UNAUTHORIZED
+
+    # Debug: Check if PASSWORD environment variable is set
+    env_password = os.environ.get('PASSWORD')
+    if not env_password:
+        return {'detail': 'Server configuration error: PASSWORD not set'}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    if not hmac.compare_digest(str(password).encode('utf-8'), env_password.encode('utf-8')):
+        return {'detail': 'Invalid credentials'}, status.HTTP_401_UNAUTHORIZED
+
+    # Debug: Check if JWT_SECRET is set
+    jwt_secret = getattr(settings, 'JWT_SECRET', None) or os.environ.get('JWT_SECRET')
+    if not jwt_secret:
+        return {'detail': 'Server configuration error: JWT_SECRET not set'}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    payload = {
+        'email': email,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.JWT_EXP_DELTA_SECONDS)
+    }
+    token = jwt.encode(payload, jwt_secret, algorithm=settings.JWT_ALGORITHM)
+
+    return {'token': token}, status.HTTP_200_OK
+
+
 class SupertypeTokenView(APIView):
     def post(self, request):
-        email = request.data.get('email')
-        password = request.data.get('password')
+        data, status_code = issue_token(request.data.get('email'), request.data.get('password'))
+        return Response(data, status=status_code)
 
-        if not email or not password:
-            return Response({'detail': 'Email and password required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not email.endswith('@supertype.ai'):
-            return Response({'detail': 'Unauthorized email domain'}, status=status.HTTP_401_UNAUTHORIZED)
+class AuthenticatedAPIView(APIView):
+    """Base view for endpoints that need a JWT or the shared password"""
+    authentication_classes = [SupertypeAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        # Debug: Check if PASSWORD environment variable is set
-        env_password = os.environ.get('PASSWORD')
-        if not env_password:
-            return Response({'detail': 'Server configuration error: PASSWORD not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    def perform_authentication(self, request):
+        with stage('auth'):
+            super().perform_authentication(request)
 
-        if password != env_password:
-            return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+    def check_throttles(self, request):
+        with stage('throttle'):
+            super().check_throttles(request)
 
-        # Debug: Check if JWT_SECRET is set
-        jwt_secret = getattr(settings, 'JWT_SECRET', None) or os.environ.get('JWT_SECRET')
-        if not jwt_secret:
-            return Response({'detail': 'Server configuration error: JWT_SECRET not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        payload = {
-            'email': email,
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.JWT_EXP_DELTA_SECONDS)
-        }
-        token = jwt.encode(payload, jwt_secret, algorithm=settings.JWT_ALGORITHM)
+def report_params(params):
+    """
+    Read title, email, sector, ticker and output profile from a query dict or
+    batch spec. Raises ValueError for an unknown profile.
+    """
+    title_text = params.get('title', 'Sector Ticker Analysis Report')
+    email_text = params.get('email', 'human@supertype.ai')
+    sector = params.get('sector', '')
+    ticker = params.get('ticker', '')
+    profile = get_profile(params.get('profile') or None).name
+
+    if sector:
+        sector = normalize_sector(sector)
+    return title_text, email_text, sector, ticker, profile
 
-        return Response({'token': token})
 
+class SectorTickerPDFAPIView(AuthenticatedAPIView):
+    def dispatch(self, request, *args, **kwargs):
+        # Times authentication and throttling too, which run before get()
+        started = time.perf_counter()
+        with collect_timings() as timings:
+            response = super().dispatch(request, *args, **kwargs)
+        return finish_timings(response, timings, started)
 
-class SectorTickerPDFAPIView(APIView):
     def get(self, request):
-        auth_header = request.headers.get('Authorization', '')
-        
-        # Handle both Bearer token and direct password authentication
-        if auth_header.startswith('Bearer '):
-            token = auth_header.replace('Bearer ', '')
-            try:
-                # Try to decode JWT token first
-                payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-                # Token is valid, proceed with PDF generation
-            except jwt.ExpiredSignatureError:
-                return Response({'detail': 'Token has expired'}, status=status.HTTP_401_UNAUTHORIZED)
-            except jwt.InvalidTokenError:
-                # If JWT fails, try direct password comparison
-                if token != os.environ.get('PASSWORD', 'default_password'):
-                    return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
-        else:
-            # No Bearer token, check for direct password
-            token = auth_header
-            if token != os.environ.get('PASSWORD', 'default_password'):
-                return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
-
-        title_text = request.GET.get('title', 'Sector Ticker Analysis Report')
-        email_text = request.GET.get('email', 'human@supertype.ai')
-        sector = request.GET.get('sector', '')
-        ticker = request.GET.get('ticker', '')
-        
-        if sector:
-            sector = sector.strip()
-            sector = ' '.join([w.capitalize() for w in sector.split()])
+        try:
+            title_text, email_text, sector, ticker, profile = report_params(request.GET)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            pdf_buffer = generate_sector_pdf(title_text, email_text, sector, ticker)
-            response = HttpResponse(pdf_buffer, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{title_text}.pdf"'
+            report, cache_status = render_report(title_text, email_text, sector, ticker, profile=profile)
+        except RenderBackendBusy:
+            response = Response({'detail': 'Server is busy, please retry shortly'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(getattr(settings, 'PDF_RENDER_RETRY_AFTER_SECONDS', 5))
             return response
+        except RenderTimeout as e:
+            return Response({'detail': str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
         except Exception as e:
             return Response({'detail': f'PDF generation failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if report.etag in if_none_match or '*' in if_none_match:
+            if not isinstance(report, DiskReport):
+                # Closes a spooled report's temporary file
+                report.open().close()
+            response = HttpResponseNotModified()
+        else:
+            filename = f"{title_text}.pdf"
+            response = sendfile_response(report, filename) or pdf_file_response(
+                request, report.open(), report.size, report.etag, filename
+            )
+        response['ETag'] = report.etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Cache'] = cache_status
+        return response
+
+
+def sendfile_response(report, filename):
+    """
+    Empty response telling the front proxy to send a disk-cached report
+    itself (PDF_SENDFILE_HEADER), or None when that is not possible.
+    """
+    header = getattr(settings, 'PDF_SENDFILE_HEADER', None)
+    if not header or not isinstance(report, DiskReport):
+        return None
+    if header == 'X-Accel-Redirect':
+        # nginx maps this URI onto PDF_DISK_CACHE_DIR with an internal location
+        prefix = getattr(settings, 'PDF_SENDFILE_PREFIX', '/protected-pdfs/')
+        value = prefix.rstrip('/') + '/' + report.relative_path.replace(os.sep, '/')
+    else:
+        value = report.path
+    response = HttpResponse(content_type='application/pdf')
+    response[header] = value
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def byte_range(header, size):
+    """
+    (start, end) of a single 'bytes=' Range header, inclusive; None to ignore
+    the header and send the whole file, False if it cannot be satisfied.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        # Multipart ranges are not worth supporting for PDFs
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            return (max(size - length, 0), size - 1) if 0 < length and size else False
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def pdf_file_response(request, pdf_file, size, etag, filename):
+    """
+    Send the PDF in `pdf_file`, honouring a single byte range so interrupted
+    downloads can resume. Streamed in chunks; servers with wsgi.file_wrapper
+    use sendfile for files on disk.
+    """
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    requested = byte_range(header, size) if header and (not if_range or if_range == etag) else None
+    if requested is False:
+        pdf_file.close()
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if requested is None or requested[1] == size - 1:
+        if requested is not None:
+            pdf_file.seek(requested[0])
+        # FileResponse sets Content-Length from the current position
+        response = FileResponse(pdf_file, content_type='application/pdf', as_attachment=True, filename=filename)
+        response.block_size = stream_chunk_bytes()
+    else:
+        with pdf_file:
+            pdf_file.seek(requested[0])
+            data = pdf_file.read(requested[1] - requested[0] + 1)
+        response = HttpResponse(data, content_type='application/pdf')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    if requested is not None:
+        response.status_code = status.HTTP_206_PARTIAL_CONTENT
+        response['Content-Range'] = f'bytes {requested[0]}-{requested[1]}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+class SectorTickerPDFBatchAPIView(AuthenticatedAPIView):
+    """Render many reports in one request and stream them back as a ZIP"""
+    def post(self, request):
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('reports')
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Expected a non-empty list of report specs'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_items = getattr(settings, 'PDF_BATCH_MAX_ITEMS', 200)
+        if len(items) > max_items:
+            return Response({'detail': f'At most {max_items} reports per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        specs = []
+        for item in items:
+            if not isinstance(item, dict):
+                specs.append('Report spec must be an object')
+                continue
+            # JSON nulls fall back to the defaults, other values are used as text
+            item = {key: str(value) for key, value in item.items() if value is not None}
+            try:
+                title_text, email_text, sector, ticker, profile = report_params(item)
+            except ValueError as e:
+                specs.append(str(e))
+                continue
+            specs.append({'title': title_text, 'email': email_text, 'sector': sector, 'ticker': ticker,
+                          'profile': profile})
+
+        # One round trip for the whole batch's company data (in-process render backends)
+        ticker_data.prefetch([spec['ticker'] for spec in specs if isinstance(spec, dict)])
+
+        def render(spec):
+            report, _ = render_report(spec['title'], spec['email'], spec['sector'], spec['ticker'], block=True,
+                                      profile=spec['profile'])
+            return report.data
+
+        response = StreamingHttpResponse(
+            stream_report_zip(specs, render, max_workers=getattr(settings, 'PDF_BATCH_WORKERS', 4)),
+            content_type='application/zip'
+        )
+        response['Content-Disposition'] = 'attachment; filename="reports.zip"'
+        return response
+
+
+def job_payload(request, job):
+    """Status document returned by the job endpoints"""
+    payload = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'title': job.title,
+        'sector': job.sector,
+        'ticker': job.ticker,
+        'profile': job.profile,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'status_url': request.build_absolute_uri(reverse('report-job-status', args=[job.id])),
+    }
+    if job.status == ReportJob.DONE:
+        payload['download_url'] = request.build_absolute_uri(reverse('report-job-download', args=[job.id]))
+        payload['bytes'] = job.size
+    elif job.status == ReportJob.FAILED:
+        payload['error'] = job.error
+    return payload
+
+
+class ReportJobSubmitAPIView(AuthenticatedAPIView):
+    """Queue a report for background generation and return its job id"""
+    def post(self, request):
+        params = request.data if isinstance(request.data, dict) else {}
+        params = {key: str(value) for key, value in params.items() if value is not None}
+        try:
+            title_text, email_text, sector, ticker, profile = report_params(params)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        job, created = submit_job(title_text, email_text, sector, ticker, profile)
+
+        payload = job_payload(request, job)
+        response = Response(
+            payload,
+            status=status.HTTP_200_OK if job.status == ReportJob.DONE else status.HTTP_202_ACCEPTED
+        )
+        response['Location'] = payload['status_url']
+        return response
+
+
+class ReportJobStatusAPIView(AuthenticatedAPIView):
+    """Report a job's status; `?wait=N` long-polls up to N seconds for completion"""
+    def get(self, request, job_id):
+        try:
+            wait = float(request.GET.get('wait', 0))
+        except ValueError:
+            return Response({'detail': 'wait must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+        wait = max(0, min(wait, getattr(settings, 'PDF_JOB_MAX_WAIT_SECONDS', 30)))
+
+        job = wait_for_job(job_id, wait)
+        if job is None:
+            return Response({'detail': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job_payload(request, job))
+
+
+class ReportJobDownloadAPIView(AuthenticatedAPIView):
+    """Download the PDF produced by a finished job"""
+    def get(self, request, job_id):
+        job = ReportJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'detail': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.status != ReportJob.DONE:
+            return Response(job_payload(request, job), status=status.HTTP_409_CONFLICT)
+
+        try:
+            pdf_file = open_artefact(job)
+        except FileNotFoundError:
+            return Response({'detail': 'Report has expired'}, status=status.HTTP_410_GONE)
+
+        size = os.fstat(pdf_file.fileno()).st_size
+        response = pdf_file_response(request, pdf_file, size, job.etag, f"{job.title}.pdf")
+        response['ETag'] = job.etag
+        return response
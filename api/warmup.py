@@ -0,0 +1,328 @@
+"""
+Warm-up of the render caches for the most requested reports.
+
+The ``typical_companies`` of every sector in ``sectors_config.json`` are the
+tickers users ask for most. warm_up() fetches their data in one bulk call,
+records their ticker pages and every sector page in the fragment cache,
+renders one representative report so ReportLab's first-call costs are paid
+and, optionally, renders the full reports with the default title and email
+into the report cache.
+
+Each web process warms its own in-memory caches: at startup in the
+background, then every ``PDF_WARMUP_INTERVAL_SECONDS`` (see WarmupScheduler).
+A separate process cannot reach those caches, so ``python manage.py warm_up``
+runs warm_shared_caches() instead: it fills only the caches kept on disk and
+shared with the workers (parsed fonts, themed covers and, with
+``PDF_DISK_CACHE_DIR``, finished reports).
+
+With ``gunicorn --preload`` the master warms the caches before forking and
+the workers share them copy-on-write. A fork waits for a running warm-up to
+finish, so no worker inherits a cache lock held by the warm-up thread, and
+each worker's schedule starts where the master's left off.
+
+A worker is ready once its first warm-up has finished; ``/api/ready/``
+reports that (see readiness()) so load balancers only route to warm workers.
+"""
+
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .sectors import sector_config
+from .ticker_data import ticker_data
+
+WARMUP_TITLE = 'Sector Ticker Analysis Report'
+WARMUP_EMAIL = 'warmup@supertype.ai'
+
+
+def warmup_targets(sectors=None):
+    """Return [(sector, tickers)] for `sectors` (names or aliases), default all"""
+    configured = sector_config.sectors()
+    if sectors:
+        names = []
+        for name in sectors:
+            canonical = sector_config.resolve(name)
+            if canonical is None:
+                raise ValueError(f"Unknown sector '{name}'")
+            names.append(canonical)
+    else:
+        names = list(configured)
+    return [(name, list(configured[name].typical_companies)) for name in names]
+
+
+def warm_up(sectors=None, reports=False, progress=None):
+    """
+    Warm the caches for the typical companies of `sectors` and return a
+    summary with per-step timings. `progress(message)` is called as steps finish.
+    """
+    from .cover import prepare_cover_variants
+    from .fonts import preload_fonts
+    from .pdf_generator import warm_page_fragments
+    from .pdf_template import render_sector_pdf
+
+    progress = progress or (lambda message: None)
+    timings = {}
+    start = time.perf_counter()
+
+    step = time.perf_counter()
+    preload_fonts()
+    prepare_cover_variants()
+    timings['assets'] = time.perf_counter() - step
+
+    targets = warmup_targets(sectors)
+    tickers = sorted({ticker for _, sector_tickers in targets for ticker in sector_tickers})
+
+    step = time.perf_counter()
+    ticker_data.prefetch(tickers)
+    timings['ticker_data'] = time.perf_counter() - step
+    progress(f"Fetched data for {len(tickers)} tickers in {timings['ticker_data'] * 1000:.0f} ms")
+
+    step = time.perf_counter()
+    for sector, _ in targets:
+        warm_page_fragments(sector=sector)
+    for ticker in tickers:
+        warm_page_fragments(ticker=ticker)
+    timings['pages'] = time.perf_counter() - step
+    progress(f"Recorded {len(targets)} sector and {len(tickers)} ticker pages in {timings['pages'] * 1000:.0f} ms")
+
+    # One full report through the canvas, page replay and save() in this
+    # process (or its template, with PDF_TEMPLATE_RENDERING)
+    step = time.perf_counter()
+    sample_sector, sample_tickers = targets[0] if targets else ('', [])
+    render_sector_pdf(WARMUP_TITLE, WARMUP_EMAIL, sample_sector, sample_tickers[0] if sample_tickers else '')
+    timings['render'] = time.perf_counter() - step
+    progress(f"Rendered a sample report in {timings['render'] * 1000:.0f} ms")
+
+    rendered = 0
+    if reports:
+        step = time.perf_counter()
+        rendered = render_default_reports(targets, progress)
+        timings['reports'] = time.perf_counter() - step
+
+    timings['total'] = time.perf_counter() - start
+    return {
+        'sectors': len(targets),
+        'tickers': len(tickers),
+        'reports': rendered,
+        'seconds': timings,
+    }
+
+
+def render_default_reports(targets, progress):
+    """Render every (sector, typical company) report of `targets` into the report cache"""
+    from .report_cache import render_report
+    from .views import report_params
+
+    pairs = [(sector, ticker) for sector, sector_tickers in targets for ticker in sector_tickers]
+    for index, (sector, ticker) in enumerate(pairs, 1):
+        *params, profile = report_params({'sector': sector, 'ticker': ticker})
+        render_report(*params, block=True, profile=profile)
+        if index % 10 == 0 or index == len(pairs):
+            progress(f"Rendered {index}/{len(pairs)} reports")
+    return len(pairs)
+
+
+def warm_shared_caches(sectors=None, reports=False, progress=None):
+    """
+    Fill the on-disk caches the web workers share: parsed fonts, themed covers
+    in every variant and, with `reports`, the default reports of `sectors` in
+    the disk report cache. Returns a summary with per-step timings like warm_up().
+    """
+    from .cover import COVER_VARIANTS, prepare_cover_variants, sector_colors, themed_covers, themed_covers_enabled
+    from .disk_cache import disk_cache
+    from .fonts import preload_fonts
+
+    if reports and not disk_cache.enabled:
+        raise ValueError("Reports can only be warmed into the disk cache; set PDF_DISK_CACHE_DIR")
+
+    progress = progress or (lambda message: None)
+    timings = {}
+    start = time.perf_counter()
+    targets = warmup_targets(sectors)
+
+    step = time.perf_counter()
+    preload_fonts()
+    timings['fonts'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    prepare_cover_variants()
+    if themed_covers_enabled():
+        for variant in COVER_VARIANTS:
+            themed_covers.prepare(sector_colors(), variant)
+    timings['covers'] = time.perf_counter() - step
+    progress(f"Prepared fonts and covers in {(timings['fonts'] + timings['covers']) * 1000:.0f} ms")
+
+    rendered = 0
+    if reports:
+        step = time.perf_counter()
+        rendered = render_default_reports(targets, progress)
+        timings['reports'] = time.perf_counter() - step
+
+    timings['total'] = time.perf_counter() - start
+    return {
+        'sectors': len(targets),
+        'reports': rendered,
+        'seconds': timings,
+    }
+
+
+class WarmupScheduler:
+    """Runs warm_up() in a background thread at startup and then periodically"""
+
+    def __init__(self, interval, reports=False):
+        self.interval = interval
+        self.reports = reports
+        self.runs = 0
+        self.errors = 0
+        self.last_result = None
+        self.last_error = None
+        self.last_finished = None
+        self.started = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        # Held while warm_up() runs, and by fork() so it never copies a run in progress
+        self._running = threading.Lock()
+
+    def start(self, delay=0):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self.started = True
+            self._thread = threading.Thread(target=self._run, args=(delay,), name='pdf-warmup', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_ready(self):
+        """True once the first warm-up has finished, or if warm-up is not running at all"""
+        return not self.started or self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Block until is_ready() or `timeout` seconds pass; return is_ready()"""
+        if self.started:
+            self._ready.wait(timeout)
+        return self.is_ready()
+
+    def before_fork(self):
+        self._running.acquire()
+
+    def after_fork_in_parent(self):
+        self._running.release()
+
+    def restart_after_fork(self):
+        # Threads do not survive fork(); workers forked from a preloaded
+        # master start their own schedule, skipping a run the master just did
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+        ready = self._ready.is_set()
+        self._ready = threading.Event()
+        if ready:
+            self._ready.set()
+        if self._thread is not None:
+            self._thread = None
+            delay = 0
+            if self.last_finished is not None and self.interval:
+                delay = max(0, self.interval - (time.time() - self.last_finished))
+            self.start(delay)
+
+    def stats(self):
+        return {
+            'ready': self.is_ready(),
+            'runs': self.runs,
+            'errors': self.errors,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_seconds': self.interval,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'last_finished': self.last_finished,
+        }
+
+    def _run(self, delay=0):
+        if delay and self._stop.wait(delay):
+            return
+        while True:
+            with self._running:
+                try:
+                    self.last_result = warm_up(reports=self.reports)
+                    self.last_error = None
+                except Exception as e:
+                    # A failed warm-up only costs us slower first requests
+                    self.errors += 1
+                    self.last_error = str(e)
+                self.runs += 1
+                self.last_finished = time.time()
+            # A failed warm-up still counts: the worker is as warm as it will get
+            self._ready.set()
+            if not self.interval or self._stop.wait(self.interval):
+                return
+
+
+warmup_scheduler = WarmupScheduler(
+    interval=getattr(settings, 'PDF_WARMUP_INTERVAL_SECONDS', 6 * 3600),
+    reports=getattr(settings, 'PDF_WARMUP_REPORTS', False),
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(
+        before=warmup_scheduler.before_fork,
+        after_in_parent=warmup_scheduler.after_fork_in_parent,
+        after_in_child=warmup_scheduler.restart_after_fork,
+    )
+
+
+def warmup_stats():
+    return warmup_scheduler.stats()
+
+
+def readiness():
+    """
+    Return (ready, details) for a readiness probe: the worker is ready once
+    warmed up and while its render queue has room. Details include how full
+    the caches are and how many renders are queued.
+    """
+    from .fonts import font_stats
+    from .fragments import fragment_stats
+    from .render_backend import get_render_backend
+    from .report_cache import report_cache
+
+    warmed = warmup_scheduler.is_ready()
+    backend = get_render_backend().stats()
+    capacity = None if backend['mode'] == 'inline' else backend['workers'] + backend['max_queue']
+    busy = capacity is not None and backend['in_flight'] >= capacity
+
+    reports = report_cache.stats()
+    fragments = fragment_stats()
+    details = {
+        'status': 'warming_up' if not warmed else 'busy' if busy else 'ready',
+        'warmup': {
+            'ready': warmed,
+            'runs': warmup_scheduler.runs,
+            'last_finished': warmup_scheduler.last_finished,
+            'last_error': warmup_scheduler.last_error,
+        },
+        'caches': {
+            'report_cache': {
+                'entries': reports['entries'],
+                'bytes': reports['bytes'],
+                'fill': reports['bytes'] / reports['max_bytes'] if reports['max_bytes'] else 0.0,
+            },
+            'fragments': {
+                'entries': fragments['fragments'],
+                'fill': fragments['fragments'] / fragments['max_fragments'] if fragments['max_fragments'] else 0.0,
+            },
+            'ticker_data': {'entries': ticker_data.stats()['entries']},
+            'fonts': {'registered': len(font_stats()['registered'])},
+        },
+        'queue': {
+            'mode': backend['mode'],
+            'in_flight': backend['in_flight'],
+            'capacity': capacity,
+        },
+    }
+    return warmed and not busy, details
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Concurrency benchmark for the WSGI and ASGI serving paths
+Starts each server configuration on a local port and measures the latency of
+requests for an already cached PDF while the server is busy with
+  - slow clients, which trickle their request headers in over a few seconds
+  - cache misses, concurrent requests that each have to render a new PDF
+
+Needs gunicorn and uvicorn (pip install -r requirements.txt)
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+PASSWORD = "bench-password"
+QUERY = "sector=Technology&ticker=AAPL&title=Benchmark"
+
+GUNICORN = ["gunicorn", "sectors_api.wsgi:application", "--worker-class", "gthread",
+            "--workers", "1", "--threads", "4", "--bind", "127.0.0.1:{port}"]
+UVICORN = ["uvicorn", "sectors_api.asgi:application", "--workers", "1", "--port", "{port}", "--no-access-log"]
+PROCESS_BACKEND = {"PDF_RENDER_BACKEND": "process", "PDF_RENDER_WORKERS": "4"}
+
+# (name, endpoint, command, extra environment)
+SERVERS = [
+    ("WSGI  gunicorn gthread 1x4, inline render", "/api/generate-sector-pdf/", GUNICORN, {}),
+    ("WSGI  gunicorn gthread 1x4, process render", "/api/generate-sector-pdf/", GUNICORN, PROCESS_BACKEND),
+    ("ASGI  uvicorn 1 worker, sync DRF view", "/api/generate-sector-pdf/", UVICORN, {}),
+    ("ASGI  uvicorn 1 worker, async view", "/api/async/generate-sector-pdf/", UVICORN, {}),
+    ("ASGI  uvicorn 1 worker, async view, process", "/api/async/generate-sector-pdf/", UVICORN, PROCESS_BACKEND),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def request_bytes(path, query=QUERY):
+    return (
+        f"GET {path}?{query} HTTP/1.1\r\n"
+        f"Host: 127.0.0.1\r\n"
+        f"Authorization: {PASSWORD}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode()
+
+
+async def fetch(port, path, query=QUERY, trickle_seconds=0.0):
+    """Send one request (optionally a byte at a time) and return (status, seconds)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = request_bytes(path, query)
+    if trickle_seconds:
+        delay = trickle_seconds / len(data)
+        for i in range(len(data)):
+            writer.write(data[i:i + 1])
+            await writer.drain()
+            await asyncio.sleep(delay)
+    else:
+        writer.write(data)
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b" ", 2)[1]) if response else 0
+    return status, time.perf_counter() - start
+
+
+async def run_scenario(port, path, scenario, args):
+    await fetch(port, path)  # warm the report cache and the render pool
+    if scenario == "slow-clients":
+        busy = [asyncio.create_task(fetch(port, path, trickle_seconds=args.slow_seconds))
+                for _ in range(args.slow_clients)]
+        window = args.slow_seconds
+    else:
+        busy = [asyncio.create_task(fetch(port, path, query=f"{QUERY}-miss-{i}"))
+                for i in range(args.misses)]
+        window = 1.0
+    await asyncio.sleep(0.05)
+
+    # Probes are spread over the time the server is busy
+    probe_tasks = []
+    for _ in range(args.probes):
+        probe_tasks.append(asyncio.create_task(fetch(port, path)))
+        await asyncio.sleep(window / args.probes)
+    probe_results = await asyncio.gather(*probe_tasks)
+    busy_results = await asyncio.gather(*busy)
+    latencies = [seconds * 1000 for _, seconds in probe_results]
+    return latencies, [status for status, _ in probe_results + busy_results]
+
+
+def benchmark(name, path, command, extra_env, scenario, args):
+    port = free_port()
+    # Throttle counters are shared through a file, so give every run a fresh one
+    throttle_db = os.path.join(tempfile.mkdtemp(), "throttle.sqlite3")
+    env = dict(os.environ, PASSWORD=PASSWORD, DJANGO_SETTINGS_MODULE="sectors_api.settings",
+               PDF_THROTTLE_DB=throttle_db, **extra_env)
+    command = [part.format(port=port) for part in command]
+    server = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port):
+            print(f"❌ {name}: server did not start ({' '.join(command)})")
+            return
+        latencies, statuses = asyncio.run(run_scenario(port, path, scenario, args))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(os.path.dirname(throttle_db), ignore_errors=True)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    ok = sum(status == 200 for status in statuses)
+    print(f"{name:<48}{statistics.median(latencies):>10.1f}{p95:>10.1f}{latencies[-1]:>10.1f}"
+          f"{ok:>6}/{len(statuses)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    # Defaults keep each run under the 50/minute DRF throttle
+    parser.add_argument("--slow-clients", type=int, default=24)
+    parser.add_argument("--slow-seconds", type=float, default=3.0)
+    parser.add_argument("--misses", type=int, default=16)
+    parser.add_argument("--probes", type=int, default=20)
+    args = parser.parse_args()
+
+    print("🔌 WSGI vs ASGI Serving Benchmark")
+    print(f"Latency of {args.probes} requests for a cached PDF while the server is busy")
+    for scenario, description in (
+        ("slow-clients", f"{args.slow_clients} slow clients trickling headers over {args.slow_seconds}s"),
+        ("misses", f"{args.misses} concurrent cache misses"),
+    ):
+        print(f"\n{description}")
+        print("=" * 86)
+        print(f"{'server':<48}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'ok':>8}")
+        for name, path, command, extra_env in SERVERS:
+            benchmark(name, path, command, extra_env, scenario, args)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for the authentication of the PDF endpoints
+Compares api/authentication.py against the inline check the views used
+before, for a JWT, the shared password and a rejected header, and measures
+the full DRF authentication step of SectorTickerPDFAPIView
+"""
+
+import datetime
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.append(str(BASE_DIR))
+
+PASSWORD = "bench-password"
+os.environ["PASSWORD"] = PASSWORD
+os.environ.setdefault("JWT_SECRET", "bench-jwt-secret-of-at-least-32-bytes")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sectors_api.settings")
+
+import django
+
+django.setup()
+
+import jwt
+from django.conf import settings
+from rest_framework.test import APIRequestFactory
+
+from api.authentication import AuthenticationError, token_verifier
+from api.views import SectorTickerPDFAPIView
+
+
+def legacy_credentials_error(auth_header):
+    """The check SectorTickerPDFAPIView ran inline before authentication.py"""
+    if auth_header.startswith('Bearer '):
+        token = auth_header.replace('Bearer ', '')
+        try:
+            jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            return 'Token has expired'
+        except jwt.InvalidTokenError:
+            if token != os.environ.get('PASSWORD', 'default_password'):
+                return 'Invalid credentials'
+    else:
+        token = auth_header
+        if token != os.environ.get('PASSWORD', 'default_password'):
+            return 'Invalid credentials'
+    return None
+
+
+def verify(auth_header):
+    try:
+        token_verifier.verify(auth_header)
+    except AuthenticationError:
+        pass
+
+
+def verify_uncached(auth_header):
+    token_verifier.clear()
+    verify(auth_header)
+
+
+def sample_headers():
+    token = jwt.encode(
+        {'email': 'bench@supertype.ai',
+         'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.JWT_EXP_DELTA_SECONDS)},
+        settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM,
+    )
+    return [
+        ("JWT", f"Bearer {token}"),
+        ("password", PASSWORD),
+        ("Bearer password", f"Bearer {PASSWORD}"),
+        ("invalid", "Bearer not-a-token"),
+    ]
+
+
+def check_results(headers):
+    """Verify the verifier accepts and rejects exactly what the legacy check did"""
+    for name, header in headers + [("wrong password", "wrong"), ("empty", "")]:
+        legacy = legacy_credentials_error(header)
+        for _ in range(2):  # uncached, then cached
+            try:
+                token_verifier.verify(header)
+                new = None
+            except AuthenticationError as e:
+                new = str(e)
+            if legacy != new:
+                print(f"❌ {name}: legacy check gave {legacy!r}, verifier gave {new!r}")
+                return False
+    print("✅ Verifier matches the legacy check")
+    return True
+
+
+def run_benchmark(headers, number=20000):
+    print(f"\n{'header':<20}{'legacy (µs)':>14}{'uncached (µs)':>16}{'cached (µs)':>14}{'speed-up':>11}")
+    for name, header in headers:
+        legacy = timeit.timeit(lambda: legacy_credentials_error(header), number=number) / number * 1e6
+        uncached = timeit.timeit(lambda: verify_uncached(header), number=number) / number * 1e6
+        verify(header)
+        cached = timeit.timeit(lambda: verify(header), number=number) / number * 1e6
+        print(f"{name:<20}{legacy:>14.2f}{uncached:>16.2f}{cached:>14.2f}{legacy / cached:>10.1f}x")
+
+
+def run_view_benchmark(headers, number=5000):
+    """DRF authentication of SectorTickerPDFAPIView, as run before each request"""
+    factory = APIRequestFactory()
+    view = SectorTickerPDFAPIView()
+    print(f"\n{'header':<20}{'DRF authenticate (µs)':>24}")
+    for name, header in headers[:2]:
+        def authenticate():
+            request = view.initialize_request(factory.get('/api/generate-sector-pdf/', HTTP_AUTHORIZATION=header))
+            request.user
+        seconds = timeit.timeit(authenticate, number=number) / number
+        print(f"{name:<20}{seconds * 1e6:>24.2f}")
+
+
+if __name__ == "__main__":
+    print("🔐 PDF API Authentication Benchmark")
+    print("=" * 75)
+    headers = sample_headers()
+    if not check_results(headers):
+        sys.exit(1)
+    run_benchmark(headers)
+    run_view_benchmark(headers)
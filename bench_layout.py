@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for the justified text layout engine
+Compares api/text_layout.py against the original word-by-word wrapping loop
+on the sector, ticker and methodology page texts, and checks that both
+produce exactly the same font size and line breaks
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.append(str(BASE_DIR))
+
+from reportlab.pdfbase import pdfmetrics
+
+from api.fonts import preload_fonts
+from api.pdf_generator import METHODOLOGY_CONTENT, build_sector_content, build_ticker_content
+from api.sectors import sector_config
+from api.text_layout import fit_justified_text
+
+FONT_NAME = "Inter"
+MAX_WIDTH, MAX_HEIGHT = 464, 500
+
+
+def legacy_fit_justified_text(text, font_name, max_width, max_height, initial_font_size=14, min_font_size=8, line_spacing=2):
+    """The fitting loop draw_justified_text used before text_layout.py"""
+    font_size = initial_font_size
+    while font_size >= min_font_size:
+        words = text.split()
+        line = ""
+        lines = []
+        for word in words:
+            test_line = f"{line} {word}".strip()
+            if pdfmetrics.stringWidth(test_line, font_name, font_size) <= max_width:
+                line = test_line
+            else:
+                lines.append(line)
+                line = word
+        if line:
+            lines.append(line)
+
+        if (font_size + line_spacing) * len(lines) <= max_height:
+            break
+        font_size -= 1
+    return font_size, lines
+
+
+def sample_texts():
+    """Page texts as laid out by generate_sector_pdf, with their font sizes"""
+    texts = []
+    for sector, sector_info in sector_config.sectors().items():
+        texts.append((f"sector:{sector}", build_sector_content(sector, sector_info), 12))
+    texts.append(("ticker:AAPL", build_ticker_content("AAPL"), 12))
+    texts.append(("methodology", METHODOLOGY_CONTENT, 11))
+    return texts
+
+
+def check_line_breaks(texts):
+    """Verify the new engine matches the legacy loop, including shrink-to-fit cases"""
+    for name, text, size in texts:
+        for max_width, max_height in ((MAX_WIDTH, MAX_HEIGHT), (300, 400), (180, 300), (40, 200)):
+            legacy_size, legacy_lines = legacy_fit_justified_text(
+                text, FONT_NAME, max_width, max_height, initial_font_size=size, min_font_size=8, line_spacing=3)
+            new_size, new_lines = fit_justified_text(
+                text, FONT_NAME, max_width, max_height, initial_font_size=size, min_font_size=8, line_spacing=3)
+            new_lines = [" ".join(words) for words, _ in new_lines]
+            if legacy_lines != new_lines or max(legacy_size, 8) != new_size:
+                print(f"❌ Line breaks differ for {name} in a {max_width}x{max_height} box")
+                return False
+    print("✅ Line breaks match the legacy layout")
+    return True
+
+
+def run_benchmark(texts, max_width, max_height, number=200):
+    print(f"\n{max_width}x{max_height} box")
+    print(f"{'text':<32}{'legacy (ms)':>14}{'new (ms)':>12}{'speed-up':>11}")
+    for name, text, size in texts:
+        legacy = timeit.timeit(lambda: legacy_fit_justified_text(
+            text, FONT_NAME, max_width, max_height, initial_font_size=size, min_font_size=8, line_spacing=3),
+            number=number) / number * 1000
+        new = timeit.timeit(lambda: fit_justified_text(
+            text, FONT_NAME, max_width, max_height, initial_font_size=size, min_font_size=8, line_spacing=3),
+            number=number) / number * 1000
+        print(f"{name:<32}{legacy:>14.3f}{new:>12.3f}{legacy / new:>10.1f}x")
+
+
+if __name__ == "__main__":
+    print("📐 Justified Text Layout Benchmark")
+    print("=" * 69)
+    preload_fonts()
+    texts = sample_texts()
+    if not check_line_breaks(texts):
+        sys.exit(1)
+    # The page box, where text fits at the initial size, and a smaller box
+    # that forces the engine to shrink the font
+    run_benchmark(texts, MAX_WIDTH, MAX_HEIGHT)
+    run_benchmark(texts, 300, 400)
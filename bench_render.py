@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+Rendering benchmark with regression gates
+Times generate_sector_pdf and each of its stages as timed by api/timing.py
+(fonts, cover, text fitting, sector page, ticker data and page, methodology,
+save) over a matrix of sectors from sectors_config.json, with and without a
+ticker and with a long title, and records latency percentiles, peak
+allocations and output size, plus the bytes per report in each output
+profile (lean, standard, print).
+
+  python bench_render.py --save bench_baseline.json   record a baseline
+  python bench_render.py --baseline bench_baseline.json   compare against it
+
+Compared with a baseline, the script exits with status 1 if any case got
+slower, allocates more or produces a larger PDF (in any profile) than the
+thresholds allow.
+Baselines are machine specific: record and compare them on the same host.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.append(str(BASE_DIR))
+
+# Sample company data, so the ticker page is rendered the same on every run
+os.environ.setdefault("TICKER_DATA_BACKEND", "fake")
+# The rendering modules read their PDF_* settings from sectors_api.settings
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sectors_api.settings")
+os.environ["PDF_TIMING_ENABLED"] = "True"
+
+from reportlab import Version as REPORTLAB_VERSION
+from reportlab.pdfgen import canvas
+
+from api.cover import CoverImage, ThemedCovers, sector_colors
+from api.fonts import DEFAULT_FONTS, FontRegistry
+from api.pdf_generator import (
+    draw_content_page, generate_methodology_page, generate_sector_page, generate_sector_pdf, generate_ticker_page,
+)
+from api.profiles import OUTPUT_PROFILES
+from api.sectors import sector_config
+from api.ticker_data import get_ticker_data
+from api.timing import collect_timings
+
+WIDTH, HEIGHT = 595, 842
+EMAIL = "benchmark@supertype.ai"
+TITLE = "Sector Ticker Analysis Report"
+LONG_TITLE = ("A Very Long Report Title That Keeps Going To Exercise The Shrinking Cover Text "
+              "And Its Font Size Search Across Several Quarters Of Detailed Sector Coverage ") * 2
+TICKER = "AAPL"
+# Stages timed inside generate_sector_pdf; text_fit overlaps the cover and pages
+STAGES = ("fonts", "cover", "text_fit", "sector_page", "ticker_data", "ticker_page", "methodology", "save")
+BASELINE_FORMAT = 2
+# Runs with fewer iterations per case are not latency gated: their medians are mostly noise
+MIN_GATE_ITERATIONS = 10
+# Latency increases within this many median absolute deviations are treated as noise
+NOISE_MADS = 3
+
+
+def render_timed(title_text, email_text, sector, ticker, samples):
+    """generate_sector_pdf, appending the seconds of each stage timed by api/timing.py to `samples`"""
+    with collect_timings() as timings:
+        output = generate_sector_pdf(title_text, email_text, sector, ticker)
+    for stage, seconds in timings.snapshot().items():
+        samples.setdefault(stage, []).append(seconds)
+    return output
+
+
+def layout_seconds(sector, ticker):
+    """Page layout without the fragment cache, i.e. the first report in a worker"""
+    pdf = canvas.Canvas(BytesIO(), pagesize=(WIDTH, HEIGHT))
+    seconds = {}
+    start = time.perf_counter()
+    if sector:
+        draw_content_page(pdf, WIDTH, HEIGHT, generate_sector_page, sector, sector_config.get(sector))
+        seconds["sector_layout"] = time.perf_counter() - start
+    if ticker:
+        start = time.perf_counter()
+        draw_content_page(pdf, WIDTH, HEIGHT, generate_ticker_page, ticker, get_ticker_data(ticker))
+        seconds["ticker_layout"] = time.perf_counter() - start
+    start = time.perf_counter()
+    draw_content_page(pdf, WIDTH, HEIGHT, generate_methodology_page)
+    seconds["methodology_layout"] = time.perf_counter() - start
+    return seconds
+
+
+def startup_seconds():
+    """
+    One-off costs of a fresh worker: font parsing and sector cover theming
+    (each with and without their disk caches) and cover encoding
+    """
+    cache_dir = tempfile.mkdtemp()
+    try:
+        results = {}
+        for name in ("fonts_parse", "fonts_disk_cache"):
+            # Loads the faces without registering them over the process-wide ones
+            registry = FontRegistry(cache_dir=cache_dir)
+            start = time.perf_counter()
+            for font_name in DEFAULT_FONTS:
+                registry._load(font_name)
+            results[name] = time.perf_counter() - start
+        start = time.perf_counter()
+        cover = CoverImage()
+        cover.prepare()
+        results["cover_prepare"] = time.perf_counter() - start
+        for name in ("cover_themes", "cover_themes_disk_cache"):
+            start = time.perf_counter()
+            ThemedCovers(cover, cache_dir=cache_dir).prepare(sector_colors())
+            results[name] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return {name: round(seconds * 1000, 3) for name, seconds in results.items()}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+    median = pick(0.50)
+    return {
+        "p50_ms": round(median * 1000, 3),
+        # Median absolute deviation: the spread of the samples around p50
+        "mad_ms": round(statistics.median(abs(sample - median) for sample in samples) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def benchmark_cases(sectors):
+    """(name, title, sector, ticker) for every combination in the matrix"""
+    cases = []
+    for sector in sectors:
+        for ticker in ("", TICKER):
+            for title_name, title in (("title", TITLE), ("long-title", LONG_TITLE)):
+                name = f"{sector}|{ticker or '-'}|{title_name}"
+                cases.append((name, title, sector, ticker))
+    return cases
+
+
+def run_case(title, sector, ticker, iterations):
+    # Warm the caches a running worker would already have
+    generate_sector_pdf(title, EMAIL, sector, ticker)
+
+    totals = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        generate_sector_pdf(title, EMAIL, sector, ticker)
+        totals.append(time.perf_counter() - start)
+
+    stage_samples = {}
+    for _ in range(iterations):
+        render_timed(title, EMAIL, sector, ticker, stage_samples)
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        output = generate_sector_pdf(title, EMAIL, sector, ticker)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "total": percentiles(totals),
+        "stages": {stage: percentiles(stage_samples[stage]) for stage in STAGES if stage in stage_samples},
+        "layout_ms": {k: round(v * 1000, 3) for k, v in layout_seconds(sector, ticker).items()},
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "output_bytes": len(output.getvalue()),
+        "profile_bytes": {
+            profile: len(generate_sector_pdf(title, EMAIL, sector, ticker, profile=profile).getvalue())
+            for profile in OUTPUT_PROFILES
+        },
+    }
+
+
+def run_benchmark(cases, iterations):
+    results = {}
+    print(f"{'case':<48}{'p50 ms':>9}{'p95 ms':>9}{'peak KB':>10}{'bytes':>9}")
+    for name, title, sector, ticker in cases:
+        result = run_case(title, sector, ticker, iterations)
+        results[name] = result
+        print(f"{name:<48}{result['total']['p50_ms']:>9.2f}{result['total']['p95_ms']:>9.2f}"
+              f"{result['peak_alloc_kb']:>10.0f}{result['output_bytes']:>9}")
+    return results
+
+
+def print_stage_summary(results):
+    print(f"\n{'stage':<16}{'median p50 ms':>15}")
+    for stage in STAGES:
+        values = sorted(r["stages"][stage]["p50_ms"] for r in results.values() if stage in r["stages"])
+        if values:
+            print(f"{stage:<16}{values[len(values) // 2]:>15.3f}")
+
+
+def print_profile_summary(results):
+    print(f"\n{'profile':<16}{'mean bytes':>12}{'vs standard':>13}")
+    means = {
+        profile: statistics.fmean(r["profile_bytes"][profile] for r in results.values())
+        for profile in OUTPUT_PROFILES
+    }
+    for profile, mean in means.items():
+        print(f"{profile:<16}{mean:>12.0f}{(mean / means['standard'] - 1) * 100:>12.0f}%")
+
+
+def compare(baseline, current, args):
+    """Return a list of regressions of `current` against `baseline`"""
+    regressions = []
+    common = [name for name in current["cases"] if name in baseline["cases"]]
+
+    # Latency is gated on medians combined over all cases (geometric mean of
+    # the per-case ratios), since single cases are too noisy on shared hosts.
+    # The median increase must also exceed the samples' own spread: NOISE_MADS
+    # median absolute deviations of the baseline and current runs combined
+    iterations = min(baseline["iterations"], current["iterations"])
+    if iterations < MIN_GATE_ITERATIONS:
+        print(f"⚠️  Latency not gated: needs at least {MIN_GATE_ITERATIONS} iterations per case, got {iterations}")
+        series = {}
+    else:
+        series = {"total": lambda case: case["total"]}
+        for stage in STAGES:
+            series[stage] = lambda case, stage=stage: case["stages"].get(stage)
+    for label, value in series.items():
+        pairs = [(value(baseline["cases"][name]), value(current["cases"][name])) for name in common]
+        pairs = [(old, new) for old, new in pairs if old and new and old["p50_ms"] and new["p50_ms"]]
+        if not pairs:
+            continue
+        ratio = math.exp(statistics.fmean(math.log(new["p50_ms"] / old["p50_ms"]) for old, new in pairs))
+        added_ms = statistics.median(new["p50_ms"] - old["p50_ms"] for old, new in pairs)
+        noise_ms = NOISE_MADS * statistics.median(math.hypot(old["mad_ms"], new["mad_ms"]) for old, new in pairs)
+        if ratio > 1 + args.latency_threshold and added_ms > max(args.latency_floor_ms, noise_ms):
+            regressions.append(f"{label} p50: +{(ratio - 1) * 100:.0f}% over {len(pairs)} cases "
+                               f"(median +{added_ms:.2f} ms, noise {noise_ms:.2f} ms)")
+
+    # Allocations and output size are deterministic enough to gate per case
+    for name in common:
+        old, new = baseline["cases"][name], current["cases"][name]
+        for metric, threshold in (("peak_alloc_kb", args.memory_threshold), ("output_bytes", args.size_threshold)):
+            if new[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {old[metric]} -> {new[metric]} "
+                                   f"(+{(new[metric] / old[metric] - 1) * 100:.0f}%)")
+        for profile, old_bytes in old.get("profile_bytes", {}).items():
+            new_bytes = new["profile_bytes"].get(profile)
+            if new_bytes is not None and new_bytes > old_bytes * (1 + args.size_threshold):
+                regressions.append(f"{name} {profile} bytes: {old_bytes} -> {new_bytes} "
+                                   f"(+{(new_bytes / old_bytes - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sectors", nargs="*", help="sector names (default: all in sectors_config.json)")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a JSON baseline")
+    parser.add_argument("--latency-threshold", type=float, default=0.25,
+                        help="allowed relative latency increase (default 0.25)")
+    parser.add_argument("--latency-floor-ms", type=float, default=1.0,
+                        help="ignore median latency increases smaller than this (default 1 ms)")
+    parser.add_argument("--memory-threshold", type=float, default=0.10,
+                        help="allowed relative peak allocation increase (default 0.10)")
+    parser.add_argument("--size-threshold", type=float, default=0.02,
+                        help="allowed relative output size increase (default 0.02)")
+    args = parser.parse_args()
+
+    sectors = [sector_config.resolve(name) or name for name in args.sectors] if args.sectors else list(sector_config.sectors())
+    unknown = [name for name in sectors if name not in sector_config.sectors()]
+    if unknown:
+        print(f"❌ Unknown sectors: {', '.join(unknown)}")
+        sys.exit(2)
+
+    print("⏱️  PDF Rendering Benchmark")
+    print("=" * 85)
+    cases = benchmark_cases(sectors)
+
+    current = {
+        "format": BASELINE_FORMAT,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "reportlab": REPORTLAB_VERSION,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "iterations": args.iterations,
+        "startup_ms": startup_seconds(),
+        "cases": run_benchmark(cases, args.iterations),
+    }
+    print_stage_summary(current["cases"])
+    print_profile_summary(current["cases"])
+    print("\nStartup: " + ", ".join(f"{k} {v:.1f} ms" for k, v in current["startup_ms"].items()))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print(f"💾 Baseline written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("format") != BASELINE_FORMAT:
+            print(f"❌ {args.baseline} was written by an incompatible version of this script")
+            sys.exit(2)
+        if baseline.get("environment") != current["environment"]:
+            print("⚠️  Baseline was recorded in a different environment; latency comparisons may not be meaningful")
+        regressions = compare(baseline, current, args)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.baseline}")
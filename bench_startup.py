@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Worker start-up audit
+Runs a fresh interpreter under ``-X importtime`` to list the modules that
+take longest to import when the WSGI application and URLconf load, and checks
+that heavy dependencies only needed by optional backends stay unloaded. Then
+times the first PDF in a cold process against the first PDF in a worker
+forked from a preloaded master, as with ``gunicorn --preload``.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Only imported by TICKER_DATA_BACKEND=supabase
+HEAVY_MODULES = ("supabase", "postgrest", "gotrue", "realtime", "storage3", "httpx", "websockets")
+
+LOAD_APP = """
+import os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sectors_api.settings")
+os.environ["PDF_WARMUP_ON_STARTUP"] = "False"
+start = time.perf_counter()
+from sectors_api.wsgi import application
+import sectors_api.urls
+print(f"app_ms={{(time.perf_counter() - start) * 1000:.1f}}")
+print("heavy=" + ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+FIRST_PDF = """
+import os, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sectors_api.settings")
+os.environ["PDF_WARMUP_ON_STARTUP"] = "False"
+start = time.perf_counter()
+from sectors_api.wsgi import application
+import sectors_api.urls
+from api.pdf_generator import generate_sector_pdf
+loaded = time.perf_counter()
+
+
+def first_pdf():
+    start = time.perf_counter()
+    generate_sector_pdf("Sector Ticker Analysis Report", "benchmark@supertype.ai", "technology", "")
+    return (time.perf_counter() - start) * 1000
+
+
+if {preload}:
+    read_fd, write_fd = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        started = (time.perf_counter() - forked) * 1000
+        os.write(write_fd, f"{{started:.1f}} {{first_pdf():.1f}}".encode())
+        os._exit(0)
+    os.waitpid(pid, 0)
+    start_ms, first_ms = os.read(read_fd, 64).decode().split()
+else:
+    start_ms, first_ms = f"{{(loaded - start) * 1000:.1f}}", f"{{first_pdf():.1f}}"
+print(f"start_ms={{start_ms}}")
+print(f"first_pdf_ms={{first_ms}}")
+"""
+
+
+def run_python(code, *flags):
+    result = subprocess.run(
+        [sys.executable, *flags, "-c", code], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    values = dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+    return values, result.stderr
+
+
+def parse_importtime(stderr):
+    """{module: (self µs, cumulative µs)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_import_audit(top=15):
+    values, stderr = run_python(LOAD_APP.format(heavy=HEAVY_MODULES), "-X", "importtime")
+    modules = parse_importtime(stderr)
+    # Top-level packages only; their cumulative time includes their submodules
+    packages = {name: times for name, times in modules.items() if "." not in name}
+    print(f"{'package':<32}{'cumulative ms':>15}")
+    for name, (_, cumulative) in sorted(packages.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"{name:<32}{cumulative / 1000:>15.1f}")
+    print(f"\n{len(modules)} modules imported; application and URLconf loaded in {values['app_ms']} ms "
+          f"(including -X importtime overhead)")
+    heavy = [name for name in values["heavy"].split(",") if name]
+    if heavy:
+        print(f"⚠️  Optional backend modules loaded at start-up: {', '.join(heavy)}")
+    else:
+        print("✅ No optional backend modules loaded at start-up")
+
+
+def run_first_pdf(runs=3):
+    """Time until a new worker can serve, and its first PDF"""
+    print(f"\n{'worker':<32}{'start ms':>10}{'first PDF ms':>15}")
+    for name, preload in (("cold process", False), ("forked from preloaded master", True)):
+        samples = [run_python(FIRST_PDF.format(preload=preload))[0] for _ in range(runs)]
+        start = sorted(float(s["start_ms"]) for s in samples)[runs // 2]
+        first = sorted(float(s["first_pdf_ms"]) for s in samples)[runs // 2]
+        print(f"{name:<32}{start:>10.1f}{first:>15.1f}")
+
+
+if __name__ == "__main__":
+    print("🚀 Worker Start-up Audit")
+    print("=" * 57)
+    run_import_audit()
+    run_first_pdf()
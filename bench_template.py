@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Benchmark for template rendering (api/pdf_template.py)
+Compares a full generate_sector_pdf render with stamping the title and email
+onto a cached template for every sector in sectors_config.json, and checks
+that each stamped report is its template followed by a well-formed
+incremental update drawing the same cover text as a full render
+"""
+
+import os
+import re
+import sys
+import timeit
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sectors_api.settings")
+os.environ["PDF_WARMUP_ON_STARTUP"] = "False"
+
+import django
+
+django.setup()
+
+from api.pdf_generator import generate_sector_pdf
+from api.pdf_template import ReportTemplate, template_cache
+from api.profiles import get_profile
+from api.sectors import sector_config
+
+TITLE = "Sector Ticker Analysis Report"
+EMAIL = "benchmark@supertype.ai"
+
+
+def cases():
+    for name, info in sector_config.sectors().items():
+        yield name, ""
+        if info.typical_companies:
+            yield name, info.typical_companies[0]
+
+
+def cover_stream(data):
+    """Decoded content of the cover page of a ReportLab PDF"""
+    template = ReportTemplate(data, (), 6)
+    page = template._object(template.page_number)
+    number = int(re.search(rb'/Contents (\d+) 0 R', page).group(1))
+    obj = template._object(number)
+    start = obj.index(b'stream\n') + len(b'stream\n')
+    return zlib.decompress(obj[start:])
+
+
+def check_stamp(sector, ticker, profile):
+    """Verify the stamped report's structure and cover text against a full render"""
+    template = template_cache.get(sector, ticker, profile)
+    output = BytesIO()
+    if not template.stamp(TITLE, EMAIL, output):
+        print(f"❌ {sector} {ticker}: could not stamp an ASCII title")
+        return False
+    data = output.getvalue()
+    update = data[len(template.data):]
+    if not data.startswith(template.data) or not update.endswith(b'%%EOF\n'):
+        print(f"❌ {sector} {ticker}: stamped report does not extend its template")
+        return False
+
+    xref = int(re.findall(rb'startxref\n(\d+)', data)[-1])
+    for number, offset in re.findall(rb'\n(\d+) 1\n(\d{10}) 00000 n', data[xref:]):
+        if not data[int(offset):].startswith(number + b' 0 obj'):
+            print(f"❌ {sector} {ticker}: xref entry for object {number.decode()} is wrong")
+            return False
+    if b'/Prev %d\n' % template.startxref not in update:
+        print(f"❌ {sector} {ticker}: update is not chained to the template's xref")
+        return False
+
+    stamped = zlib.decompress(update[update.index(b'stream\n') + 7:update.index(b'\nendstream')])
+    full = cover_stream(generate_sector_pdf(TITLE, EMAIL, sector, ticker, profile=profile.name).getvalue())
+    missing = [line for line in stamped.splitlines() if line and line not in full.splitlines()]
+    if missing:
+        print(f"❌ {sector} {ticker}: stamped cover text differs from a full render: {missing}")
+        return False
+    return True
+
+
+def run_benchmark(profile, number=20):
+    print(f"\n{'case':<36}{'full ms':>9}{'build ms':>10}{'stamp ms':>10}{'template KB':>13}{'+ bytes':>9}")
+    totals = [0.0, 0.0]
+    for sector, ticker in cases():
+        template_cache.clear()
+        build = timeit.timeit(lambda: template_cache.get(sector, ticker, profile), number=1)
+        template = template_cache.get(sector, ticker, profile)
+        full = timeit.timeit(
+            lambda: generate_sector_pdf(TITLE, EMAIL, sector, ticker, profile=profile.name), number=number
+        ) / number
+        stamp = timeit.timeit(lambda: template.stamp(TITLE, EMAIL, BytesIO()), number=number * 10) / (number * 10)
+        output = BytesIO()
+        template.stamp(TITLE, EMAIL, output)
+        added = len(output.getvalue()) - template.nbytes
+        totals[0] += full
+        totals[1] += stamp
+        name = f"{sector} {ticker}".strip()
+        print(f"{name:<36}{full * 1000:>9.1f}{build * 1000:>10.1f}{stamp * 1000:>10.2f}"
+              f"{template.nbytes / 1024:>13.1f}{added:>9}")
+    print(f"\nStamping is {totals[0] / totals[1]:.0f}x faster than a full render on average")
+
+
+if __name__ == "__main__":
+    print("🧩 Template Rendering Benchmark")
+    print("=" * 87)
+    profile = get_profile(sys.argv[1] if len(sys.argv) > 1 else None)
+    if not all(check_stamp(sector, ticker, profile) for sector, ticker in cases()):
+        sys.exit(1)
+    print(f"✅ Stamped reports extend their templates and draw the same cover text ({profile.name} profile)")
+    run_benchmark(profile)
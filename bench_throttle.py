@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark for the shared rate limiter
+Measures the per-request cost of DRF's cache-based throttle and of
+api/throttling.py, then has several processes hit the same client's limit at
+once to count how many requests each lets through
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.append(str(BASE_DIR))
+
+# Spawned workers inherit the parent's file through the environment
+os.environ.setdefault("PDF_THROTTLE_DB", os.path.join(tempfile.mkdtemp(), "bench_throttle.sqlite3"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sectors_api.settings")
+
+import django
+
+django.setup()
+
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import AnonRateThrottle
+from rest_framework.request import Request
+
+from api.throttling import SharedAnonRateThrottle, throttle_store
+
+RATE = "50/minute"
+
+
+class LocalThrottle(AnonRateThrottle):
+    rate = RATE
+
+
+class SharedThrottle(SharedAnonRateThrottle):
+    rate = RATE
+
+
+class UnlimitedLocalThrottle(AnonRateThrottle):
+    rate = "1000000/minute"
+
+
+class UnlimitedSharedThrottle(SharedAnonRateThrottle):
+    rate = "1000000/minute"
+
+
+def make_request(address):
+    return Request(APIRequestFactory().get("/api/generate-sector-pdf/", REMOTE_ADDR=address))
+
+
+def count_allowed(throttle_class, requests):
+    request = make_request("10.0.0.1")
+    return sum(throttle_class().allow_request(request, None) for _ in range(requests))
+
+
+def run_overhead(number=2000):
+    """Cost of one allowed request, with `history` requests already in the window"""
+    print(f"{'throttle':<28}{'history':>10}{'µs / request':>16}")
+    for name, throttle_class in (("DRF cache (LocMem)", UnlimitedLocalThrottle),
+                                 ("shared SQLite", UnlimitedSharedThrottle)):
+        for history in (0, 1000, 10000):
+            request = make_request(f"10.1.{history % 250}.{history // 250 % 250}")
+            for _ in range(history):
+                throttle_class().allow_request(request, None)
+            seconds = timeit.timeit(lambda: throttle_class().allow_request(request, None), number=number)
+            print(f"{name:<28}{history:>10}{seconds / number * 1e6:>16.1f}")
+
+
+def run_accuracy(processes=4, requests=100):
+    """Total requests let through when `processes` workers share one client"""
+    print(f"\n{processes} processes x {requests} requests from one client, limit {RATE}")
+    print(f"{'throttle':<28}{'allowed':>10}")
+    # A fresh process per task, like separate gunicorn workers
+    with multiprocessing.get_context("spawn").Pool(processes, maxtasksperchild=1) as pool:
+        for name, throttle_class in (("DRF cache (LocMem)", LocalThrottle), ("shared SQLite", SharedThrottle)):
+            throttle_store.clear()
+            allowed = sum(pool.starmap(count_allowed, [(throttle_class, requests)] * processes))
+            print(f"{name:<28}{allowed:>10}")
+
+
+if __name__ == "__main__":
+    print("🚦 Shared Rate Limiter Benchmark")
+    print("=" * 54)
+    run_overhead()
+    run_accuracy()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(throttle_store.path + suffix):
+            os.remove(throttle_store.path + suffix)
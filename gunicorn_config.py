@@ -0,0 +1,47 @@
+"""
+Gunicorn configuration
+  gunicorn sectors_api.wsgi:application -c gunicorn_config.py
+
+The app is loaded once in the master (preload_app): fonts, the sector config,
+cover variants and the warmed page and ticker caches are then shared
+copy-on-write by every worker instead of being built again in each of them.
+Workers only start accepting requests once warmed up, waiting at most
+PDF_WARMUP_WAIT_SECONDS for the first warm-up (see api/warmup.py).
+"""
+
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_class = "sync"
+timeout = 120
+max_requests = 1000
+max_requests_jitter = 100
+preload_app = True
+
+WARMUP_WAIT_SECONDS = float(os.environ.get("PDF_WARMUP_WAIT_SECONDS", 60))
+
+
+def wait_for_warmup():
+    from api.warmup import warmup_scheduler
+
+    return warmup_scheduler.wait_ready(WARMUP_WAIT_SECONDS)
+
+
+def when_ready(server):
+    # Warm up once in the master, so every worker is forked warm
+    if server.cfg.preload_app and not wait_for_warmup():
+        server.log.warning("Warm-up still running after %.0fs, starting workers anyway", WARMUP_WAIT_SECONDS)
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collections in the workers do not touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Without preload_app each worker warms itself before accepting requests
+    if not wait_for_warmup():
+        worker.log.warning("Warm-up still running after %.0fs, accepting requests anyway", WARMUP_WAIT_SECONDS)
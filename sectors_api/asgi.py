@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sectors_api.settings')
 
 application = get_asgi_application()
+
+# Preload assets and start the warm-up only in processes that serve requests
+from api.apps import prepare_server  # noqa: E402
+
+prepare_server()
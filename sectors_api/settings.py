@@ -20,6 +20,112 @@ JWT_SECRET = os.environ.get("JWT_SECRET")  # Replace with a strong secret in pro
 JWT_ALGORITHM = "HS256"
 JWT_EXP_DELTA_SECONDS = 3600  # Token valid for 1 hour
 
+# Decode the cover image and build its low/medium/high/max variants when a server
+# process loads the app (wsgi.py/asgi.py; manage.py commands build them on first use)
+PDF_PREPARE_ASSETS_ON_STARTUP = True
+
+# Output profile (lean, standard or print, see api/profiles.py) of requests
+# that do not name one
+PDF_DEFAULT_PROFILE = os.environ.get('PDF_DEFAULT_PROFILE', 'standard')
+
+# Cover image variant of the standard profile (see api/profiles.py). Reports
+# for a configured sector get a cover tinted with its color_scheme unless
+# PDF_THEMED_COVERS is off; themed JPEGs are kept in PDF_COVER_CACHE_DIR
+# (.cache/covers in the project directory by default).
+PDF_COVER_VARIANT = os.environ.get('PDF_COVER_VARIANT', 'high')
+PDF_THEMED_COVERS = os.environ.get('PDF_THEMED_COVERS', 'True') == 'True'
+PDF_COVER_CACHE_DIR = os.environ.get('PDF_COVER_CACHE_DIR')
+
+# Fonts for characters Inter has no glyphs for (api/font_fallback.py), in
+# priority order: TrueType file paths (embedded) or built-in CID font names
+PDF_FALLBACK_FONTS = os.environ.get('PDF_FALLBACK_FONTS', 'STSong-Light,HeiseiKakuGo-W5,HYGothic-Medium')
+
+# In-process cache of finished PDFs, keyed by the request parameters
+PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PDF_CACHE_TTL_SECONDS = 300
+
+# PDFs larger than this are spooled to a temporary file in PDF_SPOOL_DIR
+# (system temp dir by default) and streamed from disk instead of being kept
+# in memory or in the cache above. Responses are sent in chunks of
+# PDF_STREAM_CHUNK_BYTES.
+PDF_SPOOL_THRESHOLD_BYTES = 1024 * 1024
+PDF_SPOOL_DIR = os.environ.get('PDF_SPOOL_DIR')
+PDF_STREAM_CHUNK_BYTES = 64 * 1024
+
+# Report cache on disk shared by every worker (and every host mounting the
+# same volume); setting PDF_DISK_CACHE_DIR enables it in place of the
+# in-process cache above. Least recently used reports are evicted once it
+# holds more than PDF_DISK_CACHE_MAX_BYTES.
+# Hits can be sent by the front proxy: PDF_SENDFILE_HEADER = 'X-Accel-Redirect'
+# (nginx, with PDF_SENDFILE_PREFIX an internal location aliased to
+# PDF_DISK_CACHE_DIR) or 'X-Sendfile' (Apache mod_xsendfile, lighttpd).
+PDF_DISK_CACHE_DIR = os.environ.get('PDF_DISK_CACHE_DIR')
+PDF_DISK_CACHE_MAX_BYTES = int(os.environ.get('PDF_DISK_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+PDF_DISK_CACHE_TTL_SECONDS = PDF_CACHE_TTL_SECONDS
+PDF_SENDFILE_HEADER = os.environ.get('PDF_SENDFILE_HEADER')
+PDF_SENDFILE_PREFIX = os.environ.get('PDF_SENDFILE_PREFIX', '/protected-pdfs/')
+
+# Bearer token Prometheus sends to /api/metrics/; the endpoint answers 403
+# while it is unset
+PDF_METRICS_TOKEN = os.environ.get('PDF_METRICS_TOKEN')
+
+# Stamp the title and email onto a cached template of each sector/ticker/
+# profile instead of rendering every report in full (api/pdf_template.py).
+# Templates are kept in memory per process, up to PDF_TEMPLATE_CACHE_MAX_BYTES.
+PDF_TEMPLATE_RENDERING = os.environ.get('PDF_TEMPLATE_RENDERING', 'False') == 'True'
+PDF_TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get('PDF_TEMPLATE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Per-stage timing of PDF requests, sent in a Server-Timing header and
+# published at /api/metrics/
+PDF_TIMING_ENABLED = os.environ.get('PDF_TIMING_ENABLED', 'True') == 'True'
+
+# Batch endpoint: maximum reports per request and concurrent renders
+PDF_BATCH_MAX_ITEMS = 200
+PDF_BATCH_WORKERS = 4
+
+# Where PDFs are rendered: 'inline' (request thread), 'thread' or 'process' pool.
+# Pools accept PDF_RENDER_WORKERS + PDF_RENDER_MAX_QUEUE jobs at once and
+# answer 503 with Retry-After beyond that.
+PDF_RENDER_BACKEND = os.environ.get('PDF_RENDER_BACKEND', 'inline')
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', os.cpu_count() or 1))
+PDF_RENDER_MAX_QUEUE = int(os.environ.get('PDF_RENDER_MAX_QUEUE', 16))
+PDF_RENDER_TIMEOUT_SECONDS = 30
+PDF_RENDER_RETRY_AFTER_SECONDS = 5
+PDF_RENDER_START_METHOD = 'spawn'
+
+# Threads rendering cache misses for the async endpoints under /api/async/
+PDF_ASYNC_RENDER_THREADS = int(os.environ.get('PDF_ASYNC_RENDER_THREADS', 4))
+
+# Warm the ticker data and page caches for every sector's typical_companies
+# in the background at startup, then every PDF_WARMUP_INTERVAL_SECONDS
+# (0 = startup only). PDF_WARMUP_REPORTS also renders the full reports with
+# the default title and email into the report cache.
+PDF_WARMUP_ON_STARTUP = os.environ.get('PDF_WARMUP_ON_STARTUP', 'True') == 'True'
+PDF_WARMUP_INTERVAL_SECONDS = 6 * 3600
+PDF_WARMUP_REPORTS = False
+
+# Background report jobs (api/jobs.py). Finished PDFs are written to
+# PDF_JOB_DIR (default .cache/jobs, mode 0700) and kept for PDF_JOB_TTL_SECONDS.
+# Set PDF_JOB_WORKERS = 0 to run jobs with `python manage.py run_report_jobs`
+# instead of in-process.
+PDF_JOB_DIR = os.environ.get('PDF_JOB_DIR')
+PDF_JOB_WORKERS = int(os.environ.get('PDF_JOB_WORKERS', 1))
+PDF_JOB_TTL_SECONDS = 3600
+PDF_JOB_STALE_SECONDS = 300
+PDF_JOB_MAX_WAIT_SECONDS = 30
+
+# Company data on the ticker page (api/ticker_data.py): 'none', 'fake' or
+# 'supabase'. Lookups are cached for TICKER_DATA_TTL_SECONDS, then served stale
+# for TICKER_DATA_STALE_SECONDS more while a background refresh runs.
+TICKER_DATA_BACKEND = os.environ.get('TICKER_DATA_BACKEND', 'none')
+TICKER_DATA_TTL_SECONDS = float(os.environ.get('TICKER_DATA_TTL_SECONDS', 300))
+TICKER_DATA_STALE_SECONDS = float(os.environ.get('TICKER_DATA_STALE_SECONDS', 3600))
+SUPABASE_URL = os.environ.get('SUPABASE_URL')
+SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+TICKER_DATA_TABLE = os.environ.get('TICKER_DATA_TABLE', 'companies')
+TICKER_DATA_SYMBOL_COLUMN = os.environ.get('TICKER_DATA_SYMBOL_COLUMN', 'symbol')
+TICKER_DATA_TIMEOUT_SECONDS = float(os.environ.get('TICKER_DATA_TIMEOUT_SECONDS', 5))
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -138,8 +244,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'api.throttling.SharedUserRateThrottle',
+        'api.throttling.SharedAnonRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'user': '50/minute',   # Authenticated users: 50 requests per minute
@@ -149,3 +255,9 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ]
 }
+
+# SQLite file holding the throttle counters shared by all worker processes
+# on this host (default .cache/throttle, mode 0700). Must be on local disk.
+# Requests are rejected while it is unusable, unless PDF_THROTTLE_FAIL_OPEN.
+PDF_THROTTLE_DB = os.environ.get('PDF_THROTTLE_DB')
+PDF_THROTTLE_FAIL_OPEN = os.environ.get('PDF_THROTTLE_FAIL_OPEN', 'False') == 'True'
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sectors_api.settings')
 
 application = get_wsgi_application()
+
+# Preload assets and start the warm-up only in processes that serve requests
+from api.apps import prepare_server  # noqa: E402
+
+prepare_server()